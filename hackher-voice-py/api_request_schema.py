@@ -18,7 +18,7 @@ api_request_list = {
         'contentType': 'application/json',
         'accept': 'application/json',
         'body': {
-            'max_tokens': 512,
+            'max_tokens': 4096,
             'temperature': 0.7,
             'messages': [],
             'anthropic_version': 'bedrock-2023-05-31'
@@ -3,12 +3,8 @@ import asyncio
 import json
 import os
 import time
-import pyaudio
 import sys
-import boto3
-import sounddevice
 from concurrent.futures import ThreadPoolExecutor
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent, TranscriptResultStream
 import streamlit as st
@@ -16,6 +12,14 @@ from io import BytesIO
 import nest_asyncio
 import threading
 
+from tts_cache import get_tts_cache
+from bedrock_cache import get_bedrock_cache, make_key
+from aws_clients import get_client_factory
+from mic_capture import MicCapture
+from vad import EnergyVad
+from streaming_reply import StreamingReply, play_in_browser
+from latency import NULL_TRACE, get_latency_metrics
+
 # 初始化 nest_asyncio
 nest_asyncio.apply()
 
@@ -23,64 +27,61 @@ nest_asyncio.apply()
 st.set_page_config(page_title="Voice Chat with AI", layout="wide")
 st.title("Voice Chat with AI Assistant")
 
-# 初始化 AWS clients
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2'
-)
-
-polly = boto3.client(
-    service_name='polly',
-    region_name='us-west-2'
-)
+# 初始化 AWS clients（整個 process 共用，rerun 時不重建；第一次呼叫才建立，連線留在 pool 裡）
+clients = get_client_factory('us-west-2')
+bedrock = clients.lazy('bedrock-runtime')
+polly = clients.lazy('polly')
 
 # 創建自定義的 TranscriptResultStreamHandler
 class MyTranscriptResultStreamHandler(TranscriptResultStreamHandler):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, trace=NULL_TRACE, **kwargs):
         super().__init__(*args, **kwargs)
         self.result = []
+        self.trace = trace
         
     async def handle_transcript_event(self, transcript_event: TranscriptEvent):
         results = transcript_event.transcript.results
         for result in results:
             if not result.is_partial:
+                self.trace.set('final_transcript')
                 self.result.append(result.alternatives[0].transcript)
 
-async def mic_stream():
-    # 設置音頻參數
-    CHUNK = 1024
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 16000
-    
-    # 初始化 PyAudio
-    p = pyaudio.PyAudio()
-    
-    # 打開音頻流
-    stream = p.open(
-        format=FORMAT,
-        channels=CHANNELS,
-        rate=RATE,
-        input=True,
-        frames_per_buffer=CHUNK
-    )
-    
-    # 生成音頻數據
-    while True:
-        data = stream.read(CHUNK)
-        yield data
-
-async def write_chunks(stream):
-    async for chunk in stream:
-        yield {
-            "AudioEvent": {
-                "AudioChunk": chunk
-            }
-        }
+# 錄音在說完話（VAD 偵測到靜音）或超過最長時間時結束
+MAX_RECORD_SECONDS = 30
+END_OF_SPEECH_MS = 800
 
-async def basic_transcribe():
+
+async def write_chunks(stream, capture, max_seconds=MAX_RECORD_SECONDS, trace=NULL_TRACE):
+    """
+    把麥克風 frame 持續送進 Transcribe。錄音由 sounddevice callback 放進 ring buffer，
+    不會阻塞 event loop；說完話或超過 max_seconds 就 end_stream()。
+    """
+    vad = EnergyVad(hangover_ms=END_OF_SPEECH_MS)
+    heard_speech = False
+    started = time.monotonic()
+    frames = capture.frames()
+    try:
+        async for chunk, _ in frames:
+            await stream.input_stream.send_audio_event(audio_chunk=chunk)
+            result = vad.process(chunk)
+            ended = False
+            for event, _ in result.events:
+                if event == 'start':
+                    heard_speech = True
+                elif heard_speech:
+                    ended = True
+                    trace.mark('speech_end')
+            if ended or time.monotonic() - started >= max_seconds:
+                break
+    finally:
+        # 關掉 generator 才會停止 sounddevice 的 input stream
+        await frames.aclose()
+        await stream.input_stream.end_stream()
+
+
+async def basic_transcribe(trace=NULL_TRACE):
     # 初始化轉錄客戶端
-    client = TranscribeStreamingClient(region="us-west-2")
+    client = clients.transcribe_streaming()
     
     # 創建流
     stream = await client.start_stream_transcription(
@@ -90,69 +91,108 @@ async def basic_transcribe():
     )
     
     # 設置處理器
-    handler = MyTranscriptResultStreamHandler(stream.output_stream)
+    handler = MyTranscriptResultStreamHandler(stream.output_stream, trace=trace)
+    capture = MicCapture(sample_rate=16000, frame_ms=100)
     
-    # 開始處理
+    # 開始處理：送完音訊後 Transcribe 會送出最後的結果並結束 output stream
     await asyncio.gather(
-        write_chunks(mic_stream()),
+        write_chunks(stream, capture, trace=trace),
         handler.handle_events()
     )
     
     return handler.result
 
-def get_ai_response(input_text):
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+POLLY_PARAMS = {'OutputFormat': 'mp3', 'VoiceId': 'Zhiyu', 'LanguageCode': 'cmn-CN'}
+
+
+def request_body(input_text):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 4096,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": input_text
+                    }
+                ]
+            }
+        ],
+        "temperature": 0.7,
+        "top_p": 0.9,
+    })
+
+def get_ai_response(input_text, trace=NULL_TRACE):
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": input_text
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.7,
-            "top_p": 0.9,
-        })
-        
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            body=body
-        )
-        
-        response_body = json.loads(response.get('body').read())
+        body = request_body(input_text)
+        trace.mark('bedrock_request')
+
+        def invoke():
+            response = bedrock.invoke_model(
+                modelId=MODEL_ID,
+                body=body
+            )
+            return json.loads(response.get('body').read())
+
+        # 相同的問題共用同一個回應（同時送出的請求也只會呼叫一次 Bedrock）
+        response_body = get_bedrock_cache().get_or_invoke(make_key(MODEL_ID, body), invoke)
+        trace.mark('first_token')
         return response_body['content'][0]['text']
     except Exception as e:
         st.error(f"獲取 AI 回應時發生錯誤: {str(e)}")
         return None
 
-def text_to_speech(text):
+def stream_ai_response(input_text, trace=NULL_TRACE):
+    """邊收 token 邊顯示，每句話完成就先送去 Polly 並開始播放"""
+    text_box = st.empty()
     try:
-        response = polly.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId='Zhiyu',
-            LanguageCode='cmn-CN'
-        )
-        
+        body = request_body(input_text)
+        trace.mark('bedrock_request')
+
+        def open_stream():
+            response = bedrock.invoke_model_with_response_stream(modelId=MODEL_ID, body=body)
+            return response.get('body')
+
+        events = get_bedrock_cache().stream(make_key(MODEL_ID, body), open_stream)
+        reply = StreamingReply(synthesize_speech, on_text=text_box.markdown,
+                               on_audio=lambda audio: play_in_browser(audio, 'audio/mp3'), trace=trace)
+        ai_response = reply.run(events)
+    except Exception as e:
+        st.error(f"獲取 AI 回應時發生錯誤: {str(e)}")
+        return None
+
+    stats = reply.stats()
+    st.caption(f"首個 token {stats['first_token_ms']} ms · 首段語音 {stats['first_audio_ms']} ms · "
+               f"共 {stats['sentences']} 句 / {stats['total_ms']} ms")
+    return ai_response
+
+def synthesize_speech(text):
+    def synthesize():
+        response = polly.synthesize_speech(Text=text, **POLLY_PARAMS)
         if "AudioStream" in response:
-            audio_stream = BytesIO(response['AudioStream'].read())
+            return response['AudioStream'].read()
+
+    return get_tts_cache().get_or_synthesize(text, POLLY_PARAMS, synthesize)
+
+def text_to_speech(text):
+    try:
+        audio_bytes = synthesize_speech(text)
+        if audio_bytes:
+            audio_stream = BytesIO(audio_bytes)
             return audio_stream
     except Exception as e:
         st.error(f"轉換語音時發生錯誤: {str(e)}")
         return None
 
-def run_async_transcribe():
+def run_async_transcribe(trace=NULL_TRACE):
     # 在新線程中創建事件循環
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
-        return loop.run_until_complete(basic_transcribe())
+        return loop.run_until_complete(basic_transcribe(trace))
     finally:
         loop.close()
 
@@ -162,11 +202,13 @@ col1, col2 = st.columns(2)
 # 在左側列顯示錄音和轉錄部分
 with col1:
     st.header("語音輸入")
+    streaming = st.checkbox("串流回應（邊生成邊播放）", value=True)
     if st.button("開始錄音"):
         with st.spinner("正在聆聽..."):
             # 在新線程中運行異步代碼
             with ThreadPoolExecutor() as executor:
-                future = executor.submit(run_async_transcribe)
+                trace = get_latency_metrics().start_turn(app='app')
+                future = executor.submit(run_async_transcribe, trace)
                 result = future.result()
                 
                 if result:
@@ -174,23 +216,30 @@ with col1:
                     st.text_area("轉錄文字：", transcript, height=200)
                     
                     # 獲取 AI 回應
-                    with st.spinner('獲取 AI 回應中...'):
-                        ai_response = get_ai_response(transcript)
-                        if ai_response:
-                            with col2:
-                                st.header("AI 回應")
+                    with col2:
+                        st.header("AI 回應")
+                        if streaming:
+                            stream_ai_response(transcript, trace)
+                        else:
+                            with st.spinner('獲取 AI 回應中...'):
+                                ai_response = get_ai_response(transcript, trace)
+                            if ai_response:
                                 st.text_area("", ai_response, height=400)
                                 
                                 # 轉換為語音並播放
+                                trace.mark('first_sentence')
                                 audio_stream = text_to_speech(ai_response)
                                 if audio_stream:
+                                    trace.mark('first_audio_byte')
                                     st.audio(audio_stream, format='audio/mp3')
+                                    trace.mark('playback_start')
+                    get_latency_metrics().finish(trace)
 
 # 添加使用說明
 st.markdown("""
 ### 使用說明:
 1. 點擊「開始錄音」按鈕開始錄音
-2. 說話（系統會自動轉錄）
+2. 說話（系統會自動轉錄，說完停頓一下錄音就會結束）
 3. 等待 AI 回應
 4. 聆聽 AI 的語音回應
 """)
@@ -1,30 +1,15 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
-import boto3
 import json
-import os
-import io
-from datetime import datetime
-import time
-
-# 載入 Lottie 動畫
-def load_lottiefile(filepath):
-    with open(filepath, "r", encoding='utf-8') as f:
-        return json.load(f)
-
-happy_animation = load_lottiefile("fire smile.json")
-sad_animation = load_lottiefile("fire cry.json")
-neutral_animation = load_lottiefile("fire wait.json")
-talk_animation = load_lottiefile("fire talk.json")
-think_animation = load_lottiefile("fire think.json")
-
-animations = {
-    "happy": happy_animation,
-    "sad": sad_animation,
-    "neutral": neutral_animation,
-    "talk" : talk_animation,
-    "think" : think_animation,
-}
+
+from tts_cache import get_tts_cache, make_key as make_tts_key
+from bedrock_cache import get_bedrock_cache, make_key
+from streaming_reply import StreamingReply, play_in_browser
+from audio_stream import AUDIO_FORMATS, get_audio_stream_server
+from latency import NULL_TRACE, get_latency_metrics
+from file_transcribe import FileTranscriber
+from lottie_store import get_lottie_store
+from aws_clients import get_client_factory
 
 # Streamlit 頁面配置
 st.set_page_config(page_title="Voice Chat with AI", layout="wide")
@@ -34,107 +19,95 @@ col_animation, col_chat = st.columns([1, 2]) # 調整比例，左側動畫佔 1/
 
 with col_animation:
     st.subheader("AI 狀態")
-    selected_animation = st.selectbox("選擇動畫", ["neutral", "happy", "sad", "talk", "think"])
-    if selected_animation in animations:
-        st_lottie(animations[selected_animation], key="status_animation", height=300) # 可以調整高度
+    avatar_slot = st.empty()
 
+# 動畫跟著處理狀態切換；每個動畫第一次用到才載入，之後整個 process 共用
+lottie_store = get_lottie_store()
+avatar = {'state': None, 'renders': 0}
 
-# 初始化 AWS clients
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2'
-)
+def set_avatar(state):
+    if avatar['state'] == state:
+        return
+    avatar['state'] = state
+    avatar['renders'] += 1
+    with avatar_slot:
+        # 同一次 rerun 內重畫要換 key
+        st_lottie(lottie_store.for_state(state), key=f"status_animation_{avatar['renders']}", height=300) # 可以調整高度
 
-transcribe = boto3.client(
-    service_name='transcribe',
-    region_name='us-west-2'
-)
+set_avatar('idle')
 
-s3 = boto3.client(
-    service_name='s3',
-    region_name='us-west-2'
-)
 
-polly = boto3.client(
-    service_name='polly',
-    region_name='us-west-2'
-)
+# 初始化 AWS clients（整個 process 共用，rerun 時不重建；第一次呼叫才建立，連線留在 pool 裡）
+clients = get_client_factory('us-west-2')
+bedrock = clients.lazy('bedrock-runtime')
+transcribe = clients.lazy('transcribe')
+s3 = clients.lazy('s3')
+polly = clients.lazy('polly')
 
 
-def upload_to_s3(audio_file, bucket_name='hackher'):
-    """上傳文件到 S3"""
-    try:
-        file_name = f"audio_{datetime.now().strftime('%Y%m%d%H%M%S')}.wav"
-        s3.upload_fileobj(audio_file, bucket_name, file_name)
-        return f"s3://{bucket_name}/{file_name}"
-    except Exception as e:
-        st.error(f"上傳到 S3 時發生錯誤: {str(e)}")
-        return None
+# 上傳的 WAV 檔用 Transcribe 串流轉錄；超過 TRANSCRIBE_BATCH_MIN_SECONDS 的長檔才走 S3 + 批次任務
+transcribe_file = FileTranscriber(
+    clients.transcribe_streaming(),
+    s3=s3,
+    transcribe=transcribe,
+    bucket_name='hackher',
+)
 
 def process_audio(audio_file):
-    # 上傳到 S3
-    s3_uri = upload_to_s3(audio_file)
-    if not s3_uri:
-        return None
-    
-    # 開始轉錄任務
     try:
-        job_name = f"transcribe_job_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        response = transcribe.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': s3_uri},
-            MediaFormat='wav',
-            LanguageCode='zh-TW'
-        )
-        
-        # 等待轉錄完成
         with st.spinner('轉錄進行中...'):
-            while True:
-                status = transcribe.get_transcription_job(TranscriptionJobName=job_name)
-                if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                    break
-                time.sleep(2)
-        
-        if status['TranscriptionJob']['TranscriptionJobStatus'] == 'COMPLETED':
-            transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-            # 從 JSON 中獲取實際的轉錄文本
-            import requests
-            response = requests.get(transcript_uri)
-            transcript_text = response.json()['results']['transcripts'][0]['transcript']
-            return transcript_text
-        else:
-            st.error("轉錄失敗")
-            return None
+            return transcribe_file(audio_file)
     except Exception as e:
         st.error(f"處理音頻時發生錯誤: {str(e)}")
         return None
 
-def get_ai_response(input_text):
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+POLLY_PARAMS = {
+    'VoiceId': 'Zhiyu',  # 使用中文女聲
+    'LanguageCode': 'cmn-CN',  # 設置為中文
+}
+
+# 語音經由本機的串流端點送到瀏覽器（不經過 Streamlit、不做 base64）
+audio_server = get_audio_stream_server()
+
+def polly_params(audio_format):
+    return {**POLLY_PARAMS, **AUDIO_FORMATS[audio_format][0]}
+
+
+def request_body(input_text):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 4096,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": input_text
+                    }
+                ]
+            }
+        ],
+        "temperature": 0.7,
+        "top_p": 0.9,
+    })
+
+def get_ai_response(input_text, trace=NULL_TRACE):
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": input_text
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.7,
-            "top_p": 0.9,
-        })
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            body=body
-        )
-
-        response_body = json.loads(response.get('body').read())
+        body = request_body(input_text)
+        trace.mark('bedrock_request')
+
+        def invoke():
+            response = bedrock.invoke_model(
+                modelId=MODEL_ID,
+                body=body
+            )
+            return json.loads(response.get('body').read())
+
+        # 相同的問題共用同一個回應（同時送出的請求也只會呼叫一次 Bedrock）
+        response_body = get_bedrock_cache().get_or_invoke(make_key(MODEL_ID, body), invoke)
+        trace.mark('first_token')
         return response_body['content'][0]['text'] if 'content' in response_body else response_body['messages'][0]['content'][0]['text']
     
     except Exception as e:
@@ -145,27 +118,73 @@ def get_ai_response(input_text):
             elif 'messages' in response_body:
                 return response_body['messages'][0]['content'][0]['text']
         return None
-def text_to_speech(text):
-    """將文字轉換為語音"""
+
+def stream_ai_response(input_text, turn, trace=NULL_TRACE):
+    """邊收 token 邊顯示，每句話完成就先送去 Polly 並開始播放"""
+    text_box = st.empty()
     try:
-        response = polly.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId='Zhiyu',  # 使用中文女聲
-            LanguageCode='cmn-CN'  # 設置為中文
-        )
-        
-        if "AudioStream" in response:
-            # 將音頻流轉換為 bytes
-            audio_stream = io.BytesIO(response['AudioStream'].read())
-            return audio_stream
+        body = request_body(input_text)
+        trace.mark('bedrock_request')
+
+        def open_stream():
+            response = bedrock.invoke_model_with_response_stream(modelId=MODEL_ID, body=body)
+            return response.get('body')
+
+        events = get_bedrock_cache().stream(make_key(MODEL_ID, body), open_stream)
+
+        def on_audio(url):
+            set_avatar('speaking')
+            play_turn_audio(url, turn)
+
+        reply = StreamingReply(lambda sentence: stream_speech(sentence, turn), on_text=text_box.markdown,
+                               on_audio=on_audio, trace=trace)
+        ai_response = reply.run(events)
     except Exception as e:
-        st.error(f"轉換語音時發生錯誤: {str(e)}")
+        st.error(f"獲取 AI 回應時發生錯誤: {str(e)}")
         return None
-    
+
+    stats = reply.stats()
+    st.caption(f"首個 token {stats['first_token_ms']} ms · 首段語音 {stats['first_audio_ms']} ms · "
+               f"共 {stats['sentences']} 句 / {stats['total_ms']} ms")
+    return ai_response
+
+def stream_speech(text, turn):
+    """Polly 一邊合成、瀏覽器一邊從 audio_server 下載播放；回傳播放網址"""
+    params = polly_params(audio_format)
+    mime = AUDIO_FORMATS[audio_format][1]
+    cache = get_tts_cache()
+    key = make_tts_key(text, **params)
+    # 相同的句子直接從快取播放，不再呼叫 Polly
+    cached = cache.get(key)
+    if cached is not None:
+        return audio_server.publish(turn, mime, data=cached)
+    response = polly.synthesize_speech(Text=text, **params)
+    return audio_server.publish(turn, mime, stream=response['AudioStream'],
+                                on_complete=lambda data: cache.put(key, data))
+
+def play_turn_audio(url, turn):
+    play_in_browser(url, turn=turn, stats_url=audio_server.stats_url, since_ms=audio_server.since_start_ms(turn))
+
+# 瀏覽器沒有回報（關掉分頁、自動播放被擋）時最多等這麼久
+PLAYBACK_TIMEOUT = 120
+
+def finish_speaking(turn):
+    """瀏覽器回報這個回合的每一句都播完之後才從 'speaking' 換成 'done'"""
+    audio_server.wait_played(turn, timeout=PLAYBACK_TIMEOUT)
+    set_avatar('done')
+
 # Streamlit UI 組件
 st.sidebar.header("Controls")
 audio_file = st.sidebar.file_uploader("Upload Audio File", type=['wav'])
+streaming = st.sidebar.checkbox("串流回應（邊生成邊播放）", value=True)
+audio_format = st.sidebar.selectbox("語音格式", list(AUDIO_FORMATS), format_func={
+    'mp3_16k': 'MP3 16 kHz（較小）',
+    'ogg_vorbis': 'Ogg Vorbis（最小，Safari 不支援）',
+    'mp3': 'MP3 24 kHz',
+}.get)
+with st.sidebar.expander("瀏覽器端語音統計"):
+    # 上一回合的位元組數與 time-to-first-audio（瀏覽器開始播放後回報）
+    st.json(audio_server.turn_stats())
 
 # 主要內容區域
 col1, col2 = st.columns(2)
@@ -175,48 +194,61 @@ with col1:
     if audio_file:
         st.audio(audio_file)
         
-        # 處理音頻文件
+        # 處理音頻文件（上傳的檔案沒有「說完話」的時間點，從開始處理算起）
+        trace = get_latency_metrics().start_turn(app='app_TTS')
+        set_avatar('transcribing')
         transcript = process_audio(audio_file)
+        trace.mark('final_transcript')
+        set_avatar('thinking' if transcript else 'error')
         if transcript:
                     st.success("音頻處理完成！")
                     st.subheader("轉錄文字：")
                     st.text_area("", transcript, height=200)
                     
                     # 獲取 AI 回應
-                    with st.spinner('獲取 AI 回應中...'):
-                        ai_response = get_ai_response(transcript)
-                        if ai_response:
-                            # 在右側列顯示 AI 回應
-                            with col2:
-                                st.header("AI 回應")
-                                st.text_area("", ai_response, height=400)
+                    if streaming:
+                        with col2:
+                            st.header("AI 回應")
+                            turn = audio_server.start_turn(audio_format)
+                            if stream_ai_response(transcript, turn, trace) is None:
+                                set_avatar('error')
+                            else:
+                                finish_speaking(turn)
+                    else:
+                        speaking_turn = None
+                        with st.spinner('獲取 AI 回應中...'):
+                            ai_response = get_ai_response(transcript, trace)
+                            if ai_response:
+                                # 在右側列顯示 AI 回應
+                                with col2:
+                                    st.header("AI 回應")
+                                    st.text_area("", ai_response, height=400)
                                                             
-                                # 自動將 AI 回應轉換為語音並播放
-                                audio_stream = text_to_speech(ai_response)
-                                if audio_stream:
-                                    # 使用 base64 編碼的方式來自動播放
-                                    import base64
-                                    audio_bytes = audio_stream.getvalue()
-                                    b64 = base64.b64encode(audio_bytes).decode()
-                                    
-                                    # 創建自動播放的 HTML audio 元素
-                                    md = f"""
-                                        <audio id="myAudio" autoplay="true">
-                                            <source src="data:audio/mp3;base64,{b64}" type="audio/mp3">
-                                        </audio>
-                                        <script>
-                                            var audio = document.getElementById("myAudio");
-                                            audio.play();
-                                        </script>
-                                        """
-                                    st.markdown(md, unsafe_allow_html=True)
-                                    
-                                    # 同時也顯示一個可控的播放器
-                                    st.audio(audio_bytes)
+                                    # 自動將 AI 回應轉換為語音並播放
+                                    trace.mark('first_sentence')
+                                    # Polly 一產生就串流給瀏覽器播放（同一份音檔只傳一次）
+                                    turn = audio_server.start_turn(audio_format)
+                                    try:
+                                        url = stream_speech(ai_response, turn)
+                                    except Exception as e:
+                                        st.error(f"轉換語音時發生錯誤: {str(e)}")
+                                        url = None
+                                    if url:
+                                        trace.mark('first_audio_byte')
+                                        set_avatar('speaking')
+                                        play_turn_audio(url, turn)
+                                        trace.mark('playback_start')
+                                        speaking_turn = turn
+                                    else:
+                                        set_avatar('error')
                             
                                 
-                        else:
-                            st.error("無法獲取 AI 回應")
+                            else:
+                                set_avatar('error')
+                                st.error("無法獲取 AI 回應")
+                        if speaking_turn is not None:
+                            finish_speaking(speaking_turn)
+                    get_latency_metrics().finish(trace)
 # 添加使用說明
 st.markdown("""
 ### 使用說明:
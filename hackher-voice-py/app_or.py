@@ -1,18 +1,27 @@
 import asyncio
-import json
 import os
+import threading
 import time
-import pyaudio
 import sys
-import boto3
-import sounddevice
 
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from amazon_transcribe.client import TranscribeStreamingClient
-from amazon_transcribe.handlers import TranscriptResultStreamHandler
-from amazon_transcribe.model import TranscriptEvent, TranscriptResultStream
+from itertools import islice
 
 from api_request_schema import api_request_list, get_model_ids
+from tts_pipeline import SentenceSegmenter, TtsPipeline, split_for_polly
+from audio_player import AudioPlayer, DeferredPlayer, portaudio_lock
+from tts_cache import get_tts_cache, make_key
+from bedrock_cache import get_bedrock_cache, make_key as make_bedrock_key
+from vad import EnergyVad, SilenceGate
+from cancellation import CancelToken
+from mic_capture import MicCapture
+from model_codecs import TranslatedStream, get_codec
+from model_router import get_model_router
+from conversation import Conversation
+from latency import NULL_TRACE, get_latency_metrics
+from aws_clients import get_client_factory
+from speculation import Speculation, SpeculationStats
 
 model_id = os.getenv('MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
 aws_region = os.getenv('AWS_REGION', 'us-west-2')
@@ -22,8 +31,9 @@ if model_id not in get_model_ids():
     sys.exit(0)
 
 api_request = api_request_list[model_id]
+codec = get_codec(model_id)
 config = {
-    'log_level': 'none',  # One of: info, debug, none
+    'log_level': os.getenv('LOG_LEVEL', 'none'),  # One of: info, debug, none
     'last_speech': "If you have any other questions, please don't hesitate to ask. Have a great day!",
     'region': aws_region,
     'polly': {
@@ -32,23 +42,46 @@ config = {
         'VoiceId': 'Zhiyu',
         'OutputFormat': 'pcm',
     },
+    'tts_pipeline': {
+        'max_in_flight': 3,  # 同時送出的 Polly 句子合成請求數
+    },
+    'capture': {
+        'frame_ms': 50,  # 每次送給 Transcribe 的音訊長度（20-100 ms：越短延遲越低，事件數越多）
+        'buffer_ms': 2000,  # 事件迴圈跟不上時最多暫存的音訊
+        'overflow': 'drop_oldest',  # 或 'drop_newest'
+    },
+    'vad': {
+        'enabled': True,  # 本地偵測說話結束，不必等 Transcribe 連續 4 個空白事件
+        'gate': False,  # True: 靜音的區段不送到 Transcribe
+        'hangover_ms': 600,
+        'min_threshold_db': -50.0,
+    },
+    'barge_in': {
+        'enabled': False,  # 使用者開始說話時立即停止 Bedrock 與播放（用喇叭時回音也會觸發，建議搭配耳機）
+        'echo_margin_db': 15.0,  # 播放回答時 VAD 門檻提高這麼多，喇叭的回音才不會被當成插話
+    },
+    'memory': {
+        'enabled': True,  # 記住先前的對話
+        'token_budget': 2000,  # 歷史對話最多佔用的 token 數，超過的舊回合會被移除
+        'summarize': True,  # 被移除的回合在背景用 Bedrock 摘要後保留
+    },
     'translate': {
         'SourceLanguageCode': 'zh',
         'TargetLanguageCode': 'zh',
     },
     'bedrock': {
         'response_streaming': True,
+        'response_cache': True,  # 相同問題直接重播快取的回應
         'api_request': api_request
-    }
+    },
+    'speculation': {
+        'enabled': False,  # partial 轉錄結果不再變動時就先在背景呼叫 Bedrock；final 不同的話取消
+        'stable_ms': 300,  # partial 要維持不變多久才開始猜
+        'tts': True,  # 也先合成第一句（只寫進 TTS 快取，不播放）
+    },
 }
 
 
-p = pyaudio.PyAudio()
-bedrock_runtime = boto3.client(service_name='bedrock-runtime', region_name=config['region'])
-polly = boto3.client('polly', region_name=config['region'])
-transcribe_streaming = TranscribeStreamingClient(region=config['region'])
-
-
 def printer(text, level):
     if config['log_level'] == 'info' and level == 'info':
         print(text)
@@ -56,68 +89,62 @@ def printer(text, level):
         print(text)
 
 
-class UserInputManager:
-    shutdown_executor = False
-    executor = None
+class Services:
+    """
+    AWS clients, caches and the audio output shared by every session in the process.
+    Benchmarks pass local stand-ins instead of calling `create()`.
+    """
 
-    @staticmethod
-    def set_executor(executor):
-        UserInputManager.executor = executor
+    def __init__(self, bedrock_runtime, polly, transcribe, player=None, tts_cache=None, bedrock_cache=None,
+                 router=None):
+        self.bedrock_runtime = bedrock_runtime
+        self.polly = polly
+        self.transcribe = transcribe
+        self.player = player
+        self.tts_cache = tts_cache or get_tts_cache()
+        self.bedrock_cache = bedrock_cache or get_bedrock_cache()
+        # Without a router every turn goes to `model_id`.
+        self.router = router
 
     @staticmethod
-    def start_shutdown_executor():
-        UserInputManager.shutdown_executor = False
-        raise Exception()  # Workaround to shutdown exec, as executor.shutdown() doesn't work as expected.
+    def create():
+        def open_player():
+            import pyaudio
+            # One long-lived output stream for the whole process; every playback path writes into it.
+            with portaudio_lock:
+                return AudioPlayer(pyaudio.PyAudio(), rate=16000)
+
+        clients = get_client_factory(config['region'])
+        return Services(
+            # 第一次呼叫時才建立（預熱的話在背景就建好了）
+            bedrock_runtime=clients.lazy('bedrock-runtime'),
+            polly=clients.lazy('polly'),
+            transcribe=clients.transcribe_streaming(),
+            # PyAudio() probes every audio device; open it in the background while the session starts listening.
+            player=DeferredPlayer(open_player),
+            router=get_model_router(codec.model_id),
+        )
 
-    @staticmethod
-    def start_user_input_loop():
-        while True:
-            sys.stdin.readline().strip()
-            printer(f'[DEBUG] User input to shut down executor...', 'debug')
-            UserInputManager.shutdown_executor = True
 
-    @staticmethod
-    def is_executor_set():
-        return UserInputManager.executor is not None
+class UserInputManager:
+    """ENTER on the console interrupts the current turn of the given session."""
 
-    @staticmethod
-    def is_shutdown_scheduled():
-        return UserInputManager.shutdown_executor
+    def __init__(self, session):
+        self.session = session
+
+    def start_user_input_loop(self):
+        while True:
+            sys.stdin.readline().strip()
+            printer(f'[DEBUG] User input to interrupt Bedrock...', 'debug')
+            self.session.bedrock_wrapper.cancel('user input')
 
 
 class BedrockModelsWrapper:
+    """Thin wrapper over the codec resolved for `model_id` at startup (see model_codecs.py)."""
 
     @staticmethod
     def define_body(text):
-        model_id = config['bedrock']['api_request']['modelId']
-        model_provider = model_id.split('.')[0]
-        body = config['bedrock']['api_request']['body']
-
-        if model_provider == 'amazon':
-            body['inputText'] = text
-        elif model_provider == 'meta':
-            body['prompt'] = text
-        elif model_provider == 'anthropic':
-            if 'claude-3' in model_id:
-                # Claude 3 系列使用新的消息格式
-                body = {
-                    'messages': [{
-                        'role': 'user',
-                        'content': text
-                    }],
-                    'anthropic_version': 'bedrock-2023-05-31',
-                    'max_tokens': 4096 
-                }
-            else:
-                # Claude 1 和 2 系列使用舊的格式
-                body['prompt'] = f'\n\nHuman: {text}\n\nAssistant:'
-                
-        elif model_provider == 'cohere':
-            body['prompt'] = text
-        else:
-            raise Exception('Unknown model provider.')
-
-        return body
+        return codec.build_body(text)
 
     @staticmethod
     def get_stream_chunk(event):
@@ -125,129 +152,237 @@ class BedrockModelsWrapper:
 
     @staticmethod
     def get_stream_text(chunk):
-        model_id = config['bedrock']['api_request']['modelId']
-        model_provider = model_id.split('.')[0]
-
-       
-        raw_data = chunk.get('bytes').decode()
-
-            
-        chunk_obj = json.loads(raw_data)
-        
-
-        if model_provider == 'anthropic' and 'claude-3' in model_id:
-            # 處理不同的回應格式
-            if 'delta' in chunk_obj:
-                if 'text' in chunk_obj['delta']:
-                    return chunk_obj['delta']['text']
-        
-            
-            if 'content' in chunk_obj:
-                if isinstance(chunk_obj['content'], list) and chunk_obj['content']:
-                    return chunk_obj['content'][0].get('text', '')
-                
-            
-            if 'type' in chunk_obj:
-                
-                if chunk_obj['type'] == 'content_block_delta':
-                    return chunk_obj.get('delta', {}).get('text', '')
-            
-            # 如果都沒有匹配的格式，返回整個對象的字符串形式
-            return str(chunk_obj)
-            
-        # 其他模型的處理保持不變
-        elif model_provider == 'amazon':
-            return chunk_obj['outputText']
-        elif model_provider == 'meta':
-            return chunk_obj['generation']
-        elif model_provider == 'anthropic':
-            return chunk_obj['completion']
-        elif model_provider == 'cohere':
-            return ' '.join([c["text"] for c in chunk_obj['generations']])
-        else:
-            raise NotImplementedError('Unknown model provider.')
+        return codec.decode(chunk.get('bytes'))
+
 
-def to_audio_generator(bedrock_stream):
-    prefix = ''
+def to_audio_generator(bedrock_stream, cancel=None, echo=True, collect=None, trace=NULL_TRACE):
+    segmenter = SentenceSegmenter()
 
     if bedrock_stream:
         for event in bedrock_stream:
+            if cancel is not None and cancel.is_cancelled():
+                return
             chunk = BedrockModelsWrapper.get_stream_chunk(event)
             if chunk:
                 text = BedrockModelsWrapper.get_stream_text(chunk)
-
-                if '.' in text:
-                    a = text.split('.')[:-1]
-                    to_polly = ''.join([prefix, '.'.join(a), '. '])
-                    prefix = text.split('.')[-1]
-                    print(to_polly, flush=True, end='')
+                if text:
+                    trace.mark('first_token')
+                if collect is not None:
+                    collect.append(text)
+
+                for to_polly in segmenter.feed(text):
+                    if echo:
+                        print(to_polly, flush=True, end='')
                     yield to_polly
-                else:
-                    prefix = ''.join([prefix, text])
 
-        if prefix != '':
-            print(prefix, flush=True, end='')
-            yield f'{prefix}.'
+        rest = segmenter.flush()
+        if rest.strip():
+            if echo:
+                print(rest, flush=True, end='')
+            yield rest
+
+        if echo:
+            print('\n')
+
 
-        print('\n')
+def bedrock_summarizer(services):
+    """Conversation summarizer that runs on the session's model, off the turn's critical path."""
+
+    def summarize(previous, turns):
+        lines = [f'先前的摘要：{previous}'] if previous else []
+        lines += [f'使用者：{user}\n助理：{assistant}' for user, assistant in turns]
+        prompt = '請用三句話以內摘要以下對話的重點，保留之後回答可能用到的資訊：\n\n' + '\n'.join(lines)
+        response = services.bedrock_runtime.invoke_model_with_response_stream(
+            **codec.request_kwargs(codec.build_body(prompt)))
+        return ''.join(codec.decode_event(event) for event in response.get('body')).strip()
+
+    return summarize
 
 
 class BedrockWrapper:
 
-    def __init__(self):
+    def __init__(self, services, player, echo=True, conversation=None):
+        self.services = services
+        self.player = player
+        self.echo = echo
+        self.conversation = conversation
+        self.metrics = get_latency_metrics()
         self.speaking = False
+        self.cancel_token = None
+        self.turn_stats = []
+        self.speculation_stats = SpeculationStats()
 
     def is_speaking(self):
         return self.speaking
 
-    def invoke_bedrock(self, text):
+    def cancel(self, reason=None):
+        """Stop the current turn: Bedrock stream, pending Polly requests and buffered audio."""
+        token = self.cancel_token
+        if token is not None and not token.is_cancelled():
+            printer(f'\n[DEBUG] Turn cancelled: {reason}', 'debug')
+            token.cancel(reason)
+
+    def build_body(self, text, model_codec=None):
+        if self.conversation is not None:
+            return self.conversation.build_body(text, model_codec)
+        if model_codec is not None:
+            return model_codec.build_body(text)
+        return BedrockModelsWrapper.define_body(text)
+
+    def open_model(self, model_id, text, body, cancel=None):
+        """Sends the turn to `model_id`; the events always come back in `codec`'s format."""
+        model_codec = get_codec(model_id)
+        if model_id != codec.model_id:
+            body = self.build_body(text, model_codec)
+        response = self.services.bedrock_runtime.invoke_model_with_response_stream(**model_codec.request_kwargs(body))
+        bedrock_stream = response.get('body')
+        if cancel is not None:
+            cancel.on_cancel(bedrock_stream.close)
+        if type(model_codec) is not type(codec):
+            bedrock_stream = TranslatedStream(bedrock_stream, model_codec, codec)
+        return bedrock_stream
+
+    def open_stream(self, text, body, cancel):
+        router = self.services.router
+
+        def open_stream():
+            if router is None:
+                return self.open_model(codec.model_id, text, body)
+            return router.stream(lambda model_id, model_cancel: self.open_model(model_id, text, body, model_cancel),
+                                 codec.decode_event)
+
+        if config['bedrock']['response_cache']:
+            cache_key = make_bedrock_key(codec.model_id, body)
+            return self.services.bedrock_cache.stream(cache_key, open_stream, cancel=cancel)
+        bedrock_stream = open_stream()
+        # Closing the event stream stops Bedrock from generating more tokens.
+        cancel.on_cancel(bedrock_stream.close)
+        return bedrock_stream
+
+    def speculate(self, text, tts=False):
+        """Starts answering `text` before the final transcript; the turn adopts or discards it."""
+        printer(f'\n[DEBUG] Speculating on: {text}', 'debug')
+        body = self.build_body(text)
+        speculation = Speculation(text, lambda cancel: self.open_stream(text, body, cancel), codec.decode_event,
+                                  body=body)
+        self.speculation_stats.on_start()
+        if tts:
+            threading.Thread(target=self._synthesize_ahead, args=(speculation,), name='speculation-tts',
+                             daemon=True).start()
+        return speculation
+
+    def _synthesize_ahead(self, speculation):
+        # 只合成第一句，不播放；採用後 Reader 直接拿來用
+        reader = Reader(self.services, self.player, speculation.cancel)
+        audio = None
+        try:
+            for sentence in to_audio_generator(speculation.events(), speculation.cancel, echo=False):
+                speculation.first_sentence = sentence
+                audio = reader.synthesize(sentence)
+                break
+        except Exception:
+            pass
+        finally:
+            speculation.first_audio.set_result(audio)
+
+    def discard_speculation(self, speculation):
+        printer('\n[DEBUG] Speculation discarded', 'debug')
+        speculation.discard()
+        self.speculation_stats.on_discard(speculation)
+
+    def invoke_bedrock(self, text, trace=NULL_TRACE, speculation=None):
         printer('[DEBUG] Bedrock generation started', 'debug')
         self.speaking = True
-
-        body = BedrockModelsWrapper.define_body(text)
+        cancel = self.cancel_token = CancelToken()
+        cancel.on_cancel(self.player.flush)
+        # Hand the turn back to the transcriber right away; the worker threads wind down on their own.
+        cancel.on_cancel(lambda: setattr(self, 'speaking', False))
+
+        body = self.build_body(text)
+        answer = []
+        failed = False
         printer(f"[DEBUG] Request body: {body}", 'debug')
 
         try:
-            body_json = json.dumps(body)
-            response = bedrock_runtime.invoke_model_with_response_stream(
-                body=body_json,
-                modelId=config['bedrock']['api_request']['modelId'],
-                accept=config['bedrock']['api_request']['accept'],
-                contentType=config['bedrock']['api_request']['contentType']
-            )
-
             printer('[DEBUG] Capturing Bedrocks response/bedrock_stream', 'debug')
-            bedrock_stream = response.get('body')
+            trace.mark('bedrock_request')
+            # 猜測時的對話歷史可能已經變了（例如背景摘要完成），body 不同就重新呼叫
+            if speculation is not None and speculation.body == body and speculation.error is None:
+                bedrock_stream = speculation.adopt(cancel)
+                self.speculation_stats.on_commit(speculation)
+            else:
+                if speculation is not None:
+                    self.discard_speculation(speculation)
+                    speculation = None
+                bedrock_stream = self.open_stream(text, body, cancel)
 
-            audio_gen = to_audio_generator(bedrock_stream)
+            audio_gen = to_audio_generator(bedrock_stream, cancel, echo=self.echo, collect=answer, trace=trace)
             printer('[DEBUG] Created bedrock stream to audio generator', 'debug')
 
-            reader = Reader()
-            for audio in audio_gen:
-                reader.read(audio)
-
-            reader.close()
+            reader = Reader(self.services, self.player, cancel, trace, ahead=speculation)
+            pipeline = TtsPipeline(reader.synthesize, reader.play,
+                                   max_in_flight=config['tts_pipeline']['max_in_flight'],
+                                   cancel=cancel)
+            try:
+                gaps = pipeline.run(audio_gen)
+                self.turn_stats.append(gaps)
+                printer(f'[INFO] Gap between sentences: {gaps}', 'info')
+                printer(f'[INFO] Playback: {self.player.stats()}', 'info')
+                printer(f'[INFO] TTS cache: {self.services.tts_cache.stats()}', 'info')
+                printer(f'[INFO] Bedrock cache: {self.services.bedrock_cache.stats()}', 'info')
+                if self.speculation_stats.started:
+                    printer(f'[INFO] Speculation: {self.speculation_stats.summary()}', 'info')
+                if self.services.router is not None:
+                    printer(f'[INFO] Model router: {self.services.router.stats()}', 'info')
+            finally:
+                reader.close()
 
         except Exception as e:
-            time.sleep(2)
+            # 所有模型都失敗了（router 已經換過模型）；不再多等，直接回到聆聽。
+            # 不是這個回合被取消的 TurnCancelled（例如別人放棄的 Bedrock 快取 flight）也算失敗
+            if not cancel.is_cancelled():
+                failed = True
+                printer(f'\n[INFO] Bedrock request failed: {e!r}', 'info')
+
+        self.metrics.finish(trace, cancelled=cancel.is_cancelled())
+        # 沒有回答的失敗回合不要留在對話歷史裡
+        if self.conversation is not None and not (failed and not answer):
+            # 被打斷時只記住已經生成的部分
+            self.conversation.add_turn(text, ''.join(answer).strip())
+            printer(f'[INFO] Conversation: {self.conversation.stats()}', 'info')
+
+        # Reader.close() already drained the player, so no extra sleep before listening again.
+        if self.cancel_token is cancel:
             self.speaking = False
-            
-
-        time.sleep(1)
-        self.speaking = False
         printer('\n[DEBUG] Bedrock generation completed', 'debug')
 
 
 class Reader:
 
-    def __init__(self):
-        self.polly = boto3.client('polly', region_name=config['region'])
-        self.audio = p.open(format=pyaudio.paInt16, channels=1, rate=16000, output=True)
+    def __init__(self, services, player, cancel=None, trace=NULL_TRACE, ahead=None):
+        self.polly = services.polly
+        self.tts_cache = services.tts_cache
+        self.audio = player
         self.chunk = 1024
-
-    def read(self, data):
+        self.cancel = cancel
+        self.trace = trace
+        # Adopted speculation whose first sentence may already be synthesized (or on its way).
+        self.ahead = ahead
+
+    def synthesize(self, text):
+        # Runs on the TTS pipeline worker threads, so the next sentence is synthesized while the current one plays.
+        self.trace.mark('first_sentence')
+        audio = None
+        if self.ahead is not None and self.ahead.first_sentence == text:
+            audio = self.ahead.first_audio.result()
+        if audio is None:
+            audio = self.tts_cache.get_or_synthesize(text, config['polly'], lambda: self._synthesize(text))
+        self.trace.mark('first_audio_byte')
+        return audio
+
+    def _synthesize(self, text):
         response = self.polly.synthesize_speech(
-            Text=data,
+            Text=text,
             Engine=config['polly']['Engine'],
             LanguageCode=config['polly']['LanguageCode'],
             VoiceId=config['polly']['VoiceId'],
@@ -255,175 +390,344 @@ class Reader:
         )
 
         stream = response['AudioStream']
+        try:
+            return stream.read()
+        finally:
+            stream.close()
 
-        while True:
-            # Check if user signaled to shutdown Bedrock speech
-            # UserInputManager.start_shutdown_executor() will raise Exception. If not ideas but is functional.
-            if UserInputManager.is_executor_set() and UserInputManager.is_shutdown_scheduled():
-                UserInputManager.start_shutdown_executor()
+    def play(self, audio):
+        self.trace.mark('playback_start')
+        for i in range(0, len(audio), self.chunk * 2):
+            # Stop as soon as the turn is cancelled (barge-in or ENTER); the player has already been flushed.
+            if self.cancel is not None and self.cancel.is_cancelled():
+                return
 
-            data = stream.read(self.chunk)
-            self.audio.write(data)
-            if not data:
-                break
+            self.audio.write(audio[i:i + self.chunk * 2])
+
+    def read(self, data):
+        self.play(self.synthesize(data))
 
     def close(self):
-        time.sleep(1)
-        self.audio.stop_stream()
-        self.audio.close()
+        if self.cancel is None or not self.cancel.is_cancelled():
+            self.audio.drain()
+            self.trace.mark('playback_end')
 
 
-def stream_data(stream):
+def stream_data(stream, player):
     chunk = 1024
     if stream:
-        polly_stream = p.open(
-            format=pyaudio.paInt32,
-            channels=1,
-            rate=16000,
-            output=True,
-        )
-
         while True:
             data = stream.read(chunk)
-            polly_stream.write(data)
+            player.write(data)
 
             # If there's no more data to read, stop streaming
             if not data:
-                time.sleep(0.5)
                 stream.close()
-                polly_stream.stop_stream()
-                polly_stream.close()
+                player.drain()
                 break
     else:
         # The stream passed in is empty
         pass
 
 
-def aws_polly_tts(polly_text):
+def aws_polly_tts(polly_text, services, player):
     printer(f'[INTO] Character count: {len(polly_text)}', 'debug')
-    byte_stream_list = []
-    polly_text_len = len(polly_text.split('.'))
-    printer(f'LEN polly_text_len: {polly_text_len}', 'debug')
-    for i in range(0, polly_text_len, 20):
-        printer(f'{i}:{i + 20}', 'debug')
-        polly_text_chunk = '. '.join(polly_text.split('. ')[i:i + 20])
-        printer(f'polly_text_chunk LEN: {len(polly_text_chunk)}', 'debug')
-
-        response = polly.synthesize_speech(
-            Text=polly_text_chunk,
+    segments = split_for_polly(polly_text)
+    printer(f'LEN polly segments: {len(segments)}', 'debug')
+
+    def synthesize(segment, on_data=None):
+        key = make_key(segment, **config['polly'])
+        cached = services.tts_cache.get(key)
+        if cached is not None:
+            if on_data is not None:
+                on_data(cached)
+            return cached
+        byte_stream = services.polly.synthesize_speech(
+            Text=segment,
             Engine=config['polly']['Engine'],
             LanguageCode=config['polly']['LanguageCode'],
             VoiceId=config['polly']['VoiceId'],
             OutputFormat=config['polly']['OutputFormat'],
-        )
-        byte_stream = response['AudioStream']
-        byte_stream_list.append(byte_stream)
-
-    byte_chunks = []
-    chunk = 1024
-    for bs in byte_stream_list:
-        while True:
-            data = bs.read(chunk)
-            byte_chunks.append(data)
-
-            if not data:
-                bs.close()
-                break
-
-    read_byte_chunks(b''.join(byte_chunks))
-
-
-def read_byte_chunks(data):
-    polly_stream = p.open(format=pyaudio.paInt16, channels=1, rate=16000, output=True)
-    polly_stream.write(data)
-
-    time.sleep(1)
-    polly_stream.stop_stream()
-    polly_stream.close()
-    time.sleep(1)
+        )['AudioStream']
+        received = []
+        try:
+            while True:
+                data = byte_stream.read(4096)
+                if not data:
+                    break
+                received.append(data)
+                if on_data is not None:
+                    on_data(data)
+        finally:
+            byte_stream.close()
+        audio = b''.join(received)
+        services.tts_cache.put(key, audio)
+        return audio
+
+    # The first segment streams straight into the player as its bytes arrive; meanwhile at
+    # most `max_in_flight` of the following ones are synthesized ahead, each read (and its
+    # Polly stream closed) on its worker. Playback stays strictly in order.
+    max_in_flight = config['tts_pipeline']['max_in_flight']
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        rest = iter(segments[1:])
+        ahead = deque(executor.submit(synthesize, segment) for segment in islice(rest, max_in_flight))
+        if segments:
+            synthesize(segments[0], player.write)
+        while ahead:
+            audio = ahead.popleft().result()
+            segment = next(rest, None)
+            if segment is not None:
+                ahead.append(executor.submit(synthesize, segment))
+            player.write(audio)
+
+    player.drain()
+
+
+def read_byte_chunks(data, player):
+    player.write(data)
+    player.drain()
+
+
+class EventHandler:
+    """
+    Same role as amazon_transcribe's TranscriptResultStreamHandler, without importing it at
+    startup: dispatches on the event shape rather than its class, so local stand-ins work too.
+    """
+
+    def __init__(self, transcript_result_stream, session):
+        self._transcript_result_stream = transcript_result_stream
+        self.session = session
+
+    async def handle_events(self):
+        async for event in self._transcript_result_stream:
+            if getattr(event, 'transcript', None) is not None:
+                await self.handle_transcript_event(event)
+
+    async def handle_transcript_event(self, transcript_event):
+        self.session.on_transcript(transcript_event.transcript.results)
 
 
-class EventHandler(TranscriptResultStreamHandler):
-    text = []
-    last_time = 0
-    sample_count = 0
-    max_sample_counter = 4
+class MicStream:
 
-    def __init__(self, transcript_result_stream: TranscriptResultStream, bedrock_wrapper):
-        super().__init__(transcript_result_stream)
-        self.bedrock_wrapper = bedrock_wrapper
+    def __init__(self):
+        self.capture = MicCapture(
+            sample_rate=16000,
+            frame_ms=config['capture']['frame_ms'],
+            buffer_ms=config['capture']['buffer_ms'],
+            overflow=config['capture']['overflow'],
+        )
 
-    async def handle_transcript_event(self, transcript_event: TranscriptEvent):
-        results = transcript_event.transcript.results
+    async def mic_stream(self):
+        async for indata, status in self.capture.frames():
+            yield indata, status
+
+
+class VoiceSession:
+    """
+    One voice conversation: transcript buffer, endpointing state, the Bedrock/TTS pipeline
+    and its cancellation. Sessions share nothing but `services`, so many of them can run
+    on one event loop.
+    """
+    # 連續多久沒有轉錄結果就結束這一回合（原本是 4 個 256 ms 區塊的空白事件，約 1 秒；
+    # 改用時間計算，才不會因為 capture frame 變短而提早結束）
+    silence_timeout = 1.0
+
+    def __init__(self, services, audio_source=None, player=None, echo=True):
+        self.services = services
+        self.player = player or services.player
+        # Async generator factory yielding (pcm_chunk, status); the microphone by default.
+        self.mic = None
+        if audio_source is None:
+            self.mic = MicStream()
+            audio_source = self.mic.mic_stream
+        self.audio_source = audio_source
+        self.echo = echo
+
+        self.text = []
+        self.last_time = 0
+        self.sample_count = 0
+        self.silence_since = None
+        self.partial_pending = False
+        self.end_of_speech = False
+        self.speech_end_at = None
+        self.final_at = None
+        self.partial = ''
+        self.candidate = ''
+        self.candidate_since = None
+        self.speculation = None
+        self.metrics = get_latency_metrics()
+
+        self.conversation = None
+        if config['memory']['enabled']:
+            summarize = bedrock_summarizer(services) if config['memory']['summarize'] else None
+            self.conversation = Conversation(codec, config['memory']['token_budget'], summarize=summarize)
+        self.bedrock_wrapper = BedrockWrapper(services, self.player, echo=echo, conversation=self.conversation)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loop = None
+        self.closed = False
+
+    def on_transcript(self, results):
         if not self.bedrock_wrapper.is_speaking():
 
             if results:
                 for result in results:
-                    EventHandler.sample_count = 0
-                    if not result.is_partial:
-                        for alt in result.alternatives:
-                            print(alt.transcript, flush=True, end=' ')
-                            EventHandler.text.append(alt.transcript)
-
-            else:
-                EventHandler.sample_count += 1
-                if EventHandler.sample_count == EventHandler.max_sample_counter:
-
-                    if len(EventHandler.text) == 0:
-                        last_speech = config['last_speech']
-                        print(last_speech, flush=True)
-                        aws_polly_tts(last_speech)
-                        os._exit(0)  # exit from a child process
+                    self.sample_count = 0
+                    self.partial_pending = result.is_partial
+                    if result.is_partial:
+                        self.partial = result.alternatives[0].transcript if result.alternatives else ''
                     else:
-                        input_text = ' '.join(EventHandler.text)
-                        printer(f'\n[INFO] User input: {input_text}', 'info')
-
-                        executor = ThreadPoolExecutor(max_workers=1)
-                        # Add executor so Bedrock execution can be shut down, if user input signals so.
-                        UserInputManager.set_executor(executor)
-                        loop.run_in_executor(
-                            executor,
-                            self.bedrock_wrapper.invoke_bedrock,
-                            input_text
-                        )
-
-                    EventHandler.text.clear()
-                    EventHandler.sample_count = 0
-
+                        self.final_at = time.perf_counter()
+                        self.partial = ''
+                        for alt in result.alternatives:
+                            if self.echo:
+                                print(alt.transcript, flush=True, end=' ')
+                            self.text.append(alt.transcript)
+                self.track_candidate()
 
-class MicStream:
+                # The VAD already saw the end of speech and we were only waiting for this final result.
+                if self.end_of_speech and not self.partial_pending and self.text:
+                    self.end_turn()
 
-    async def mic_stream(self):
-        loop = asyncio.get_event_loop()
-        input_queue = asyncio.Queue()
+            else:
+                self.sample_count += 1
+                if self.sample_count == 1:
+                    self.silence_since = time.monotonic()
+                elif time.monotonic() - self.silence_since >= self.silence_timeout:
+                    self.end_turn()
+
+    def track_candidate(self):
+        """What the user has said so far, finals plus the current partial; drops a speculation it no longer matches."""
+        candidate = ' '.join(self.text + [self.partial] if self.partial else self.text)
+        if candidate != self.candidate:
+            self.candidate = candidate
+            self.candidate_since = time.monotonic()
+            if self.speculation is not None and not self.speculation.matches(candidate):
+                self.bedrock_wrapper.discard_speculation(self.speculation)
+                self.speculation = None
+        self.maybe_speculate()
+
+    def maybe_speculate(self):
+        settings = config['speculation']
+        if (not settings['enabled'] or self.speculation is not None or not self.candidate
+                or self.bedrock_wrapper.is_speaking()
+                or time.monotonic() - self.candidate_since < settings['stable_ms'] / 1000):
+            return
+        self.speculation = self.bedrock_wrapper.speculate(self.candidate, tts=settings['tts'])
+
+    def on_speech_start(self):
+        self.end_of_speech = False
+        if config['barge_in']['enabled'] and self.bedrock_wrapper.is_speaking():
+            # Barge-in: the user started talking over the assistant.
+            self.bedrock_wrapper.cancel('barge-in')
+
+    def on_end_of_speech(self):
+        """本地 VAD 偵測到使用者停止說話，不必等 Transcribe 的空白事件"""
+        if self.bedrock_wrapper.is_speaking():
+            return
+        self.speech_end_at = time.perf_counter()
+        if self.text and not self.partial_pending:
+            self.end_turn()
+        else:
+            self.end_of_speech = True
+
+    def end_turn(self):
+        speculation, self.speculation = self.speculation, None
+        if len(self.text) == 0:
+            if speculation is not None:
+                self.bedrock_wrapper.discard_speculation(speculation)
+            last_speech = config['last_speech']
+            if self.echo:
+                print(last_speech, flush=True)
+            self.loop.run_in_executor(self.executor, aws_polly_tts, last_speech, self.services, self.player)
+            self.close()
+        else:
+            input_text = ' '.join(self.text)
+            printer(f'\n[INFO] User input: {input_text}', 'info')
+
+            trace = self.metrics.start_turn(model=codec.model_id)
+            if self.speech_end_at is not None:
+                trace.mark('speech_end', self.speech_end_at)
+            if self.final_at is not None:
+                trace.mark('final_transcript', self.final_at)
+            if speculation is not None and not speculation.matches(input_text):
+                self.bedrock_wrapper.discard_speculation(speculation)
+                speculation = None
+            self.loop.run_in_executor(
+                self.executor,
+                self.bedrock_wrapper.invoke_bedrock,
+                input_text,
+                trace,
+                speculation
+            )
 
-        def callback(indata, frame_count, time_info, status):
-            loop.call_soon_threadsafe(input_queue.put_nowait, (bytes(indata), status))
+        self.text.clear()
+        self.sample_count = 0
+        self.partial_pending = False
+        self.end_of_speech = False
+        self.speech_end_at = None
+        self.final_at = None
+        self.partial = ''
+        self.candidate = ''
+        self.candidate_since = None
 
-        stream = sounddevice.RawInputStream(
-            channels=1, samplerate=16000, callback=callback, blocksize=2048 * 2, dtype="int16")
-        with stream:
-            while True:
-                indata, status = await input_queue.get()
-                yield indata, status
+    def close(self):
+        """Stop sending audio; the Transcribe stream then ends and `run` returns."""
+        self.closed = True
+        if self.speculation is not None:
+            self.bedrock_wrapper.discard_speculation(self.speculation)
+            self.speculation = None
+        if self.conversation is not None:
+            self.conversation.close()
 
     async def write_chunks(self, stream):
-        async for chunk, status in self.mic_stream():
-            await stream.input_stream.send_audio_event(audio_chunk=chunk)
+        vad = None
+        gate = None
+        if config['vad']['enabled']:
+            vad = EnergyVad(hangover_ms=config['vad']['hangover_ms'],
+                            min_threshold_db=config['vad']['min_threshold_db'])
+            if config['vad']['gate']:
+                gate = SilenceGate()
+
+        async for chunk, status in self.audio_source():
+            if self.closed:
+                break
+            # 沒有新的轉錄結果時 partial 也可能已經穩定了
+            self.maybe_speculate()
+            if vad is None:
+                await stream.input_stream.send_audio_event(audio_chunk=chunk)
+                continue
+
+            speaking = config['barge_in']['enabled'] and self.bedrock_wrapper.is_speaking()
+            result = vad.process(chunk, config['barge_in']['echo_margin_db'] if speaking else 0.0)
+            for event, _ in result.events:
+                if event == 'start':
+                    self.on_speech_start()
+                else:
+                    self.on_end_of_speech()
 
-        await stream.input_stream.end_stream()
+            for audio in gate.filter(chunk, result) if gate else [chunk]:
+                await stream.input_stream.send_audio_event(audio_chunk=audio)
 
-    async def basic_transcribe(self):
-        loop.run_in_executor(ThreadPoolExecutor(max_workers=1), UserInputManager.start_user_input_loop)
+        await stream.input_stream.end_stream()
 
-        stream = await transcribe_streaming.start_stream_transcription(
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        stream = await self.services.transcribe.start_stream_transcription(
             language_code="zh-TW",
             media_sample_rate_hz=16000,
             media_encoding="pcm",
         )
 
-        handler = EventHandler(stream.output_stream, BedrockWrapper())
+        handler = EventHandler(stream.output_stream, self)
         await asyncio.gather(self.write_chunks(stream), handler.handle_events())
+        if self.mic is not None:
+            printer(f'[INFO] Capture: {self.mic.capture.stats()}', 'info')
+        # Let the last turn finish speaking before the session is reported done.
+        await self.loop.run_in_executor(None, self.executor.shutdown)
+        if self.metrics.enabled:
+            printer(f'[INFO] Turn latency: {self.metrics.summary()}', 'info')
+        if self.bedrock_wrapper.speculation_stats.started:
+            printer(f'[INFO] Speculation: {self.bedrock_wrapper.speculation_stats.summary()}', 'info')
 
 
 info_text = f'''
@@ -440,10 +744,21 @@ info_text = f'''
 [INFO] Go ahead with the voice chat with Amazon Bedrock!
 *************************************************************
 '''
-print(info_text)
 
-loop = asyncio.get_event_loop()
-try:
-    loop.run_until_complete(MicStream().basic_transcribe())
-except (KeyboardInterrupt, Exception) as e:
-    print()
+
+def main():
+    print(info_text)
+
+    session = VoiceSession(Services.create())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_in_executor(ThreadPoolExecutor(max_workers=1), UserInputManager(session).start_user_input_loop)
+    try:
+        loop.run_until_complete(session.run())
+    except (KeyboardInterrupt, Exception) as e:
+        print()
+    os._exit(0)  # the stdin reader thread never returns on its own
+
+
+if __name__ == '__main__':
+    main()
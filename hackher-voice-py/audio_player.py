@@ -0,0 +1,205 @@
+import threading
+import time
+
+# PortAudio 的初始化與開關裝置不是 thread-safe；PyAudio 與 sounddevice 底下是同一個 PortAudio，
+# 在背景開喇叭、在 event loop 開麥克風時要拿這把鎖
+portaudio_lock = threading.Lock()
+
+
+class RingBuffer:
+    """固定大小的 byte 環形緩衝區，建立時一次配置好記憶體"""
+
+    def __init__(self, capacity):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self.capacity = capacity
+        self._read = 0
+        self.size = 0
+
+    def free(self):
+        return self.capacity - self.size
+
+    def write(self, data):
+        data = memoryview(data)
+        n = min(len(data), self.free())
+        start = (self._read + self.size) % self.capacity
+        first = min(n, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        self._view[:n - first] = data[first:n]
+        self.size += n
+        return n
+
+    def read_into(self, out):
+        n = min(len(out), self.size)
+        first = min(n, self.capacity - self._read)
+        out[:first] = self._view[self._read:self._read + first]
+        out[first:n] = self._view[:n - first]
+        self._read = (self._read + n) % self.capacity
+        self.size -= n
+        return n
+
+    def discard(self, n):
+        n = min(n, self.size)
+        self._read = (self._read + n) % self.capacity
+        self.size -= n
+        return n
+
+    def clear(self):
+        self._read = 0
+        self.size = 0
+
+
+class DeferredPlayer:
+    """
+    Opens the real player on a background thread at startup; the first call that needs the
+    device (`write`, `drain`, `flush`, ...) waits until it is open.
+    """
+
+    def __init__(self, open_player):
+        self._player = None
+        self._error = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._open, args=(open_player,), name='audio-open', daemon=True).start()
+
+    def _open(self, open_player):
+        try:
+            self._player = open_player()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def get(self):
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self._player
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class AudioPlayer:
+    """
+    Long-lived output engine: one callback-mode PyAudio stream per process.
+
+    Callers `write` PCM into a preallocated ring buffer and `drain` at the end of a turn
+    instead of sleeping. The callback waits until `prebuffer_ms` of audio is buffered
+    (jitter buffer) before it starts consuming, and counts an underrun every time the
+    buffer runs dry in the middle of an utterance.
+    """
+
+    def __init__(self, pa, rate=16000, channels=1, sample_width=2,
+                 frames_per_buffer=512, buffer_seconds=4.0, prebuffer_ms=60):
+        import pyaudio
+
+        self.rate = rate
+        self.frame_bytes = channels * sample_width
+        self.bytes_per_second = rate * self.frame_bytes
+        self.prebuffer = int(self.bytes_per_second * prebuffer_ms / 1000) // self.frame_bytes * self.frame_bytes
+        self.underruns = 0
+        self.bytes_played = 0
+
+        self._ring = RingBuffer(int(self.bytes_per_second * buffer_seconds))
+        self._out = bytearray(frames_per_buffer * self.frame_bytes)
+        self._cond = threading.Condition()
+        self._active = False     # an utterance is being written
+        self._primed = False     # jitter buffer filled, callback is consuming
+        self._started = False    # the current utterance has started playing
+        self._starved = False
+        self._draining = False
+        self._generation = 0     # bumped by flush() so blocked writers give up
+
+        self._continue = pyaudio.paContinue
+        self._stream = pa.open(
+            format=pa.get_format_from_width(sample_width),
+            channels=channels,
+            rate=rate,
+            output=True,
+            frames_per_buffer=frames_per_buffer,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        needed = frame_count * self.frame_bytes
+        if len(self._out) < needed:
+            self._out = bytearray(needed)
+        out = memoryview(self._out)[:needed]
+
+        with self._cond:
+            n = 0
+            if self._primed:
+                n = self._ring.read_into(out)
+                self.bytes_played += n
+                self._starved = False
+                if self._ring.size == 0:
+                    self._primed = False
+                self._cond.notify_all()
+            if n < needed and self._started and self._active and not self._draining and not self._starved:
+                # Ran dry in the middle of an utterance: count once per starvation episode.
+                self.underruns += 1
+                self._starved = True
+
+        out[n:] = bytes(needed - n)
+        return bytes(out), self._continue
+
+    def write(self, data):
+        view = memoryview(data)
+        with self._cond:
+            generation = self._generation
+            self._active = True
+            while view:
+                if self._generation != generation:
+                    return
+                n = self._ring.write(view)
+                view = view[n:]
+                if not self._primed and self._ring.size >= min(self.prebuffer, self._ring.capacity):
+                    self._primed = True
+                    self._started = True
+                if view:
+                    self._cond.wait()
+
+    def drain(self, timeout=None):
+        """等待緩衝區播放完畢（取代固定的 time.sleep）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._draining = True
+            if self._ring.size:
+                self._primed = True
+            while self._ring.size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._active = False
+            self._started = False
+            self._draining = False
+
+        # The last callback buffer is still inside the device when the ring is empty.
+        time.sleep(self._stream.get_output_latency())
+
+    def flush(self):
+        """丟棄尚未播放的音訊"""
+        with self._cond:
+            self._generation += 1
+            self._ring.clear()
+            self._primed = False
+            self._active = False
+            self._started = False
+            self._cond.notify_all()
+
+    def buffered_seconds(self):
+        return self._ring.size / self.bytes_per_second
+
+    def stats(self):
+        return {
+            'underruns': self.underruns,
+            'buffered_ms': round(self.buffered_seconds() * 1000, 1),
+            'played_seconds': round(self.bytes_played / self.bytes_per_second, 2),
+        }
+
+    def close(self):
+        self.drain(timeout=self._ring.capacity / self.bytes_per_second)
+        self._stream.stop_stream()
+        self._stream.close()
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Polly 輸出格式 → (synthesize_speech 參數, MIME)。ogg_vorbis 最小但 Safari 不支援；
+# mp3 降到 16 kHz 取樣，檔案比預設的 24 kHz 小
+AUDIO_FORMATS = {
+    'mp3_16k': ({'OutputFormat': 'mp3', 'SampleRate': '16000'}, 'audio/mpeg'),
+    'ogg_vorbis': ({'OutputFormat': 'ogg_vorbis', 'SampleRate': '24000'}, 'audio/ogg'),
+    'mp3': ({'OutputFormat': 'mp3', 'SampleRate': '24000'}, 'audio/mpeg'),
+}
+
+
+class _Clip:
+    """One sentence of audio, filled by a reader thread while any number of requests stream it out."""
+
+    def __init__(self, turn, mime):
+        self.turn = turn
+        self.mime = mime
+        self.created = time.monotonic()
+        self.chunks = []
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def iter_chunks(self, timeout):
+        index = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: index < len(self.chunks) or self.done, timeout):
+                    return
+                chunks = self.chunks[index:]
+                done = self.done
+            index += len(chunks)
+            yield from chunks
+            if done and index >= len(self.chunks):
+                return
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        clip = self.server.owner.clip(self.path.rsplit('/', 1)[-1]) if self.path.startswith('/audio/') else None
+        if clip is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', clip.mime)
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        sent = 0
+        try:
+            for chunk in clip.iter_chunks(self.server.owner.read_timeout):
+                self.wfile.write(b'%X\r\n%s\r\n' % (len(chunk), chunk))
+                sent += len(chunk)
+            if clip.done and clip.error is None:
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                # Polly failed (or stalled) mid-clip: close without the last chunk so the
+                # <audio> element reports an error instead of treating the clip as complete.
+                self.close_connection = True
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.server.owner.served(clip.turn, sent)
+
+    def do_POST(self):
+        # 瀏覽器用 navigator.sendBeacon 回報 time-to-first-audio
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/stats':
+            try:
+                self.server.owner.report(json.loads(body))
+            except (ValueError, TypeError):
+                pass
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AudioStreamServer:
+    """
+    Serves synthesized speech to the browser over chunked HTTP while Polly is still producing it.
+
+    `publish` starts copying a Polly `AudioStream` (or already cached bytes) into a clip and
+    immediately returns its URL, so the page can start downloading and playing the first
+    sentence before synthesis finishes. Audio never goes through Streamlit's websocket or
+    base64. Clips are dropped after `ttl` seconds. Per-turn byte counts are kept here; the
+    browser posts its time to first audio, and each clip it has finished playing, to `stats_url`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, public_url=None, ttl=300.0, chunk_bytes=1024, read_timeout=30.0,
+                 max_turns=50):
+        self.ttl = ttl
+        self.chunk_bytes = chunk_bytes
+        self.read_timeout = read_timeout
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._played = threading.Condition(self._lock)
+        self._clips = OrderedDict()
+        self._turns = OrderedDict()
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self.url = (public_url or f'http://{host}:{self._server.server_address[1]}').rstrip('/')
+        self.stats_url = f'{self.url}/stats'
+        threading.Thread(target=self._server.serve_forever, name='audio-stream', daemon=True).start()
+
+    def start_turn(self, audio_format):
+        turn = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._turns[turn] = {'turn': turn, 'format': audio_format, 'started': time.perf_counter(),
+                                 'clips': 0, 'played': 0, 'bytes': 0, 'bytes_served': 0, 'ttfa_ms': None}
+            while len(self._turns) > self.max_turns:
+                self._turns.popitem(last=False)
+        return turn
+
+    def since_start_ms(self, turn):
+        with self._lock:
+            info = self._turns.get(turn)
+        return round((time.perf_counter() - info['started']) * 1000) if info else 0
+
+    def publish(self, turn, mime, data=None, stream=None, on_complete=None):
+        """Returns the clip's URL. `stream` (anything with `read(n)`) is copied on a background thread."""
+        clip_id = uuid.uuid4().hex
+        clip = _Clip(turn, mime)
+        with self._lock:
+            self._expire()
+            self._clips[clip_id] = clip
+            info = self._turns.get(turn)
+            if info:
+                info['clips'] += 1
+
+        if stream is None:
+            clip.append(bytes(data))
+            self._produced(turn, len(data))
+            clip.finish()
+        else:
+            threading.Thread(target=self._pump, args=(clip, stream, on_complete), name='audio-pump', daemon=True).start()
+        return f'{self.url}/audio/{clip_id}'
+
+    def _pump(self, clip, stream, on_complete):
+        try:
+            while True:
+                chunk = stream.read(self.chunk_bytes)
+                if not chunk:
+                    break
+                clip.append(chunk)
+        except Exception as e:
+            clip.finish(e)
+            return
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        self._produced(clip.turn, clip.size)
+        clip.finish()
+        if on_complete is not None:
+            on_complete(b''.join(clip.chunks))
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._clips:
+            clip_id, clip = next(iter(self._clips.items()))
+            if now - clip.created < self.ttl:
+                break
+            del self._clips[clip_id]
+
+    def clip(self, clip_id):
+        with self._lock:
+            return self._clips.get(clip_id)
+
+    def _produced(self, turn, size):
+        with self._lock:
+            info = self._turns.get(turn)
+            if info:
+                info['bytes'] += size
+
+    def served(self, turn, size):
+        with self._lock:
+            info = self._turns.get(turn)
+            if info:
+                info['bytes_served'] += size
+
+    def report(self, stats):
+        with self._lock:
+            info = self._turns.get(str(stats.get('turn')))
+            if info is None:
+                return
+            if info['ttfa_ms'] is None and stats.get('ttfa_ms') is not None:
+                info['ttfa_ms'] = round(float(stats['ttfa_ms']))
+            if stats.get('played'):
+                info['played'] += 1
+                self._played.notify_all()
+
+    def wait_played(self, turn, timeout=None):
+        """Waits until the browser has finished (or failed) every clip published for `turn`; False on timeout."""
+        def finished():
+            info = self._turns.get(turn)
+            return info is None or info['played'] >= info['clips']
+
+        with self._played:
+            return self._played.wait_for(finished, timeout)
+
+    def turn_stats(self, last=5):
+        with self._lock:
+            turns = list(self._turns.values())[-last:]
+            return [{key: value for key, value in info.items() if key != 'started'} for info in turns]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+_default_server = None
+_default_lock = threading.Lock()
+
+
+def get_audio_stream_server():
+    """
+    整個 process 共用（Streamlit rerun 時模組不會重新載入）。
+    AUDIO_STREAM_HOST / AUDIO_STREAM_PORT 設定監聽位址（預設由系統挑一個空的 port，頁面用的是 `url`）；
+    瀏覽器不在同一台機器時用 AUDIO_STREAM_URL 指定對外網址
+    """
+    global _default_server
+    with _default_lock:
+        if _default_server is None:
+            host = os.getenv('AUDIO_STREAM_HOST', '127.0.0.1')
+            port = int(os.getenv('AUDIO_STREAM_PORT', '0'))
+            public_url = os.getenv('AUDIO_STREAM_URL') or None
+            try:
+                _default_server = AudioStreamServer(host=host, port=port, public_url=public_url)
+            except OSError as e:
+                # 指定的 port 被占用（例如第二個 Streamlit app）；有對外網址時換 port 也沒用
+                if not port or public_url:
+                    raise
+                print(f'Warning: AUDIO_STREAM_PORT {port} is not available ({e}), using a free port.')
+                _default_server = AudioStreamServer(host=host, port=0)
+        return _default_server
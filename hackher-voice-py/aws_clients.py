@@ -0,0 +1,141 @@
+import os
+import threading
+
+# boto3 / botocore 要 100 ms 以上才 import 完，第一次建立 client 時才載入
+
+
+def client_config(**overrides):
+    """
+    botocore settings for every client. Connections stay open in the pool (with TCP
+    keep-alive) between turns, so only the first request of the process pays for DNS,
+    TCP and TLS. Timeouts are short on connect and long enough on read for Bedrock streams.
+    """
+    settings = {
+        'max_pool_connections': int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '32')),
+        'tcp_keepalive': True,
+        'connect_timeout': float(os.getenv('AWS_CONNECT_TIMEOUT', '3')),
+        'read_timeout': float(os.getenv('AWS_READ_TIMEOUT', '60')),
+        'retries': {'mode': os.getenv('AWS_RETRY_MODE', 'standard'), 'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '3'))},
+    }
+    settings.update(overrides)
+    from botocore.config import Config
+    return Config(**settings)
+
+
+def _open_connection(client):
+    """
+    Opens a pooled connection (DNS, TCP, TLS) to the client's endpoint with an unsigned GET
+    that calls no API, so nothing is logged to CloudTrail, counted as an error or retried.
+    """
+    from botocore.awsrequest import AWSRequest
+    # bedrock-runtime 沒有唯讀的 API；直接用 client 自己的連線池發一個不簽章的請求
+    client._endpoint.http_session.send(AWSRequest(method='GET', url=client.meta.endpoint_url).prepare())
+
+
+# 每個服務最便宜的呼叫，只為了建立連線（錯誤回應一樣算數）
+_WARMUPS = {
+    'bedrock-runtime': _open_connection,
+    'polly': lambda client: client.describe_voices(LanguageCode='cmn-CN'),
+    'transcribe': lambda client: client.list_transcription_jobs(MaxResults=1),
+    's3': lambda client: client.list_buckets(),
+}
+
+
+class LazyClient:
+
+    __slots__ = ('_factory', '_service')
+
+    def __init__(self, factory, service):
+        self._factory = factory
+        self._service = service
+
+    def __getattr__(self, name):
+        return getattr(self._factory.client(self._service), name)
+
+
+class ClientFactory:
+    """
+    One boto3 client per service for the whole process (clients are thread-safe), all built
+    from the same session and `client_config()`. Nothing is imported or created until the
+    first client is asked for. `warm()` does that ahead of the first turn and opens a pooled
+    connection to each service. `endpoint_url` points every client at a local stand-in.
+    """
+
+    def __init__(self, region, endpoint_url=None, config=None, session=None):
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self._config = config
+        self._session = session
+        self._lock = threading.Lock()
+        self._streaming_lock = threading.Lock()
+        self._clients = {}
+        self._transcribe_streaming = None
+
+    def _session_locked(self):
+        if self._session is None:
+            import boto3
+            self._session = boto3.session.Session(region_name=self.region)
+            self._config = self._config or client_config()
+        return self._session
+
+    @property
+    def session(self):
+        with self._lock:
+            return self._session_locked()
+
+    def client(self, service):
+        with self._lock:
+            client = self._clients.get(service)
+            if client is None:
+                # session.client 不是 thread-safe，建立時要鎖住
+                client = self._clients[service] = self._session_locked().client(
+                    service, region_name=self.region, endpoint_url=self.endpoint_url, config=self._config)
+            return client
+
+    def lazy(self, service):
+        """Stand-in for `client(service)` that creates the client on its first API call."""
+        return LazyClient(self, service)
+
+    def transcribe_streaming(self):
+        with self._streaming_lock:
+            if self._transcribe_streaming is None:
+                from amazon_transcribe.client import TranscribeStreamingClient
+                self._transcribe_streaming = TranscribeStreamingClient(region=self.region)
+            return self._transcribe_streaming
+
+    def warm(self, services=('bedrock-runtime', 'polly'), background=True):
+        """Resolves credentials and connects to each service; returns the thread when `background`."""
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        def run():
+            self.session.get_credentials()
+            for service in services:
+                try:
+                    _WARMUPS[service](self.client(service))
+                except (BotoCoreError, ClientError, AttributeError):
+                    # AttributeError：botocore 內部的連線池換了位置，就不預熱
+                    pass
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name='aws-warmup', daemon=True)
+        thread.start()
+        return thread
+
+
+_default_factories = {}
+_default_lock = threading.Lock()
+
+
+def get_client_factory(region=None):
+    """每個 region 整個 process 共用一個；AWS_ENDPOINT_URL 把所有 client 指到本機替身，AWS_WARMUP=0 關掉預熱"""
+    region = region or os.getenv('AWS_REGION', 'us-west-2')
+    with _default_lock:
+        factory = _default_factories.get(region)
+        if factory is None:
+            factory = _default_factories[region] = ClientFactory(region,
+                                                                 endpoint_url=os.getenv('AWS_ENDPOINT_URL') or None)
+            if os.getenv('AWS_WARMUP', '1') != '0':
+                factory.warm()
+        return factory
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from cancellation import TurnCancelled
+from tts_cache import normalize_text
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(model_id, body):
+    """model ID + 正規化後的 prompt 與生成參數"""
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    raw = json.dumps([model_id, _normalize(body)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """一個正在進行中的 Bedrock 呼叫，所有相同的請求共用它的結果"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events = []
+        self.done = False
+        self.error = None
+        self.result = None
+        self.followers = 0
+        self.abandoned = False
+        self.upstream = None
+
+
+class BedrockResponseCache:
+    """
+    Response cache in front of Bedrock with TTL, LRU size bound and single-flight.
+
+    Concurrent identical requests share one in-flight call. Streaming responses are
+    recorded chunk by chunk and replayed as the same `{'chunk': {'bytes': ...}}` events
+    that `invoke_model_with_response_stream` yields, so downstream code is unchanged.
+    """
+
+    def __init__(self, ttl=3600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._flights = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _join(self, key, follow=False):
+        """回傳 (cached value, flight, is_leader)；`follow` 時在同一把鎖裡把自己算進 flight 的讀者"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value, None, False
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+            if follow:
+                flight.followers += 1
+            return None, flight, leader
+
+    def _finish(self, key, flight, value=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is None and value is not None:
+                self._store(key, value)
+        with flight.cond:
+            flight.done = True
+            flight.error = error
+            flight.result = value
+            flight.cond.notify_all()
+
+    def get_or_invoke(self, key, invoke):
+        """非串流呼叫：invoke() 的回傳值會被快取"""
+        value, flight, leader = self._join(key)
+        if value is not None:
+            return value
+        if leader:
+            try:
+                value = invoke()
+            except Exception as e:
+                self._finish(key, flight, error=e)
+                raise
+            self._finish(key, flight, value=value)
+            return value
+
+        with flight.cond:
+            while not flight.done:
+                flight.cond.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, open_stream, cancel=None):
+        """
+        串流呼叫：open_stream() 回傳 Bedrock 的 response['body'] event stream.
+
+        Nothing is requested until the returned generator is first iterated. When every
+        reader of a flight has left, the flight is dropped (later identical requests start
+        a new one) and the upstream stream is closed right away, so Bedrock stops
+        generating (and billing) tokens nobody will hear.
+        """
+        value, flight, leader = self._join(key, follow=True)
+        if value is not None:
+            for data in value:
+                yield {'chunk': {'bytes': data}}
+            return
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, open_stream), daemon=True).start()
+        yield from self._follow(key, flight, cancel)
+
+    def _pump(self, key, flight, open_stream):
+        recorded = []
+        try:
+            upstream = open_stream()
+            with flight.cond:
+                flight.upstream = upstream
+                abandoned = flight.abandoned
+            if abandoned:
+                _close(upstream)
+                raise TurnCancelled('all readers cancelled')
+            for event in upstream:
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                data = chunk.get('bytes')
+                recorded.append(data)
+                with flight.cond:
+                    flight.events.append(data)
+                    flight.cond.notify_all()
+                    abandoned = flight.abandoned
+                if abandoned:
+                    raise TurnCancelled('all readers cancelled')
+            if flight.abandoned:
+                # 被關掉的串流可能只是提早結束，不能當成完整的回答快取起來
+                raise TurnCancelled('all readers cancelled')
+        except Exception as e:
+            self._finish(key, flight, error=e)
+            return
+        self._finish(key, flight, value=tuple(recorded))
+
+    def _follow(self, key, flight, cancel=None):
+        i = 0
+        try:
+            while True:
+                with flight.cond:
+                    while i >= len(flight.events) and not flight.done:
+                        if cancel is not None and cancel.is_cancelled():
+                            return
+                        flight.cond.wait(0.05 if cancel is not None else None)
+                    pending = flight.events[i:]
+                    done = flight.done
+                    error = flight.error
+                for data in pending:
+                    if cancel is not None and cancel.is_cancelled():
+                        return
+                    yield {'chunk': {'bytes': data}}
+                i += len(pending)
+                if done and i >= len(flight.events):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self._lock:
+                flight.followers -= 1
+                abandon = flight.followers <= 0 and self._flights.get(key) is flight
+                if abandon:
+                    del self._flights[key]
+            if abandon:
+                with flight.cond:
+                    flight.abandoned = True
+                    upstream = flight.upstream
+                # 還在等第一個 token 的話（例如 model router 的 hedge）也要馬上停掉
+                if upstream is not None:
+                    _close(upstream)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'entries': len(self._entries),
+            }
+
+
+def _close(upstream):
+    if hasattr(upstream, 'close'):
+        upstream.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_bedrock_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = BedrockResponseCache(
+                ttl=int(os.getenv('BEDROCK_CACHE_TTL', '3600')),
+                max_entries=int(os.getenv('BEDROCK_CACHE_ENTRIES', '256')),
+            )
+        return _default_cache
@@ -0,0 +1,67 @@
+import argparse
+import base64
+import json
+import time
+import urllib.request
+
+from audio_stream import AudioStreamServer
+from fakes import FakePolly
+
+SENTENCE = '今天天氣很好，我們去公園散步吧。'
+
+
+def legacy_turn(polly, text):
+    """舊版 app_TTS：整段合成完才 base64 內嵌到 <audio>，再用 st.audio 把同一份音檔送一次"""
+    started = time.perf_counter()
+    audio = polly.synthesize_speech(Text=text, OutputFormat='mp3')['AudioStream'].read()
+    b64 = base64.b64encode(audio).decode()
+    ready = time.perf_counter()
+    return {'first_audio_ms': round((ready - started) * 1000), 'audio_bytes': len(audio),
+            'wire_bytes': len(b64) + len(audio)}
+
+
+def streamed_turn(polly, server, text):
+    started = time.perf_counter()
+    turn = server.start_turn('bench')
+    stream = polly.synthesize_speech(Text=text, OutputFormat='mp3')['AudioStream']
+    url = server.publish(turn, 'audio/mpeg', stream=stream)
+    first = None
+    received = 0
+    with urllib.request.urlopen(url) as response:
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            if first is None:
+                first = time.perf_counter()
+            received += len(chunk)
+    return {'first_audio_ms': round((first - started) * 1000), 'audio_bytes': server.turn_stats(1)[0]['bytes'],
+            'wire_bytes': received}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first audio byte and bytes per turn: inline base64 vs. chunked streaming')
+    parser.add_argument('--sentences', type=int, nargs='+', default=[1, 4, 12], help='reply lengths, in sentences')
+    parser.add_argument('--kbps', type=float, default=32.0, help='modelled bitrate of the Polly output format')
+    parser.add_argument('--polly-latency', type=float, default=0.15, help='time until Polly starts returning audio')
+    parser.add_argument('--polly-speed', type=float, default=8.0, help='audio seconds Polly produces per second')
+    args = parser.parse_args()
+
+    polly = FakePolly(latency=args.polly_latency, seconds_per_char=0.2, bytes_per_second=args.kbps * 1000 / 8,
+                      stream_speed=args.polly_speed)
+    server = AudioStreamServer()
+    try:
+        for sentences in args.sentences:
+            text = SENTENCE * sentences
+            print(json.dumps({
+                'sentences': sentences,
+                'chars': len(text),
+                'legacy': legacy_turn(polly, text),
+                'streamed': streamed_turn(polly, server, text),
+            }))
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+from aws_clients import ClientFactory
+
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Just enough of bedrock-runtime and Polly for invoke_model and synthesize_speech."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body, content_type='application/json', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.service_seconds)
+        self._reply(200, b'{"Voices": []}')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.service_seconds)
+        if self.path == '/v1/speech':
+            self._reply(200, bytes(3200), 'audio/mpeg')
+        else:
+            self._reply(200, json.dumps({'content': [{'type': 'text', 'text': '你好'}]}).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local endpoint. Every new connection costs `connect_rtt` x 2 (TCP + TLS round trips) before the handshake."""
+
+    daemon_threads = True
+
+    def __init__(self, tls_context, connect_rtt, service_seconds):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.tls_context = tls_context
+        self.connect_rtt = connect_rtt
+        self.service_seconds = service_seconds
+        self.connections = 0
+
+    def finish_request(self, request, client_address):
+        self.connections += 1
+        time.sleep(2 * self.connect_rtt)
+        if self.tls_context:
+            request = self.tls_context.wrap_socket(request, server_side=True)
+        super().finish_request(request, client_address)
+
+
+def self_signed_cert(directory):
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1', '-keyout', key, '-out', cert],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+
+def turn(bedrock, polly):
+    started = time.perf_counter()
+    bedrock.invoke_model(modelId=MODEL_ID, body=b'{}')['body'].read()
+    polly.synthesize_speech(Text='你好', VoiceId='Zhiyu', OutputFormat='mp3')['AudioStream'].read()
+    return (time.perf_counter() - started) * 1000
+
+
+def per_turn_clients(endpoint, region, turns):
+    """舊做法：每回合（每次 Streamlit rerun / 每個 Reader）都建新的 client"""
+    latencies = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        bedrock = boto3.client('bedrock-runtime', region_name=region, endpoint_url=endpoint)
+        polly = boto3.client('polly', region_name=region, endpoint_url=endpoint)
+        turn(bedrock, polly)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def shared_clients(endpoint, region, turns, warm):
+    factory = ClientFactory(region, endpoint_url=endpoint)
+    if warm:
+        # 啟動時預熱，不算在第一個回合裡
+        factory.warm(background=False)
+    return [turn(factory.client('bedrock-runtime'), factory.client('polly')) for _ in range(turns)]
+
+
+def report(name, latencies, connections):
+    steady = latencies[1:]
+    return {
+        'clients': name,
+        'first_turn_ms': round(latencies[0], 1),
+        'steady_p50_ms': round(statistics.median(steady), 1) if steady else None,
+        'steady_max_ms': round(max(steady), 1) if steady else None,
+        'connections': connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='First-turn and steady-state latency of per-turn vs. shared, pre-warmed AWS clients')
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--connect-rtt-ms', type=float, default=40.0, help='modelled network round trip for new connections')
+    parser.add_argument('--service-ms', type=float, default=5.0)
+    parser.add_argument('--no-tls', action='store_true', help='plain HTTP (no openssl needed)')
+    args = parser.parse_args()
+
+    # 本機替身不驗證簽章，給假的憑證即可
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    region = 'us-west-2'
+
+    directory = tempfile.mkdtemp(prefix='aws_bench_')
+    try:
+        tls_context, scheme = None, 'http'
+        if not args.no_tls:
+            tls_context, cert = self_signed_cert(directory)
+            os.environ['AWS_CA_BUNDLE'] = cert
+            scheme = 'https'
+
+        server = StandInServer(tls_context, args.connect_rtt_ms / 1000, args.service_ms / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f'{scheme}://localhost:{server.server_address[1]}'
+
+        for name, run in (
+            ('per_turn', lambda: per_turn_clients(endpoint, region, args.turns)),
+            ('shared_cold', lambda: shared_clients(endpoint, region, args.turns, warm=False)),
+            ('shared_warm', lambda: shared_clients(endpoint, region, args.turns, warm=True)),
+        ):
+            before = server.connections
+            latencies = run()
+            print(json.dumps(report(name, latencies, server.connections - before)))
+        server.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
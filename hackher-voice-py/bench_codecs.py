@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+
+from api_request_schema import api_request_list
+from fakes import _stream_chunk
+from model_codecs import codec_class, json_loads
+
+
+def legacy_decode(model_id, raw):
+    """舊版 BedrockModelsWrapper.get_stream_text 的邏輯（每個 chunk 都重新判斷 provider）"""
+    model_provider = model_id.split('.')[0]
+    chunk_obj = json.loads(raw.decode())
+    if model_provider == 'anthropic' and 'claude-3' in model_id:
+        if 'delta' in chunk_obj:
+            if 'text' in chunk_obj['delta']:
+                return chunk_obj['delta']['text']
+        if 'content' in chunk_obj:
+            if isinstance(chunk_obj['content'], list) and chunk_obj['content']:
+                return chunk_obj['content'][0].get('text', '')
+        if 'type' in chunk_obj:
+            if chunk_obj['type'] == 'content_block_delta':
+                return chunk_obj.get('delta', {}).get('text', '')
+        return str(chunk_obj)
+    elif model_provider == 'amazon':
+        return chunk_obj['outputText']
+    elif model_provider == 'meta':
+        return chunk_obj['generation']
+    elif model_provider == 'anthropic':
+        return chunk_obj['completion']
+    elif model_provider == 'cohere':
+        return ' '.join([c["text"] for c in chunk_obj['generations']])
+
+
+def sample_chunks(model_id, count):
+    tokens = ['你好', '，今天', '天氣', '很好', '。', ' The', ' weather', ' is', ' nice', '.']
+    chunks = [_stream_chunk(model_id, tokens[i % len(tokens)])['chunk']['bytes'] for i in range(count)]
+    if 'claude-3' in model_id:
+        # 真實的 Claude 3 串流還有不帶文字的控制事件
+        control = [
+            {'type': 'message_start', 'message': {'id': 'msg', 'role': 'assistant', 'content': [],
+                                                  'usage': {'input_tokens': 12, 'output_tokens': 1}}},
+            {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}},
+            {'type': 'content_block_stop', 'index': 0},
+            {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': count}},
+        ]
+        chunks = [json.dumps(c).encode() for c in control[:2]] + chunks + [json.dumps(c).encode() for c in control[2:]]
+    return chunks
+
+
+def rate(decode, chunks, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for raw in chunks:
+            decode(raw)
+    return round(len(chunks) * repeat / (time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunks decoded per second for each Bedrock provider codec')
+    parser.add_argument('--chunks', type=int, default=500, help='chunks per simulated response')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    for model_id, request in api_request_list.items():
+        chunks = sample_chunks(model_id, args.chunks)
+        cls = codec_class(model_id)
+        print(json.dumps({
+            'model_id': model_id,
+            'codec': cls.__name__,
+            'legacy_chunks_per_s': rate(lambda raw: legacy_decode(model_id, raw), chunks, args.repeat),
+            'codec_json_chunks_per_s': rate(cls(request, loads=json_loads).decode, chunks, args.repeat),
+            'codec_fast_chunks_per_s': rate(cls(request).decode, chunks, args.repeat),
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import random
+import time
+
+from conversation import Conversation, estimate_tokens
+from fakes import FakeBedrockRuntime
+from model_codecs import get_codec
+
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+WORDS = '今天天氣很好我們去公園散步順便聊聊最近的工作和旅行計畫還有想看的電影'
+
+
+def sentence(rng, chars):
+    return ''.join(rng.choice(WORDS) for _ in range(chars)) + '。'
+
+
+def unbounded_body(history, text):
+    """沒有預算的做法：每回合把完整的 messages 重新序列化"""
+    messages = []
+    for user, assistant in history:
+        messages += [{'role': 'user', 'content': user}, {'role': 'assistant', 'content': assistant}]
+    messages.append({'role': 'user', 'content': text})
+    return json.dumps({'max_tokens': 4096, 'temperature': 0.7, 'messages': messages,
+                       'anthropic_version': 'bedrock-2023-05-31'})
+
+
+def time_to_first_token(runtime, codec, body):
+    started = time.perf_counter()
+    events = runtime.invoke_model_with_response_stream(**codec.request_kwargs(body))['body']
+    for event in events:
+        if codec.decode_event(event):
+            break
+    events.close()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt size and time to first token as a conversation grows')
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--every', type=int, default=10, help='measure TTFT every N turns')
+    parser.add_argument('--token-budget', type=int, default=2000)
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=20000,
+                        help='modelled prompt processing speed of the fake model')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    codec = get_codec(MODEL_ID)
+    runtime = FakeBedrockRuntime(first_token_latency=0.05, tokens_per_second=1000,
+                                 prefill_tokens_per_second=args.prefill_tokens_per_second)
+
+    def summarize(previous, turns):
+        prompt = (previous or '') + ''.join(user + assistant for user, assistant in turns)
+        events = runtime.invoke_model_with_response_stream(**codec.request_kwargs(codec.build_body(prompt)))['body']
+        return ''.join(codec.decode_event(event) for event in events)
+
+    conversation = Conversation(codec, args.token_budget, summarize=summarize)
+    history = []
+    for turn in range(1, args.turns + 1):
+        user, assistant = sentence(rng, 40), sentence(rng, 150)
+
+        started = time.perf_counter()
+        naive = unbounded_body(history, user)
+        naive_build = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        budgeted = conversation.build_body(user)
+        budgeted_build = (time.perf_counter() - started) * 1000
+
+        if turn == 1 or turn % args.every == 0:
+            print(json.dumps({
+                'turn': turn,
+                'unbounded_prompt_tokens': estimate_tokens(naive),
+                'budgeted_prompt_tokens': estimate_tokens(budgeted),
+                'unbounded_build_ms': round(naive_build, 3),
+                'budgeted_build_ms': round(budgeted_build, 3),
+                'unbounded_ttft_ms': round(time_to_first_token(runtime, codec, naive)),
+                'budgeted_ttft_ms': round(time_to_first_token(runtime, codec, budgeted)),
+                **conversation.stats(),
+            }))
+
+        history.append((user, assistant))
+        conversation.add_turn(user, assistant)
+
+    conversation.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import io
+import json
+import time
+import wave
+
+import numpy as np
+
+from fakes import FakeS3, FakeTranscribeJobs, FakeTranscribeStreamingClient
+from file_transcribe import SAMPLE_RATE, batch_crossover_seconds, read_wav, transcribe_batch, transcribe_pcm
+
+
+def clip(seconds, seed=0):
+    """`seconds` 長的 16 kHz WAV：像說話的調變雜訊，每 3 秒停頓一下"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2) * (t % 3 < 2.5)
+    samples = (rng.normal(0, 3000, len(t)) * envelope).astype(np.int16)
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+    out.seek(0)
+    return out
+
+
+def legacy_poll(transcribe, job_name):
+    """舊版 process_audio：每 2 秒查一次"""
+    while True:
+        job = transcribe.get_transcription_job(TranscriptionJobName=job_name)['TranscriptionJob']
+        if job['TranscriptionJobStatus'] in ('COMPLETED', 'FAILED'):
+            return job
+        time.sleep(2)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - started) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to transcript for uploaded WAV files: streaming vs. S3 + batch job')
+    parser.add_argument('--seconds', type=float, nargs='+', default=[5, 15, 30], help='clip lengths')
+    parser.add_argument('--speed', type=float, default=2.0, help='streaming pace, times real time (0 = unpaced)')
+    parser.add_argument('--transcribe-latency', type=float, default=0.3, help='streaming result latency')
+    parser.add_argument('--upload-mbps', type=float, default=20.0)
+    parser.add_argument('--job-overhead', type=float, default=8.0, help='batch job queueing and startup, seconds')
+    parser.add_argument('--job-seconds-per-audio-second', type=float, default=0.25)
+    args = parser.parse_args()
+    # FileTranscriber 預設的分界點，用同樣的假設算
+    batch_min_seconds = batch_crossover_seconds(args.speed, args.job_overhead, args.job_seconds_per_audio_second)
+
+    for seconds in args.seconds:
+        audio = clip(seconds)
+        s3 = FakeS3(upload_mbps=args.upload_mbps)
+        jobs = FakeTranscribeJobs(s3, args.job_overhead, args.job_seconds_per_audio_second)
+        streaming = FakeTranscribeStreamingClient(latency=args.transcribe_latency, chunks_per_final=50)
+
+        legacy_ms = timed(lambda: transcribe_batch(s3, jobs, audio, 'bench', poll=legacy_poll))
+        legacy_polls, jobs.polls = jobs.polls, 0
+        backoff_ms = timed(lambda: transcribe_batch(s3, jobs, audio, 'bench'))
+        streaming_ms = timed(lambda: asyncio.run(transcribe_pcm(streaming, read_wav(audio), speed=args.speed)))
+
+        print(json.dumps({
+            'clip_seconds': seconds,
+            'batch_fixed_poll_ms': legacy_ms,
+            'batch_fixed_poll_calls': legacy_polls,
+            'batch_backoff_poll_ms': backoff_ms,
+            'batch_backoff_poll_calls': jobs.polls,
+            'streaming_ms': streaming_ms,
+            'saved_ms': legacy_ms - streaming_ms,
+            'batch_min_seconds': round(batch_min_seconds, 1),
+            'chosen': 'streaming' if seconds < batch_min_seconds else 'batch',
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from lottie_store import ANIMATIONS, STATE_ANIMATIONS, LottieStore
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def legacy_rerun(state):
+    """舊版 app_TTS 每次 rerun：五個檔案全部 json.load，再把選到的那個序列化給前端"""
+    animations = {}
+    for name in ('happy', 'sad', 'neutral', 'talk', 'think'):
+        with open(os.path.join(_HERE, ANIMATIONS[name]), 'r', encoding='utf-8') as f:
+            animations[name] = json.load(f)
+    return json.dumps(animations[STATE_ANIMATIONS[state]])
+
+
+def legacy_payload(name):
+    with open(os.path.join(_HERE, ANIMATIONS[name]), 'r', encoding='utf-8') as f:
+        return json.dumps(json.load(f))
+
+
+def store_rerun(store, state):
+    return json.dumps(store.for_state(state))
+
+
+def per_rerun_ms(fn, states, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for state in states:
+            fn(state)
+    return round((time.perf_counter() - started) * 1000 / (repeat * len(states)), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Animation cost per Streamlit rerun: module-level json.load vs. LottieStore')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    states = ['idle', 'transcribing', 'thinking', 'speaking']
+    cache_dir = tempfile.mkdtemp(prefix='lottie_bench_')
+    try:
+        started = time.perf_counter()
+        LottieStore(cache_dir=cache_dir).for_state('idle')
+        first_process_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        LottieStore(cache_dir=cache_dir).for_state('idle')
+        later_process_ms = (time.perf_counter() - started) * 1000
+
+        store = LottieStore(cache_dir=cache_dir)
+        print(json.dumps({
+            'legacy_rerun_ms': per_rerun_ms(legacy_rerun, states, args.repeat),
+            'store_rerun_ms': per_rerun_ms(lambda state: store_rerun(store, state), states, args.repeat),
+            'first_use_ms_no_cache': round(first_process_ms, 2),
+            'first_use_ms_disk_cache': round(later_process_ms, 2),
+            'source_bytes': sum(os.path.getsize(os.path.join(_HERE, f)) for f in ANIMATIONS.values()),
+            'payload_bytes': {name: len(json.dumps(store.get(name))) for name in ANIMATIONS},
+            'legacy_payload_bytes': {name: len(legacy_payload(name)) for name in ANIMATIONS},
+            'disk_cache_bytes': sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)),
+            **store.stats(),
+        }, indent=2))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
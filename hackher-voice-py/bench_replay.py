@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import bisect
+import json
+import resource
+import time
+
+import numpy as np
+
+import app_or
+from bench_vad import SAMPLE_RATE, load_wav, synthetic_utterance
+from fakes import FakeBedrockRuntime, FakePolly, FakeTranscribeStreamingClient, NullPlayer
+from tts_cache import TtsCache
+from vad import EnergyVad
+
+
+def trim_silence(samples, threshold_db=-45.0, pre_roll_ms=100):
+    """只保留說話的區段（前面留一點 pre-roll），尾端的靜音由 replay 自己補"""
+    vad = EnergyVad()
+    usable = len(samples) // vad.frame_len * vad.frame_len
+    voiced = np.nonzero(vad.frame_energies(samples[:usable]) > threshold_db)[0]
+    if not len(voiced):
+        return samples
+    start = max(0, voiced[0] * vad.frame_len - SAMPLE_RATE * pre_roll_ms // 1000)
+    return samples[start:(voiced[-1] + 1) * vad.frame_len]
+
+
+def wav_caller(utterances, frame_ms, tail_seconds, speech_ends, session_ref, max_answer_seconds=60.0):
+    """
+    Audio source that replays each utterance in real time, in `frame_ms` frames like
+    MicStream, followed by silence. The next utterance starts as soon as the assistant has
+    finished answering, before the silence would make the session say goodbye.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    frame_seconds = frame_ms / 1000
+    silence = bytes(frame * 2)
+
+    async def source():
+        for samples in utterances:
+            for i in range(0, len(samples), frame):
+                chunk = samples[i:i + frame].tobytes()
+                yield chunk.ljust(frame * 2, b'\0'), None
+                await asyncio.sleep(frame_seconds)
+            speech_ends.append(time.monotonic())
+
+            wrapper = session_ref[0].bedrock_wrapper
+            deadline = time.monotonic() + max_answer_seconds
+            waited = 0.0
+            # Silence until the answer has started and finished (or the turn failed).
+            while time.monotonic() < deadline:
+                yield silence, None
+                await asyncio.sleep(frame_seconds)
+                waited += frame_seconds
+                if waited >= tail_seconds and not wrapper.is_speaking():
+                    break
+
+    return source
+
+
+def voice_to_voice(speech_ends, audio_starts):
+    """For each utterance, the first audio written after it ended and before the next one ended."""
+    latencies = []
+    for i, end in enumerate(speech_ends):
+        j = bisect.bisect_left(audio_starts, end)
+        next_end = speech_ends[i + 1] if i + 1 < len(speech_ends) else float('inf')
+        if j < len(audio_starts) and audio_starts[j] < next_end:
+            latencies.append(audio_starts[j] - end)
+    return latencies
+
+
+def percentile(ordered, q):
+    return round(ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] * 1000) if ordered else None
+
+
+async def run(args, utterances, fakes):
+    bedrock, polly, transcribe = fakes
+    services = app_or.Services(
+        bedrock_runtime=bedrock, polly=polly, transcribe=transcribe,
+        tts_cache=TtsCache(cache_dir=None, memory_bytes=0),
+    )
+
+    sessions = []
+    all_ends = []
+    for _ in range(args.sessions):
+        ends = []
+        ref = []
+        source = wav_caller(utterances, app_or.config['capture']['frame_ms'], args.tail_seconds, ends, ref)
+        session = app_or.VoiceSession(services, audio_source=source, player=NullPlayer(), echo=False)
+        ref.append(session)
+        sessions.append(session)
+        all_ends.append(ends)
+
+    await asyncio.gather(*(s.run() for s in sessions))
+
+    latencies = []
+    for session, ends in zip(sessions, all_ends):
+        latencies += voice_to_voice(ends, session.player.turn_start_times)
+    return latencies, [session.bedrock_wrapper.speculation_stats for session in sessions]
+
+
+def speculation_summary(stats):
+    """所有 session 的猜測統計加總"""
+    summaries = [s.summary() for s in stats]
+    total = {key: sum(summary[key] for summary in summaries)
+             for key in ('started', 'committed', 'discarded', 'committed_tokens', 'wasted_tokens')}
+    tokens = total['committed_tokens'] + total['wasted_tokens']
+    saved = sorted(ms for s in stats for ms in s.saved_ms)
+    total['wasted_token_rate'] = round(total['wasted_tokens'] / tokens, 3) if tokens else 0.0
+    total['p50_saved_ms'] = saved[len(saved) // 2] if saved else None
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay WAV files through VoiceSession against local stand-ins for AWS')
+    parser.add_argument('wavs', nargs='*', help='16-bit PCM WAV files, one utterance each (default: synthetic speech)')
+    parser.add_argument('--sessions', type=int, default=1, help='concurrent sessions replaying the same files')
+    parser.add_argument('--tail-seconds', type=float, default=1.0, help='silence after each utterance')
+    parser.add_argument('--transcribe-latency', type=float, default=0.05)
+    parser.add_argument('--transcribe-jitter', type=float, default=0.02)
+    parser.add_argument('--bedrock-latency', type=float, default=0.3)
+    parser.add_argument('--bedrock-jitter', type=float, default=0.1)
+    parser.add_argument('--tokens-per-second', type=float, default=60.0)
+    parser.add_argument('--polly-latency', type=float, default=0.1)
+    parser.add_argument('--polly-jitter', type=float, default=0.05)
+    parser.add_argument('--bedrock-error-rate', type=float, default=0.0)
+    parser.add_argument('--bedrock-stream-error-rate', type=float, default=0.0)
+    parser.add_argument('--polly-error-rate', type=float, default=0.0)
+    parser.add_argument('--transcribe-final-delay', type=float, default=0.0,
+                        help='how long after speech stops Transcribe keeps repeating the partial before the final')
+    parser.add_argument('--revision-rate', type=float, default=0.0, help='chance that the final differs from the last partial')
+    parser.add_argument('--speculate', action='store_true', help='start Bedrock on stable partial transcripts')
+    parser.add_argument('--stable-ms', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    import random
+    random.seed(args.seed)
+
+    if args.wavs:
+        utterances = [trim_silence(load_wav(path)) for path in args.wavs]
+    else:
+        utterances = [trim_silence(synthetic_utterance(seed, speech_seconds=1.0 + 0.5 * seed)) for seed in range(3)]
+
+    # 每個 session 都問一樣的問題，關掉回應快取才量得到 Bedrock 的延遲
+    app_or.config['bedrock']['response_cache'] = False
+    app_or.config['barge_in']['enabled'] = False
+    app_or.config['speculation']['enabled'] = args.speculate
+    app_or.config['speculation']['stable_ms'] = args.stable_ms
+
+    fakes = (
+        FakeBedrockRuntime(first_token_latency=args.bedrock_latency, jitter=args.bedrock_jitter,
+                           tokens_per_second=args.tokens_per_second, error_rate=args.bedrock_error_rate,
+                           stream_error_rate=args.bedrock_stream_error_rate),
+        FakePolly(latency=args.polly_latency, jitter=args.polly_jitter, seconds_per_char=0.05,
+                  error_rate=args.polly_error_rate),
+        FakeTranscribeStreamingClient(latency=args.transcribe_latency, jitter=args.transcribe_jitter,
+                                      chunks_per_final=1000, final_delay=args.transcribe_final_delay,
+                                      revision_rate=args.revision_rate),
+    )
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    latencies, speculation_stats = asyncio.run(run(args, utterances, fakes))
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    turns = args.sessions * len(utterances)
+    latencies.sort()
+    report = {
+        'sessions': args.sessions,
+        'turns': turns,
+        'turns_answered': len(latencies),
+        'bedrock_calls': fakes[0].calls,
+        'polly_calls': fakes[1].calls,
+        'p50_voice_to_voice_ms': percentile(latencies, 50),
+        'p90_voice_to_voice_ms': percentile(latencies, 90),
+        'p99_voice_to_voice_ms': percentile(latencies, 99),
+        'cpu_ms_per_turn': round(cpu / turns * 1000, 1),
+        'wall_seconds': round(wall, 2),
+        # Linux 回報 KiB
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.speculate:
+        report['speculation'] = speculation_summary(speculation_stats)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
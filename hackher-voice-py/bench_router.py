@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import time
+
+import app_or
+from cancellation import CancelToken
+from fakes import FakeBedrockFleet, FakeBedrockRuntime, NullPlayer
+from model_router import ModelRouter
+
+PROMPT = '今天天氣如何？'
+
+
+def percentile(ordered, q):
+    return round(ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] * 1000) if ordered else None
+
+
+def fleet(args, primary, secondary):
+    return FakeBedrockFleet({
+        primary: FakeBedrockRuntime(first_token_latency=args.primary_latency, jitter=args.jitter,
+                                    tokens_per_second=args.tokens_per_second, stall_rate=args.stall_rate,
+                                    stall_seconds=args.stall_seconds),
+        secondary: FakeBedrockRuntime(first_token_latency=args.secondary_latency, jitter=args.jitter,
+                                      tokens_per_second=args.tokens_per_second),
+    })
+
+
+def run(args, scenario, router, primary, secondary):
+    """每回合量到第一個文字 token 的時間；outage 情境中間三分之一的回合 primary 全部被 throttle"""
+    runtime = fleet(args, primary, secondary)
+    services = app_or.Services(bedrock_runtime=runtime, polly=None, transcribe=None, router=router)
+    wrapper = app_or.BedrockWrapper(services, NullPlayer(), echo=False)
+    body = wrapper.build_body(PROMPT)
+
+    ttfts = []
+    failed = 0
+    for turn in range(args.turns):
+        outage = scenario == 'outage' and args.turns // 3 <= turn < 2 * args.turns // 3
+        runtime.models[primary].error_rate = 1.0 if outage else 0.0
+        started = time.perf_counter()
+        first = None
+        try:
+            for event in wrapper.open_stream(PROMPT, body, CancelToken()):
+                if first is None and app_or.codec.decode_event(event):
+                    first = time.perf_counter() - started
+        except Exception:
+            failed += 1
+            continue
+        ttfts.append(first)
+
+    ttfts.sort()
+    result = {
+        'p50_ttft_ms': percentile(ttfts, 50),
+        'p90_ttft_ms': percentile(ttfts, 90),
+        'p99_ttft_ms': percentile(ttfts, 99),
+        'failed_turns': failed,
+        'requests_per_turn': round(runtime.calls / args.turns, 2),
+    }
+    if router is not None:
+        stats = router.stats()
+        result.update({key: stats[key] for key in ('hedged_turns', 'hedge_wins')})
+        result['breaker_trips'] = {model: s['breaker_trips'] for model, s in stats['models'].items()}
+        result['wins'] = {model: s['wins'] for model, s in stats['models'].items()}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first token with and without the model router, against fake models')
+    parser.add_argument('--secondary', default='anthropic.claude-v2:1', help='model asked when the primary is slow or failing')
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--primary-latency', type=float, default=0.2)
+    parser.add_argument('--secondary-latency', type=float, default=0.35)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--stall-rate', type=float, default=0.1, help='share of primary requests with a slow first token')
+    parser.add_argument('--stall-seconds', type=float, default=2.0)
+    parser.add_argument('--tokens-per-second', type=float, default=500.0)
+    parser.add_argument('--hedge-ms', type=float, default=600.0, help='hedge delay until the primary has enough samples')
+    parser.add_argument('--cooldown', type=float, default=2.0, help='circuit breaker cooldown')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app_or.config['bedrock']['response_cache'] = False
+    primary = app_or.codec.model_id
+
+    for scenario in ('tail', 'outage'):
+        modes = {
+            'direct': None,
+            'router': ModelRouter([primary, args.secondary], hedge_ms=args.hedge_ms, cooldown=args.cooldown),
+        }
+        print(json.dumps({
+            'scenario': scenario,
+            'primary': primary,
+            'secondary': args.secondary,
+            **{mode: run(args, scenario, router, primary, args.secondary) for mode, router in modes.items()},
+        }))
+
+
+if __name__ == '__main__':
+    main()
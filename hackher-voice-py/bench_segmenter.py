@@ -0,0 +1,106 @@
+import argparse
+import json
+import re
+import time
+
+from tts_pipeline import POLLY_MAX_CHARS, SentenceSegmenter
+
+ZH = '好的，我來說明一下。今天台北的天氣晴朗，氣溫大約二十五度，午後可能有雷陣雨！出門記得帶傘，好嗎？'
+EN = 'Sure, here is the forecast. Pi is about 3.14, and it is sunny today! Do you need an umbrella? Maybe later. '
+# 沒有標點的長回答（例如列表或程式碼），考驗每個 token 都重掃整個緩衝區的寫法
+RUN_ON = '這段回答完全沒有標點符號所以緩衝區會一直變長'
+
+_SENTENCE_END = re.compile(r'(?:[。！？]+|[.!?]+(?=\s))\s*')
+
+
+class LegacyDotSplit:
+    """舊版 to_audio_generator：只認英文句點，每個 token 都 split 好幾次、prefix 一直串接"""
+
+    def __init__(self):
+        self.prefix = ''
+
+    def feed(self, text):
+        if '.' in text:
+            a = text.split('.')[:-1]
+            to_polly = ''.join([self.prefix, '.'.join(a), '. '])
+            self.prefix = text.split('.')[-1]
+            return [to_polly]
+        self.prefix = ''.join([self.prefix, text])
+        return []
+
+    def flush(self):
+        return f'{self.prefix}.' if self.prefix else ''
+
+
+class LegacySentenceBuffer:
+    """舊版 streaming_reply.SentenceBuffer：每個 token 都重掃整個緩衝區，每句一個 Polly 請求"""
+
+    def __init__(self):
+        self._text = ''
+
+    def feed(self, token):
+        self._text += token
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._text):
+            sentences.append(self._text[start:match.end()])
+            start = match.end()
+        self._text = self._text[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._text = self._text, ''
+        return rest
+
+
+def tokenize(text, token_chars):
+    return [text[i:i + token_chars] for i in range(0, len(text), token_chars)]
+
+
+def measure(segmenter, tokens, tokens_per_second):
+    segments = []
+    first_at = None
+    started = time.perf_counter()
+    for i, token in enumerate(tokens):
+        for segment in segmenter.feed(token):
+            if first_at is None:
+                first_at = i + 1
+            segments.append(segment)
+    rest = segmenter.flush()
+    if rest.strip():
+        segments.append(rest)
+        if first_at is None:
+            first_at = len(tokens)
+    elapsed = time.perf_counter() - started
+    chars = sum(len(t) for t in tokens)
+    return {
+        'segments': len(segments),
+        'first_segment_chars': len(segments[0]) if segments else 0,
+        # 依 Bedrock 的生成速度，第一段可以送去 Polly 的時間
+        'first_segment_ms': round(first_at / tokens_per_second * 1000) if first_at else None,
+        'max_segment_chars': max((len(s) for s in segments), default=0),
+        'over_polly_limit': sum(len(s) > POLLY_MAX_CHARS for s in segments),
+        'mchars_per_second': round(chars / elapsed / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Segmenting a streamed answer for Polly: legacy splitters vs. SentenceSegmenter')
+    parser.add_argument('--chars', type=int, nargs='+', default=[1000, 10000, 100000], help='answer lengths')
+    parser.add_argument('--token-chars', type=int, default=3)
+    parser.add_argument('--tokens-per-second', type=float, default=60.0)
+    args = parser.parse_args()
+
+    splitters = {'dot_split': LegacyDotSplit, 'sentence_buffer': LegacySentenceBuffer, 'segmenter': SentenceSegmenter}
+    for name, sample in (('zh', ZH), ('en', EN), ('run_on', RUN_ON)):
+        for chars in args.chars:
+            tokens = tokenize((sample * (chars // len(sample) + 1))[:chars], args.token_chars)
+            print(json.dumps({
+                'text': name,
+                'chars': chars,
+                **{key: measure(make(), tokens, args.tokens_per_second) for key, make in splitters.items()},
+            }))
+
+
+if __name__ == '__main__':
+    main()
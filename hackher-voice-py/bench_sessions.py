@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+import app_or
+from fakes import FakeBedrockRuntime, FakePolly, FakeTranscribeStreamingClient, NullPlayer
+from tts_cache import TtsCache
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 2048 * 2  # MicStream 的 blocksize
+
+
+def scripted_caller(turns, speech_seconds, silence_seconds, speech_ends, seed):
+    """Audio source for one session: `turns` utterances separated by silence, paced in real time."""
+    rng = np.random.default_rng(seed)
+    chunk_seconds = CHUNK_SAMPLES / SAMPLE_RATE
+
+    async def source():
+        for _ in range(turns):
+            for _ in range(int(speech_seconds / chunk_seconds)):
+                yield rng.normal(0, 3000, CHUNK_SAMPLES).astype(np.int16).tobytes(), None
+                await asyncio.sleep(chunk_seconds)
+            speech_ends.append(time.monotonic())
+            for _ in range(int(silence_seconds / chunk_seconds)):
+                yield bytes(CHUNK_SAMPLES * 2), None
+                await asyncio.sleep(chunk_seconds)
+
+    return source
+
+
+async def run_sessions(args):
+    services = app_or.Services(
+        bedrock_runtime=FakeBedrockRuntime(first_token_latency=args.bedrock_latency),
+        polly=FakePolly(latency=args.polly_latency, seconds_per_char=0.05),
+        transcribe=FakeTranscribeStreamingClient(latency=args.transcribe_latency, chunks_per_final=1000),
+        # Every session asks the same question, so keep the caches out of the measurement.
+        tts_cache=TtsCache(cache_dir=None, memory_bytes=0),
+    )
+
+    sessions = []
+    speech_ends = []
+    for i in range(args.sessions):
+        ends = []
+        player = NullPlayer()
+        source = scripted_caller(args.turns, args.speech_seconds, args.silence_seconds, ends, seed=i)
+        sessions.append(app_or.VoiceSession(services, audio_source=source, player=player, echo=False))
+        speech_ends.append(ends)
+
+    await asyncio.gather(*(s.run() for s in sessions))
+
+    latencies = []
+    for session, ends in zip(sessions, speech_ends):
+        for end, first_audio in zip(ends, session.player.turn_start_times):
+            latencies.append(first_audio - end)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run N voice sessions on one event loop against local stand-ins')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--speech-seconds', type=float, default=1.5)
+    parser.add_argument('--silence-seconds', type=float, default=2.5,
+                        help='pause after each utterance, counted from the end of speech; the answer plays during it, '
+                             f'and if more than VoiceSession.silence_timeout ({app_or.VoiceSession.silence_timeout:g} s) '
+                             'of it is left once the answer ends, the session says goodbye')
+    parser.add_argument('--transcribe-latency', type=float, default=0.05)
+    parser.add_argument('--bedrock-latency', type=float, default=0.3)
+    parser.add_argument('--polly-latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    app_or.config['bedrock']['response_cache'] = False
+    app_or.config['barge_in']['enabled'] = False
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    latencies = asyncio.run(run_sessions(args))
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    latencies.sort()
+    cores = cpu / wall
+    print(json.dumps({
+        'sessions': args.sessions,
+        'turns_completed': len(latencies),
+        'cpu_seconds': round(cpu, 2),
+        'wall_seconds': round(wall, 2),
+        'cpu_cores_used': round(cores, 3),
+        'sessions_per_core': round(args.sessions / cores, 1) if cores else None,
+        'p50_voice_to_voice_ms': round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+        'p95_voice_to_voice_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000) if latencies else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 從 process 啟動到可以開始聽使用者說話；麥克風與喇叭的裝置在背景開
+READY = '''
+import time
+started = time.perf_counter()
+import app_or
+services = app_or.Services.create()
+session = app_or.VoiceSession(services)
+ready = time.perf_counter()
+services.player.get()
+print(round((ready - started) * 1000, 1), round((time.perf_counter() - started) * 1000, 1))
+'''
+
+
+def _env():
+    env = dict(os.environ)
+    # 不連網路：不預熱，假憑證
+    env.setdefault('AWS_WARMUP', '0')
+    env.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    return env
+
+
+def _run(args):
+    return subprocess.run([sys.executable, *args], cwd=_HERE, env=_env(), capture_output=True, text=True, check=True)
+
+
+def import_breakdown(module, top):
+    """`-X importtime` of one import: total ms and the slowest top-level packages (cumulative, ms)"""
+    lines = _run(['-X', 'importtime', '-c', f'import {module}']).stderr.splitlines()
+    packages = {}
+    total = None
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        ms = int(cumulative) / 1000
+        if name == module:
+            total = ms
+        elif '.' not in name:
+            packages[name] = max(ms, packages.get(name, 0))
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return total, {name: round(ms, 1) for name, ms in slowest}
+
+
+def import_ms(module, runs):
+    code = f'import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)'
+    return round(statistics.median(float(_run(['-c', code]).stdout) for _ in range(runs)), 1)
+
+
+def ready_ms(runs):
+    samples = [tuple(map(float, _run(['-c', READY]).stdout.split())) for _ in range(runs)]
+    return (round(statistics.median(s[0] for s in samples), 1),
+            round(statistics.median(s[1] for s in samples), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time and time to ready, to catch startup regressions')
+    parser.add_argument('modules', nargs='*', default=['app_or', 'ws_server', 'file_transcribe', 'lottie_store', 'aws_clients'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='slowest packages to list per module')
+    parser.add_argument('--budget-ms', type=float, default=None, help='exit 1 if importing app_or takes longer')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        _, slowest = import_breakdown(module, args.top)
+        ms = import_ms(module, args.runs)
+        print(json.dumps({'module': module, 'import_ms': ms, 'slowest_packages_ms': slowest}))
+        if module == 'app_or' and args.budget_ms is not None and ms > args.budget_ms:
+            failed = True
+
+    if 'app_or' in args.modules:
+        ready, player = ready_ms(args.runs)
+        print(json.dumps({'app_or_ready_ms': ready, 'audio_output_ready_ms': player}))
+
+    if failed:
+        print(f'app_or import exceeded the {args.budget_ms} ms budget', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import wave
+
+import numpy as np
+
+from vad import EnergyVad, SilenceGate
+
+SAMPLE_RATE = 16000
+BLOCK_SAMPLES = 2048 * 2  # MicStream 的 blocksize (256 ms)
+
+
+def load_wav(path):
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f'{path}: only 16-bit PCM WAV files are supported')
+        rate = f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        if f.getnchannels() > 1:
+            samples = samples.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+    return samples
+
+
+def synthetic_utterance(seed=0, speech_seconds=2.5, silence_seconds=4.0):
+    """Background noise, a speech-like burst (modulated noise), then silence."""
+    rng = np.random.default_rng(seed)
+    lead = rng.normal(0, 60, int(0.8 * SAMPLE_RATE))
+    t = np.arange(int(speech_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    syllables = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    speech = rng.normal(0, 3000, len(t)) * syllables
+    tail = rng.normal(0, 60, int(silence_seconds * SAMPLE_RATE))
+    return np.clip(np.concatenate((lead, speech, tail)), -32768, 32767).astype(np.int16)
+
+
+def oracle_speech_end(samples, frame_ms=20, threshold_db=-35.0):
+    vad = EnergyVad(frame_ms=frame_ms)
+    n = len(samples) // vad.frame_len * vad.frame_len
+    voiced = np.nonzero(vad.frame_energies(samples[:n]) > threshold_db)[0]
+    return (voiced[-1] + 1) * frame_ms / 1000 if len(voiced) else None
+
+
+def run(samples, hangover_ms, transcribe_delay, max_sample_counter=4):
+    block_seconds = BLOCK_SAMPLES / SAMPLE_RATE
+    speech_end = oracle_speech_end(samples)
+
+    vad = EnergyVad(hangover_ms=hangover_ms)
+    gate = SilenceGate(keepalive_s=5.0)
+    vad_end = None
+    for i in range(0, len(samples), BLOCK_SAMPLES):
+        block = samples[i:i + BLOCK_SAMPLES].tobytes()
+        result = vad.process(block)
+        gate.filter(block, result)
+        for event, at in result.events:
+            if event == 'end' and vad_end is None:
+                # The event is only seen once the whole capture block has arrived.
+                vad_end = (i + BLOCK_SAMPLES) / SAMPLE_RATE
+
+    # Current heuristic: Transcribe finalizes the result after its own endpoint delay, then
+    # the handler waits for `max_sample_counter` empty events, one per streamed block.
+    heuristic_end = speech_end + transcribe_delay + max_sample_counter * block_seconds if speech_end else None
+    # With the VAD the turn ends at its end event, but still only once that final result is in
+    # (VoiceSession.on_end_of_speech waits for it), so charge the same endpoint delay here.
+    if speech_end and vad_end:
+        vad_end = max(vad_end, speech_end + transcribe_delay)
+    return {
+        'speech_end_s': speech_end,
+        'heuristic_eot_latency_ms': round((heuristic_end - speech_end) * 1000) if speech_end else None,
+        'vad_eot_latency_ms': round((vad_end - speech_end) * 1000) if speech_end and vad_end else None,
+        'heuristic_bytes_sent': len(samples) * 2,
+        'vad_gated_bytes_sent': gate.bytes_sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare VAD endpointing against the sample_count heuristic')
+    parser.add_argument('wavs', nargs='*', help='16-bit PCM WAV recordings (one utterance each)')
+    parser.add_argument('--hangover-ms', type=int, default=600)
+    parser.add_argument('--transcribe-delay', type=float, default=0.6,
+                        help='modelled delay before Transcribe emits the final result (s)')
+    args = parser.parse_args()
+
+    inputs = [(path, load_wav(path)) for path in args.wavs] or \
+             [(f'synthetic-{seed}', synthetic_utterance(seed, speech_seconds=1.0 + 0.7 * seed)) for seed in range(5)]
+    for name, samples in inputs:
+        print(json.dumps({'file': name, **run(samples, args.hangover_ms, args.transcribe_delay)}))
+
+
+if __name__ == '__main__':
+    main()
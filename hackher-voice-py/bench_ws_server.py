@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from fakes import FakeTranscribeStreamingClient
+from ws_server import TranscribeHub, create_app
+
+CHUNK_SECONDS = 0.25  # recorder.js 每 250ms 送一段
+SAMPLE_RATE = 16000
+
+
+def serve(port, latency):
+    """Run the server with the local Transcribe stand-in; print its CPU time when stdin closes."""
+    from werkzeug.serving import make_server
+
+    hub = TranscribeHub(client=FakeTranscribeStreamingClient(latency=latency))
+    server = make_server('127.0.0.1', port, create_app(hub), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print('ready', flush=True)
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    sys.stdin.readline()
+    print(json.dumps({'cpu': time.process_time() - cpu_start, 'wall': time.monotonic() - wall_start}), flush=True)
+    server.shutdown()
+
+
+def run_client(url, seconds, latencies, errors):
+    import simple_websocket
+
+    chunk = b'\x01\x00' * int(SAMPLE_RATE * CHUNK_SECONDS)
+    sent = {}
+    try:
+        ws = simple_websocket.Client(url)
+    except Exception as e:
+        errors.append(str(e))
+        return
+
+    def receive():
+        try:
+            while True:
+                message = json.loads(ws.receive())
+                last = message.get('text', '').split(' ')[-1]
+                if last.startswith('chunk-'):
+                    n = int(last[len('chunk-'):])
+                    if n in sent:
+                        latencies.append(time.monotonic() - sent.pop(n))
+        except Exception:
+            pass
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+
+    n_chunks = int(seconds / CHUNK_SECONDS)
+    start = time.monotonic()
+    for n in range(1, n_chunks + 1):
+        sent[n] = time.monotonic()
+        ws.send(chunk)
+        # Pace like a real microphone.
+        delay = start + n * CHUNK_SECONDS - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    time.sleep(0.5)
+    ws.close()
+    receiver.join(timeout=1)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket transcription server load test')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5051)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake Transcribe latency (s)')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.latency)
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(args.port), '--latency', str(args.latency)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()
+
+    latencies, errors = [], []
+    url = f'ws://127.0.0.1:{args.port}/ws'
+    clients = [threading.Thread(target=run_client, args=(url, args.seconds, latencies, errors))
+               for _ in range(args.sessions)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+
+    server.stdin.write('\n')
+    server.stdin.flush()
+    usage = json.loads(server.stdout.readline())
+    server.wait()
+
+    cpu_share = usage['cpu'] / usage['wall']
+    print(json.dumps({
+        'sessions': args.sessions,
+        'errors': len(errors),
+        'transcripts': len(latencies),
+        'server_cpu_cores': round(cpu_share, 3),
+        'sessions_per_core': round(args.sessions / cpu_share, 1) if cpu_share else None,
+        'p50_transcript_latency_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_transcript_latency_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import threading
+
+
+class TurnCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one assistant turn.
+
+    Long-running stages (Bedrock stream, Polly requests, playback) either poll
+    `is_cancelled()` or register an `on_cancel` callback that interrupts them, e.g. by
+    closing a stream or flushing the audio buffer.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    def cancel(self, reason=None):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TurnCancelled(self.reason)
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
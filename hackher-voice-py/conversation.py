@@ -0,0 +1,129 @@
+import re
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_CJK = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓字元約一字一 token，其他約四個字元一 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class _Turn:
+    __slots__ = ('user', 'assistant', 'tokens', 'entry')
+
+    def __init__(self, codec, user, assistant):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = estimate_tokens(user) + estimate_tokens(assistant)
+        self.entry = codec.history_entry(user, assistant)
+
+
+class Conversation:
+    """
+    Token-budgeted history of one session.
+
+    Each finished turn is serialized by the model codec exactly once; the history sent with
+    the next request is just the concatenation of those fragments. When the history grows
+    past `token_budget`, the oldest turns are dropped right away, so the next prompt is
+    already within budget, and, if `summarize` is given, folded into a running summary on a
+    background thread. `summarize(previous_summary, [(user, assistant), ...])` returns text.
+    """
+
+    def __init__(self, codec, token_budget=2000, summarize=None, summary_max_tokens=300):
+        self.codec = codec
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+        self._lock = threading.Lock()
+        self._turns = deque()
+        self._tokens = 0
+        self._summary = None
+        self._history = ''
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summarize') if summarize else None
+
+        self.dropped_turns = 0
+        self.summaries = 0
+        self.summary_errors = 0
+
+    def build_body(self, text, codec=None):
+        """`codec` builds the body for another model (model routing); its history format may differ."""
+        codec = codec or self.codec
+        with self._lock:
+            if type(codec) is type(self.codec):
+                history = self._history
+            else:
+                turns = ([self._summary] if self._summary else []) + list(self._turns)
+                history = ''.join(codec.history_entry(turn.user, turn.assistant) for turn in turns)
+        return codec.build_body(text, history)
+
+    def add_turn(self, user, assistant):
+        # 被打斷、沒有任何回答的回合不記錄（Claude 的 messages 必須 user/assistant 交替）
+        if not user or not assistant:
+            return
+        turn = _Turn(self.codec, user, assistant)
+        with self._lock:
+            self._turns.append(turn)
+            self._tokens += turn.tokens
+            evicted = self._evict()
+            self._rebuild()
+        self._fold_later(evicted)
+
+    def _evict(self):
+        evicted = []
+        summary_tokens = self._summary.tokens if self._summary else 0
+        while self._turns and self._tokens + summary_tokens > self.token_budget:
+            turn = self._turns.popleft()
+            self._tokens -= turn.tokens
+            evicted.append(turn)
+        self.dropped_turns += len(evicted)
+        return evicted
+
+    def _rebuild(self):
+        parts = [turn.entry for turn in self._turns]
+        if self._summary:
+            parts.insert(0, self._summary.entry)
+        self._history = ''.join(parts)
+
+    def _fold_later(self, evicted):
+        if evicted and self._executor is not None:
+            self._executor.submit(self._fold, evicted)
+
+    def _fold(self, evicted):
+        with self._lock:
+            previous = self._summary.assistant if self._summary else None
+        try:
+            text = self.summarize(previous, [(turn.user, turn.assistant) for turn in evicted])
+        except Exception:
+            self.summary_errors += 1
+            return
+        if not text:
+            return
+        # 摘要本身也有上限，避免它慢慢吃掉整個預算
+        while estimate_tokens(text) > self.summary_max_tokens:
+            text = text[:len(text) * 3 // 4]
+
+        with self._lock:
+            self._summary = _Turn(self.codec, '（先前對話的摘要）', text)
+            self.summaries += 1
+            more = self._evict()
+            self._rebuild()
+        self._fold_later(more)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'turns': len(self._turns),
+                'history_tokens': self._tokens + (self._summary.tokens if self._summary else 0),
+                'dropped_turns': self.dropped_turns,
+                'summaries': self.summaries,
+                'summary_errors': self.summary_errors,
+            }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
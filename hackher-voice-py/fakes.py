@@ -0,0 +1,386 @@
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+import urllib.parse
+import wave
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from botocore.exceptions import ClientError
+
+from conversation import estimate_tokens
+
+
+def _maybe_fail(rate, operation):
+    """Error injection: raise a throttling error with probability `rate`."""
+    if rate and random.random() < rate:
+        raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Injected by fakes.py'}}, operation)
+
+
+def _is_silent(audio_chunk, silence_db):
+    samples = np.frombuffer(audio_chunk, dtype=np.int16).astype(np.float32)
+    if not len(samples):
+        return True
+    rms = np.sqrt(np.mean(samples * samples)) / 32768.0
+    return 20.0 * np.log10(max(rms, 1e-6)) < silence_db
+
+
+def _transcript_event(results):
+    return SimpleNamespace(transcript=SimpleNamespace(results=results))
+
+
+def _result(text, is_partial, result_id):
+    return SimpleNamespace(
+        result_id=result_id,
+        is_partial=is_partial,
+        alternatives=[SimpleNamespace(transcript=text)],
+    )
+
+
+class _FakeInputStream:
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def send_audio_event(self, audio_chunk):
+        await self._stream._on_audio(audio_chunk)
+
+    async def end_stream(self):
+        await self._stream._pending.put(None)
+
+
+class _FakeTranscribeStream:
+    """
+    Emits one partial result per audio chunk ("chunk-<n>") and a final result every
+    `chunks_per_final` chunks or `final_delay` seconds into the silence (below `silence_db`)
+    after speech; until then the last partial is repeated. With probability `revision_rate`
+    the final differs from that partial. Further silent chunks produce events with empty
+    results, like Transcribe while nobody speaks.
+    """
+
+    def __init__(self, latency, jitter, chunks_per_final, silence_db=-45.0, final_delay=0.0, revision_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks_per_final = chunks_per_final
+        self.silence_db = silence_db
+        self.final_delay = final_delay
+        self.revision_rate = revision_rate
+        self.input_stream = _FakeInputStream(self)
+        self.output_stream = self._events()
+        self._pending = asyncio.Queue()
+        self._chunks = 0
+        self._last_due = 0.0
+        self._words = []
+        self._final_due = None
+
+    async def _on_audio(self, audio_chunk):
+        self._chunks += 1
+        due = time.monotonic() + self.latency + random.uniform(0, self.jitter)
+        self._last_due = max(due, self._last_due)
+        silent = not any(audio_chunk) or _is_silent(audio_chunk, self.silence_db)
+        await self._pending.put((self._last_due, self._chunks, silent))
+
+    async def _events(self):
+        while True:
+            item = await self._pending.get()
+            if item is None:
+                if self._words:
+                    yield _transcript_event([_result(' '.join(self._words), False, 'final')])
+                return
+            due, n, silent = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if silent:
+                # Speech just stopped: finalize what we have, like Transcribe's own endpointing.
+                if self._words:
+                    text = ' '.join(self._words)
+                    if self._final_due is None:
+                        self._final_due = due + self.final_delay
+                    if due < self._final_due:
+                        yield _transcript_event([_result(text, True, f'r{n}')])
+                        continue
+                    if self.revision_rate and random.random() < self.revision_rate:
+                        # 最後一個字聽錯了：final 與之前的 partial 不同
+                        text = f'{text}-revised'
+                    self._words = []
+                    self._final_due = None
+                    yield _transcript_event([_result(text, False, f'r{n}')])
+                else:
+                    yield _transcript_event([])
+                continue
+
+            self._final_due = None
+            self._words.append(f'chunk-{n}')
+            text = ' '.join(self._words)
+            if n % self.chunks_per_final == 0:
+                self._words = []
+                yield _transcript_event([_result(text, False, f'r{n}')])
+            else:
+                yield _transcript_event([_result(text, True, f'r{n}')])
+
+
+class FakeTranscribeStreamingClient:
+    """Drop-in for amazon_transcribe.client.TranscribeStreamingClient."""
+
+    def __init__(self, latency=0.05, jitter=0.0, chunks_per_final=8, silence_db=-45.0, error_rate=0.0,
+                 final_delay=0.0, revision_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks_per_final = chunks_per_final
+        self.silence_db = silence_db
+        self.error_rate = error_rate
+        self.final_delay = final_delay
+        self.revision_rate = revision_rate
+
+    async def start_stream_transcription(self, language_code=None, media_sample_rate_hz=None,
+                                         media_encoding=None, **kwargs):
+        _maybe_fail(self.error_rate, 'StartStreamTranscription')
+        return _FakeTranscribeStream(self.latency, self.jitter, self.chunks_per_final, self.silence_db,
+                                     self.final_delay, self.revision_rate)
+
+
+class FakeS3:
+    """Drop-in for the S3 client's `upload_fileobj`, at `upload_mbps` megabits per second."""
+
+    def __init__(self, upload_mbps=20.0, latency=0.1):
+        self.upload_mbps = upload_mbps
+        self.latency = latency
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key, **kwargs):
+        data = fileobj.read()
+        time.sleep(self.latency + len(data) * 8 / (self.upload_mbps * 1e6))
+        self.objects[f's3://{bucket}/{key}'] = data
+
+
+class FakeTranscribeJobs:
+    """
+    Drop-in for the batch `transcribe` client. A job completes `job_overhead` seconds plus
+    `seconds_per_audio_second` per second of audio after it was started (WAVs uploaded to `s3`).
+    The transcript is served from a data: URI.
+    """
+
+    def __init__(self, s3, job_overhead=8.0, seconds_per_audio_second=0.25):
+        self.s3 = s3
+        self.job_overhead = job_overhead
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.polls = 0
+        self._jobs = {}
+
+    def start_transcription_job(self, TranscriptionJobName, Media, MediaFormat=None, LanguageCode=None, **kwargs):
+        with wave.open(io.BytesIO(self.s3.objects[Media['MediaFileUri']]), 'rb') as f:
+            duration = f.getnframes() / f.getframerate()
+        self._jobs[TranscriptionJobName] = time.monotonic() + self.job_overhead + duration * self.seconds_per_audio_second
+        return {'TranscriptionJob': {'TranscriptionJobName': TranscriptionJobName, 'TranscriptionJobStatus': 'IN_PROGRESS'}}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        self.polls += 1
+        job = {'TranscriptionJobName': TranscriptionJobName, 'TranscriptionJobStatus': 'IN_PROGRESS'}
+        if time.monotonic() >= self._jobs[TranscriptionJobName]:
+            body = json.dumps({'results': {'transcripts': [{'transcript': TranscriptionJobName}]}})
+            job['TranscriptionJobStatus'] = 'COMPLETED'
+            job['Transcript'] = {'TranscriptFileUri': 'data:application/json,' + urllib.parse.quote(body)}
+        return {'TranscriptionJob': job}
+
+
+def _stream_chunk(model_id, text):
+    provider = model_id.split('.')[0]
+    if provider == 'anthropic' and 'claude-3' in model_id:
+        obj = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}}
+    elif provider == 'amazon':
+        obj = {'outputText': text}
+    elif provider == 'meta':
+        obj = {'generation': text}
+    elif provider == 'anthropic':
+        obj = {'completion': text}
+    else:
+        obj = {'generations': [{'text': text}]}
+    return {'chunk': {'bytes': json.dumps(obj, ensure_ascii=False).encode('utf-8')}}
+
+
+class _FakeEventStream:
+
+    def __init__(self, events):
+        self._events = events
+        self.closed = False
+
+    def __iter__(self):
+        for event in self._events:
+            if self.closed:
+                return
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrockRuntime:
+    """
+    Drop-in for the `bedrock-runtime` client. The answer is streamed token by token after
+    `first_token_latency` seconds, at `tokens_per_second`. With `prefill_tokens_per_second`
+    the first token is additionally delayed in proportion to the prompt length.
+    `error_rate` fails the request itself, `stream_error_rate` fails it halfway through the answer.
+    With probability `stall_rate` the first token takes `stall_seconds` longer (tail latency).
+    """
+
+    def __init__(self, response_text='這是一個測試回答。它有好幾個句子。謝謝你的提問。',
+                 first_token_latency=0.3, tokens_per_second=60.0, jitter=0.0, token_chars=3,
+                 prefill_tokens_per_second=None, error_rate=0.0, stream_error_rate=0.0, stall_rate=0.0,
+                 stall_seconds=2.0):
+        self.response_text = response_text
+        self.first_token_latency = first_token_latency
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.token_chars = token_chars
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _tokens(self):
+        text = self.response_text
+        return [text[i:i + self.token_chars] for i in range(0, len(text), self.token_chars)]
+
+    def _prefill(self, body):
+        if not self.prefill_tokens_per_second or not body:
+            return 0.0
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        return estimate_tokens(body) / self.prefill_tokens_per_second
+
+    def _generate(self, model_id, body=None):
+        stall = self.stall_seconds if self.stall_rate and random.random() < self.stall_rate else 0.0
+        time.sleep(self.first_token_latency + self._prefill(body) + random.uniform(0, self.jitter) + stall)
+        tokens = self._tokens()
+        fail_at = len(tokens) // 2 if self.stream_error_rate and random.random() < self.stream_error_rate else None
+        for i, token in enumerate(tokens):
+            if i == fail_at:
+                raise ClientError({'Error': {'Code': 'ModelStreamErrorException', 'Message': 'Injected by fakes.py'}},
+                                  'InvokeModelWithResponseStream')
+            if i:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield _stream_chunk(model_id, token)
+
+    def invoke_model_with_response_stream(self, body=None, modelId=None, accept=None, contentType=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        _maybe_fail(self.error_rate, 'InvokeModelWithResponseStream')
+        return {'body': _FakeEventStream(self._generate(modelId, body))}
+
+    def invoke_model(self, body=None, modelId=None, accept=None, contentType=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        _maybe_fail(self.error_rate, 'InvokeModel')
+        time.sleep(self.first_token_latency + self._prefill(body) + len(self._tokens()) / self.tokens_per_second)
+        payload = {'content': [{'type': 'text', 'text': self.response_text}]}
+        return {'body': io.BytesIO(json.dumps(payload, ensure_ascii=False).encode('utf-8'))}
+
+
+class FakeBedrockFleet:
+    """Drop-in for the `bedrock-runtime` client that sends each `modelId` to its own `FakeBedrockRuntime`."""
+
+    def __init__(self, models):
+        self.models = models
+
+    @property
+    def calls(self):
+        return sum(model.calls for model in self.models.values())
+
+    def invoke_model_with_response_stream(self, modelId=None, **kwargs):
+        return self.models[modelId].invoke_model_with_response_stream(modelId=modelId, **kwargs)
+
+    def invoke_model(self, modelId=None, **kwargs):
+        return self.models[modelId].invoke_model(modelId=modelId, **kwargs)
+
+
+class _PacedStream:
+    """AudioStream stand-in that produces `bytes_per_second` bytes per wall-clock second, like Polly streaming."""
+
+    def __init__(self, data, bytes_per_second):
+        self._data = io.BytesIO(data)
+        self._bytes_per_second = bytes_per_second
+        self._started = time.monotonic()
+        self._sent = 0
+
+    def read(self, amt=None):
+        chunk = self._data.read(amt)
+        self._sent += len(chunk)
+        delay = self._started + self._sent / self._bytes_per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakePolly:
+    """
+    Drop-in for the Polly client: silent audio, `seconds_per_char` long per character, 16 kHz
+    PCM unless `bytes_per_second` models a compressed format. With `stream_speed` the
+    AudioStream is produced progressively at that many times real time instead of all at once.
+    """
+
+    def __init__(self, latency=0.1, jitter=0.0, seconds_per_char=0.2, sample_rate=16000, error_rate=0.0,
+                 bytes_per_second=None, stream_speed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_char = seconds_per_char
+        self.sample_rate = sample_rate
+        self.error_rate = error_rate
+        self.bytes_per_second = bytes_per_second or sample_rate * 2
+        self.stream_speed = stream_speed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, Text, OutputFormat='pcm', VoiceId=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        _maybe_fail(self.error_rate, 'SynthesizeSpeech')
+        data = bytes(int(len(Text) * self.seconds_per_char * self.bytes_per_second) // 2 * 2)
+        if self.stream_speed:
+            stream = _PacedStream(data, self.bytes_per_second * self.stream_speed)
+        else:
+            stream = io.BytesIO(data)
+        return {'AudioStream': stream, 'ContentType': 'audio/pcm'}
+
+
+class NullPlayer:
+    """AudioPlayer stand-in. With `realtime`, writes block for as long as the audio would play."""
+
+    def __init__(self, rate=16000, realtime=True):
+        self.bytes_per_second = rate * 2
+        self.realtime = realtime
+        self.bytes_played = 0
+        self.turn_start_times = []  # first write after each drain/flush
+        self._new_turn = True
+        self._flushed = threading.Event()
+
+    def write(self, data):
+        if self._new_turn:
+            self.turn_start_times.append(time.monotonic())
+            self._new_turn = False
+        self.bytes_played += len(data)
+        if self.realtime:
+            self._flushed.wait(len(data) / self.bytes_per_second)
+        self._flushed.clear()
+
+    def drain(self, timeout=None):
+        self._new_turn = True
+
+    def flush(self):
+        self._new_turn = True
+        self._flushed.set()
+
+    def stats(self):
+        return {'underruns': 0, 'played_seconds': round(self.bytes_played / self.bytes_per_second, 2)}
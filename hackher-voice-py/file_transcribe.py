@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import time
+import urllib.request
+import wave
+
+from datetime import datetime
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def read_wav(audio_file, rate=SAMPLE_RATE):
+    """WAV 檔（路徑或 file-like）轉成 16 kHz 單聲道 16-bit PCM bytes"""
+    if hasattr(audio_file, 'seek'):
+        audio_file.seek(0)
+    with wave.open(audio_file, 'rb') as f:
+        width = f.getsampwidth()
+        if width not in _DTYPES:
+            raise ValueError(f'unsupported WAV sample width: {width * 8} bits')
+        channels = f.getnchannels()
+        source_rate = f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=_DTYPES[width]).astype(np.float32)
+    if width == 1:
+        samples = (samples - 128) * 256
+    elif width == 4:
+        samples /= 65536
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if source_rate != rate:
+        positions = np.arange(0, len(samples), source_rate / rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def wav_duration(audio_file):
+    if hasattr(audio_file, 'seek'):
+        audio_file.seek(0)
+    with wave.open(audio_file, 'rb') as f:
+        duration = f.getnframes() / f.getframerate()
+    if hasattr(audio_file, 'seek'):
+        audio_file.seek(0)
+    return duration
+
+
+async def transcribe_pcm(client, pcm, language_code='zh-TW', chunk_ms=100, speed=2.0, rate=SAMPLE_RATE):
+    """
+    Streams 16 kHz PCM to Transcribe and returns the text of all final results.
+
+    Chunks are paced at `speed` times real time against a fixed schedule, so slow sends
+    don't add up; `speed=0` sends as fast as the connection allows.
+    """
+    stream = await client.start_stream_transcription(
+        language_code=language_code,
+        media_sample_rate_hz=rate,
+        media_encoding='pcm',
+    )
+    chunk_bytes = rate * chunk_ms // 1000 * 2
+    interval = chunk_ms / 1000 / speed if speed else 0.0
+
+    async def send():
+        started = time.monotonic()
+        for n, i in enumerate(range(0, len(pcm), chunk_bytes)):
+            await stream.input_stream.send_audio_event(audio_chunk=pcm[i:i + chunk_bytes])
+            delay = started + (n + 1) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await stream.input_stream.end_stream()
+
+    async def receive():
+        finals = []
+        async for event in stream.output_stream:
+            results = getattr(getattr(event, 'transcript', None), 'results', None) or []
+            for result in results:
+                if not result.is_partial and result.alternatives:
+                    finals.append(result.alternatives[0].transcript)
+        return finals
+
+    _, finals = await asyncio.gather(send(), receive())
+    return ' '.join(text for text in finals if text)
+
+
+def poll_transcription_job(transcribe, job_name, first_delay=2.0, backoff=1.5, max_delay=10.0):
+    """Polls a batch job with exponential backoff: only long files use batch jobs, and those take minutes."""
+    delay = first_delay
+    while True:
+        job = transcribe.get_transcription_job(TranscriptionJobName=job_name)['TranscriptionJob']
+        if job['TranscriptionJobStatus'] in ('COMPLETED', 'FAILED'):
+            return job
+        time.sleep(delay)
+        delay = min(delay * backoff, max_delay)
+
+
+def transcribe_batch(s3, transcribe, audio_file, bucket_name, language_code='zh-TW', poll=poll_transcription_job):
+    """S3 上傳 + start_transcription_job，只給很長的檔案用"""
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    file_name = f'audio_{stamp}.wav'
+    audio_file.seek(0)
+    s3.upload_fileobj(audio_file, bucket_name, file_name)
+
+    job_name = f'transcribe_job_{stamp}'
+    transcribe.start_transcription_job(
+        TranscriptionJobName=job_name,
+        Media={'MediaFileUri': f's3://{bucket_name}/{file_name}'},
+        MediaFormat='wav',
+        LanguageCode=language_code,
+    )
+    job = poll(transcribe, job_name)
+    if job['TranscriptionJobStatus'] != 'COMPLETED':
+        raise RuntimeError(job.get('FailureReason', 'transcription job failed'))
+    with urllib.request.urlopen(job['Transcript']['TranscriptFileUri']) as response:
+        return json.loads(response.read().decode('utf-8'))['results']['transcripts'][0]['transcript']
+
+
+def batch_crossover_seconds(speed, batch_overhead, batch_seconds_per_audio_second):
+    """
+    File length from which a batch job beats streaming: streaming takes about
+    `duration / speed`, a batch job `batch_overhead + duration * batch_seconds_per_audio_second`
+    (upload, queueing and processing). Unpaced streaming is never slower.
+    """
+    per_second = (1 / speed if speed else 0.0) - batch_seconds_per_audio_second
+    return batch_overhead / per_second if per_second > 0 else float('inf')
+
+
+class FileTranscriber:
+    """
+    Transcribes an uploaded WAV file.
+
+    Clips up to `batch_min_seconds` go through Transcribe streaming, paced at `speed` times
+    real time, so the text is ready roughly when the audio has been sent instead of after an
+    S3 upload and a batch job. Longer files, or files the streaming path can't handle, use
+    the batch job. Unless set, `batch_min_seconds` is where the two are expected to take
+    equally long (`batch_crossover_seconds`).
+    """
+
+    def __init__(self, streaming_client, s3=None, transcribe=None, bucket_name='hackher', language_code='zh-TW',
+                 speed=None, batch_min_seconds=None, chunk_ms=100, batch_overhead=8.0,
+                 batch_seconds_per_audio_second=0.25):
+        self.streaming_client = streaming_client
+        self.s3 = s3
+        self.transcribe = transcribe
+        self.bucket_name = bucket_name
+        self.language_code = language_code
+        self.speed = float(os.getenv('TRANSCRIBE_FILE_SPEED', 2.0)) if speed is None else speed
+        if batch_min_seconds is None:
+            batch_min_seconds = os.getenv('TRANSCRIBE_BATCH_MIN_SECONDS')
+        self.batch_min_seconds = (float(batch_min_seconds) if batch_min_seconds is not None else
+                                  batch_crossover_seconds(self.speed, batch_overhead, batch_seconds_per_audio_second))
+        self.chunk_ms = chunk_ms
+        self.last_mode = None
+
+    def __call__(self, audio_file):
+        if wav_duration(audio_file) < self.batch_min_seconds:
+            try:
+                pcm = read_wav(audio_file)
+                text = asyncio.run(transcribe_pcm(self.streaming_client, pcm, self.language_code,
+                                                  self.chunk_ms, self.speed))
+                self.last_mode = 'streaming'
+                return text
+            except Exception:
+                if self.s3 is None:
+                    raise
+        self.last_mode = 'batch'
+        return transcribe_batch(self.s3, self.transcribe, audio_file, self.bucket_name, self.language_code)
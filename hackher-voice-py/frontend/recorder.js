@@ -1,19 +1,33 @@
 let mediaRecorder;
     let socket;
+    let finalText = "";
+    let partialText = "";
 
     function startRecording() {
       socket = new WebSocket("ws://localhost:5050/ws");
+      finalText = "";
+      partialText = "";
 
       // WebSocket 打開後處理訊息
       socket.onopen = () => {
         console.log("✅ WebSocket connected!");
       };
 
-      // 接收後端發送的轉錄結果
+      // 接收後端發送的轉錄結果：{"type": "partial" | "final" | "error", "text": ...}
       socket.onmessage = (event) => {
-        const transcription = event.data;
-        console.log("🎤 Transcription result:", transcription);
-        document.getElementById("transcriptionResult").textContent = transcription;  // 更新顯示的轉錄文本
+        const message = JSON.parse(event.data);
+        console.log("🎤 Transcription result:", message);
+        if (message.type === "error") {
+          console.error(message.message);
+          return;
+        }
+        if (message.type === "final") {
+          finalText += message.text + " ";
+          partialText = "";
+        } else {
+          partialText = message.text;
+        }
+        document.getElementById("transcriptionResult").textContent = finalText + partialText;  // 更新顯示的轉錄文本
       };
 
       // 開始錄音
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+
+# 一個回合依序經過的時間點（相對於使用者說完話）
+STAGES = (
+    'speech_end',
+    'final_transcript',
+    'bedrock_request',
+    'first_token',
+    'first_sentence',
+    'first_audio_byte',
+    'playback_start',
+    'playback_end',
+)
+
+# Prometheus histogram bucket bounds (ms)
+PROMETHEUS_BUCKETS = (50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+
+_SUB_BUCKETS = 32
+_LINEAR = 2 * _SUB_BUCKETS
+_MAX_SHIFT = 20
+
+
+class Histogram:
+    """
+    Log-linear histogram in whole milliseconds, in the style of HdrHistogram.
+
+    Values below 64 ms are counted exactly; above that every power of two is split into 32
+    buckets, so any recorded value is off by at most ~3%. Memory is fixed and `record` is O(1).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (_LINEAR + _MAX_SHIFT * _SUB_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(ms):
+        n = int(ms)
+        if n < _LINEAR:
+            return max(n, 0)
+        shift = n.bit_length() - 6
+        if shift > _MAX_SHIFT:
+            return _LINEAR + _MAX_SHIFT * _SUB_BUCKETS - 1
+        return _LINEAR + (shift - 1) * _SUB_BUCKETS + (n >> shift) - _SUB_BUCKETS
+
+    @staticmethod
+    def _bounds(index):
+        if index < _LINEAR:
+            return index, index
+        shift = (index - _LINEAR) // _SUB_BUCKETS + 1
+        mantissa = (index - _LINEAR) % _SUB_BUCKETS + _SUB_BUCKETS
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, ms):
+        self.counts[self._index(ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = max(1, int(round(q / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, high = self._bounds(index)
+                return min(max((low + high) / 2, self.min), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Number of values <= each bound (bucket-accurate), for Prometheus `le` buckets."""
+        out = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self.counts) and self._bounds(index)[1] <= bound:
+                seen += self.counts[index]
+                index += 1
+            out.append(seen)
+        return out
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 1),
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max, 1),
+        }
+
+
+class TurnTrace:
+    """Timestamps of one turn. `mark` keeps the first time a stage is reached; `set` overwrites."""
+
+    __slots__ = ('marks', 'labels')
+
+    def __init__(self, labels):
+        self.marks = {}
+        self.labels = labels
+
+    def mark(self, stage, at=None):
+        if stage not in self.marks:
+            self.marks[stage] = time.perf_counter() if at is None else at
+
+    def set(self, stage, at=None):
+        self.marks[stage] = time.perf_counter() if at is None else at
+
+    def __bool__(self):
+        return True
+
+
+class _NullTrace:
+    """Handed out when metrics are disabled: every call is a no-op."""
+
+    __slots__ = ()
+    marks = {}
+
+    def mark(self, stage, at=None):
+        pass
+
+    def set(self, stage, at=None):
+        pass
+
+    def __bool__(self):
+        return False
+
+
+NULL_TRACE = _NullTrace()
+
+
+class LatencyMetrics:
+    """
+    Per-stage latency histograms for voice turns.
+
+    Every finished turn records each stage's offset from the turn's origin (speech end, or
+    the first stage reached) and appends one JSON line to `jsonl_path`; `prometheus_path`
+    is rewritten in the Prometheus text format (node_exporter textfile collector style).
+    """
+
+    def __init__(self, enabled=True, jsonl_path=None, prometheus_path=None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def start_turn(self, **labels):
+        return TurnTrace(labels) if self.enabled else NULL_TRACE
+
+    def finish(self, trace, cancelled=False):
+        if not trace or not trace.marks:
+            return
+        marks = trace.marks
+        origin = marks.get('speech_end', min(marks.values()))
+        offsets = {stage: round((marks[stage] - origin) * 1000, 1) for stage in STAGES if stage in marks}
+
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            else:
+                for stage, ms in offsets.items():
+                    if stage != 'speech_end':
+                        self.histograms[stage].record(ms)
+            if self.jsonl_path:
+                record = {'time': time.time(), **trace.labels, 'cancelled': cancelled, 'offsets_ms': offsets}
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if self.prometheus_path:
+                tmp = f'{self.prometheus_path}.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(self._prometheus())
+                os.replace(tmp, self.prometheus_path)
+
+    def _prometheus(self):
+        lines = [
+            '# HELP voice_turn_stage_ms Time from end of speech until each stage of a voice turn.',
+            '# TYPE voice_turn_stage_ms histogram',
+        ]
+        for stage, histogram in self.histograms.items():
+            if not histogram.count:
+                continue
+            for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(PROMETHEUS_BUCKETS)):
+                lines.append(f'voice_turn_stage_ms_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'voice_turn_stage_ms_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'voice_turn_stage_ms_sum{{stage="{stage}"}} {histogram.total:.1f}')
+            lines.append(f'voice_turn_stage_ms_count{{stage="{stage}"}} {histogram.count}')
+        lines += [
+            '# HELP voice_turns_cancelled_total Turns cut short by barge-in or user input.',
+            '# TYPE voice_turns_cancelled_total counter',
+            f'voice_turns_cancelled_total {self.cancelled}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def prometheus(self):
+        with self._lock:
+            return self._prometheus()
+
+    def summary(self):
+        with self._lock:
+            return {stage: h.summary() for stage, h in self.histograms.items() if h.count}
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_latency_metrics():
+    """LATENCY_JSONL / LATENCY_PROM 設定輸出檔；LATENCY_METRICS=1 只在記憶體裡統計"""
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            jsonl_path = os.getenv('LATENCY_JSONL')
+            prometheus_path = os.getenv('LATENCY_PROM')
+            enabled = os.getenv('LATENCY_METRICS') == '1' or bool(jsonl_path or prometheus_path)
+            _default_metrics = LatencyMetrics(enabled, jsonl_path, prometheus_path)
+        return _default_metrics
@@ -0,0 +1,129 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson 是選用的，沒裝就用標準庫
+    _loads = json.loads
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+ANIMATIONS = {
+    'happy': 'fire smile.json',
+    'sad': 'fire cry.json',
+    'neutral': 'fire wait.json',
+    'talk': 'fire talk.json',
+    'think': 'fire think.json',
+    'angry': 'fire angry.json',
+}
+
+# 管線狀態 → 顯示的動畫
+STATE_ANIMATIONS = {
+    'idle': 'neutral',
+    'transcribing': 'think',
+    'thinking': 'think',  # 等 Bedrock
+    'speaking': 'talk',  # 播放中
+    'done': 'happy',
+    'error': 'sad',
+}
+
+# 只給編輯器看的欄位，播放時用不到
+_EDITOR_KEYS = frozenset(('nm', 'mn', 'meta'))
+
+
+def minify(node, precision=3):
+    """去掉圖層名稱等編輯器資訊，浮點數四捨五入到 `precision` 位（1/1000 像素看不出差別）"""
+    if isinstance(node, float):
+        value = round(node, precision)
+        return int(value) if value.is_integer() else value
+    if isinstance(node, list):
+        return [minify(item, precision) for item in node]
+    if isinstance(node, dict):
+        return {key: minify(value, precision) for key, value in node.items() if key not in _EDITOR_KEYS}
+    return node
+
+
+class LottieStore:
+    """
+    Lottie animations, loaded on first use and kept for the life of the process.
+
+    The first load of each file minifies it and writes a gzip copy to `cache_dir`, keyed by
+    the source's size and mtime, so later processes skip the minify step and read ~10x fewer
+    bytes. Returned dicts are shared: don't modify them.
+    """
+
+    def __init__(self, directory=_HERE, cache_dir=None, files=None, precision=3):
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.files = dict(ANIMATIONS if files is None else files)
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._loaded = {}
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        with self._lock:
+            animation = self._loaded.get(name)
+            if animation is None:
+                animation = self._loaded[name] = self._load(name)
+            return animation
+
+    def for_state(self, state):
+        return self.get(STATE_ANIMATIONS.get(state, 'neutral'))
+
+    def _cache_path(self, source):
+        info = os.stat(source)
+        stem = os.path.splitext(os.path.basename(source))[0].replace(' ', '_')
+        return os.path.join(self.cache_dir, f'{stem}.{info.st_size}.{info.st_mtime_ns}.p{self.precision}.json.gz')
+
+    def _load(self, name):
+        source = os.path.join(self.directory, self.files[name])
+        cached = self._cache_path(source) if self.cache_dir else None
+        if cached and os.path.exists(cached):
+            try:
+                with gzip.open(cached, 'rb') as f:
+                    animation = _loads(f.read())
+                self.disk_hits += 1
+                return animation
+            except (OSError, ValueError):
+                pass
+
+        self.misses += 1
+        with open(source, 'r', encoding='utf-8') as f:
+            animation = minify(json.load(f), self.precision)
+        if cached:
+            self._write(cached, json.dumps(animation, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        return animation
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(data, 9))
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def stats(self):
+        with self._lock:
+            return {'loaded': sorted(self._loaded), 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_lottie_store():
+    """整個 process 共用（Streamlit rerun 時模組不會重新載入）；LOTTIE_CACHE_DIR 設定壓縮檔位置"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = LottieStore(cache_dir=os.getenv('LOTTIE_CACHE_DIR', os.path.join(_HERE, '.lottie_cache')))
+        return _default_store
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+from audio_player import RingBuffer, portaudio_lock
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest')
+
+
+class MicCapture:
+    """
+    Bounded microphone capture.
+
+    The sounddevice callback copies each block into a preallocated ring buffer instead of an
+    unbounded queue; the event loop is only woken when the consumer is actually waiting.
+    When the ring is full, `overflow` decides whether the oldest buffered audio or the new
+    block is dropped. Overruns, queue depth and callback jitter are counted for tuning.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=50, buffer_ms=2000, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}')
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.frame_seconds = frame_ms / 1000
+        self.overflow = overflow
+
+        frames = max(2, buffer_ms // frame_ms)
+        self._ring = RingBuffer(frames * self.frame_bytes)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._ready = None
+        self._waiting = False
+        self._last_callback = None
+
+        self.callbacks = 0
+        self.overruns = 0           # blocks (or parts of blocks) dropped because the ring was full
+        self.dropped_bytes = 0
+        self.input_overflows = 0    # PortAudio reported that the device itself overflowed
+        self.max_depth = 0
+        self.max_jitter = 0.0
+        self.mean_jitter = 0.0
+
+    def _callback(self, indata, frame_count, time_info, status):
+        now = time.perf_counter()
+        data = memoryview(indata).cast('B')
+        with self._lock:
+            self.callbacks += 1
+            if status and getattr(status, 'input_overflow', False):
+                self.input_overflows += 1
+            if self._last_callback is not None:
+                jitter = abs(now - self._last_callback - frame_count / self.sample_rate)
+                self.max_jitter = max(self.max_jitter, jitter)
+                self.mean_jitter += (jitter - self.mean_jitter) / 64
+            self._last_callback = now
+
+            excess = len(data) - self._ring.free()
+            if excess > 0:
+                self.overruns += 1
+                self.dropped_bytes += min(excess, len(data))
+                if self.overflow == 'drop_newest':
+                    data = data[:len(data) - excess]
+                else:
+                    self._ring.discard(excess)
+            self._ring.write(data)
+            self.max_depth = max(self.max_depth, self._ring.size // self.frame_bytes)
+
+            if self._waiting and self._ring.size >= self.frame_bytes:
+                self._waiting = False
+                self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _open_stream(self):
+        # Importing sounddevice initializes PortAudio; the player may be opening it on another thread.
+        with portaudio_lock:
+            import sounddevice
+            stream = sounddevice.RawInputStream(
+                channels=1, samplerate=self.sample_rate, callback=self._callback,
+                blocksize=self.frame_samples, dtype='int16')
+        return stream
+
+    async def frames(self):
+        """Async generator of (frame bytes, None), each exactly `frame_ms` long."""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        out = bytearray(self.frame_bytes)
+        view = memoryview(out)
+
+        # 等 PortAudio 的鎖時不要卡住 event loop
+        stream = await self._loop.run_in_executor(None, self._open_stream)
+        with stream:
+            while True:
+                with self._lock:
+                    have = self._ring.size >= self.frame_bytes
+                    if have:
+                        self._ring.read_into(view)
+                    else:
+                        self._waiting = True
+                        self._ready.clear()
+                if have:
+                    yield bytes(out), None
+                else:
+                    await self._ready.wait()
+
+    def depth(self):
+        with self._lock:
+            return self._ring.size // self.frame_bytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frame_ms': round(self.frame_seconds * 1000),
+                'callbacks': self.callbacks,
+                'overruns': self.overruns,
+                'dropped_ms': round(self.dropped_bytes / 2 / self.sample_rate * 1000),
+                'input_overflows': self.input_overflows,
+                'queue_depth': self._ring.size // self.frame_bytes,
+                'max_queue_depth': self.max_depth,
+                'mean_jitter_ms': round(self.mean_jitter * 1000, 2),
+                'max_jitter_ms': round(self.max_jitter * 1000, 2),
+            }
@@ -0,0 +1,192 @@
+import copy
+import json
+
+from api_request_schema import api_request_list
+
+
+def json_loads(raw):
+    # json.loads(bytes) 要先偵測編碼，直接 decode 比較快
+    return json.loads(raw.decode() if isinstance(raw, (bytes, bytearray)) else raw)
+
+
+try:
+    import orjson
+    fast_loads = orjson.loads
+except ImportError:  # orjson 是選用的，沒裝就用標準庫
+    fast_loads = json_loads
+
+# Placeholders written into the template once; their JSON form is where the prompt
+# (and the conversation history) is spliced in.
+_PROMPT = '\u0000prompt\u0000'
+_HISTORY = '\u0000history\u0000'
+
+
+def _escape(text):
+    """JSON string contents without the surrounding quotes"""
+    return json.dumps(text)[1:-1]
+
+
+class ModelCodec:
+    """
+    Request body and stream chunk format of one Bedrock model family.
+
+    The request template from `api_request_schema` is copied and serialized once, so
+    `build_body` only JSON-escapes the prompt and splices it in: nothing shared is
+    mutated, and concurrent turns cannot see each other's prompts.
+    """
+
+    def __init__(self, request, loads=None):
+        self.model_id = request['modelId']
+        self.accept = request['accept']
+        self.content_type = request['contentType']
+        self.loads = loads or fast_loads
+        template = json.dumps(self.template(copy.deepcopy(request['body'])))
+        self._prefix, self._suffix = template.split(json.dumps(_PROMPT))
+
+    def template(self, body):
+        body['prompt'] = _PROMPT
+        return body
+
+    def prompt(self, text, history=False):
+        return f'User: {text}\nAssistant:' if history else text
+
+    def history_entry(self, user, assistant):
+        """One finished turn, serialized once; `build_body` takes the concatenation of these."""
+        return _escape(f'User: {user}\nAssistant: {assistant}\n\n')
+
+    def build_body(self, text, history=''):
+        if not history:
+            return ''.join((self._prefix, json.dumps(self.prompt(text)), self._suffix))
+        return ''.join((self._prefix, '"', history, _escape(self.prompt(text, history=True)), '"', self._suffix))
+
+    def request_kwargs(self, body):
+        return {'body': body, 'modelId': self.model_id, 'accept': self.accept, 'contentType': self.content_type}
+
+    def decode(self, raw):
+        """Text carried by one stream chunk (`chunk['bytes']`); '' for control events."""
+        raise NotImplementedError
+
+    def decode_event(self, event):
+        chunk = event.get('chunk')
+        return self.decode(chunk['bytes']) if chunk else ''
+
+    def encode(self, text):
+        """Inverse of `decode`: the chunk object carrying `text`."""
+        raise NotImplementedError
+
+    def encode_event(self, text):
+        return {'chunk': {'bytes': json.dumps(self.encode(text), ensure_ascii=False).encode('utf-8')}}
+
+
+class TitanCodec(ModelCodec):
+
+    def template(self, body):
+        body['inputText'] = _PROMPT
+        return body
+
+    def decode(self, raw):
+        return self.loads(raw).get('outputText') or ''
+
+    def encode(self, text):
+        return {'outputText': text}
+
+
+class ClaudeMessagesCodec(ModelCodec):
+    """Claude 3 Messages API"""
+
+    def __init__(self, request, loads=None):
+        super().__init__(request, loads)
+        # 歷史訊息插在 messages 陣列的開頭
+        self._head, self._middle = self._prefix.split(json.dumps(_HISTORY) + ', ')
+
+    def template(self, body):
+        body['messages'] = [_HISTORY, {'role': 'user', 'content': _PROMPT}]
+        return body
+
+    def history_entry(self, user, assistant):
+        return ''.join((json.dumps({'role': 'user', 'content': user}), ', ',
+                        json.dumps({'role': 'assistant', 'content': assistant}), ', '))
+
+    def build_body(self, text, history=''):
+        return ''.join((self._head, history, self._middle, json.dumps(text), self._suffix))
+
+    def decode(self, raw):
+        # message_start / content_block_stop / message_delta ... 不帶文字，不必解析
+        if b'content_block_delta' not in raw:
+            return ''
+        return self.loads(raw)['delta'].get('text') or ''
+
+    def encode(self, text):
+        return {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}}
+
+
+class ClaudeTextCodec(ModelCodec):
+    """Claude 1 / 2 Text Completions API"""
+
+    def prompt(self, text, history=False):
+        return f'\n\nHuman: {text}\n\nAssistant:'
+
+    def history_entry(self, user, assistant):
+        return _escape(f'\n\nHuman: {user}\n\nAssistant: {assistant}')
+
+    def decode(self, raw):
+        return self.loads(raw).get('completion') or ''
+
+    def encode(self, text):
+        return {'completion': text}
+
+
+class LlamaCodec(ModelCodec):
+
+    def decode(self, raw):
+        return self.loads(raw).get('generation') or ''
+
+    def encode(self, text):
+        return {'generation': text}
+
+
+class CohereCodec(ModelCodec):
+
+    def decode(self, raw):
+        return ' '.join(g['text'] for g in self.loads(raw).get('generations', ()))
+
+    def encode(self, text):
+        return {'generations': [{'text': text}]}
+
+
+class TranslatedStream:
+    """Another model's event stream re-encoded in `target`'s chunk format; control events are dropped."""
+
+    def __init__(self, stream, source, target):
+        self.stream = stream
+        self.source = source
+        self.target = target
+
+    def __iter__(self):
+        for event in self.stream:
+            text = self.source.decode_event(event)
+            if text:
+                yield self.target.encode_event(text)
+
+    def close(self):
+        self.stream.close()
+
+
+def codec_class(model_id):
+    provider = model_id.split('.')[0]
+    if provider == 'anthropic':
+        return ClaudeMessagesCodec if 'claude-3' in model_id else ClaudeTextCodec
+    try:
+        return {'amazon': TitanCodec, 'meta': LlamaCodec, 'cohere': CohereCodec}[provider]
+    except KeyError:
+        raise ValueError(f'Unknown model provider: {provider}') from None
+
+
+CODECS = {model_id: codec_class(model_id)(request) for model_id, request in api_request_list.items()}
+
+
+def get_codec(model_id):
+    try:
+        return CODECS[model_id]
+    except KeyError:
+        raise ValueError(f'No request schema for model {model_id}') from None
@@ -0,0 +1,401 @@
+import os
+import queue
+import threading
+import time
+
+from collections import deque
+
+from api_request_schema import get_model_ids
+from cancellation import CancelToken
+
+
+class CircuitBreaker:
+    """
+    Stops routing to a model after `failure_threshold` consecutive failures. After
+    `cooldown` seconds one probe request is let through (half-open): success closes the
+    breaker again, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probing = False
+
+    def available(self, now):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            return now - self.opened_at >= self.cooldown
+        return not self._probing
+
+    def begin(self, now):
+        if self.state != 'closed' and self.available(now):
+            self.state = 'half_open'
+            self._probing = True
+
+    def success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probing = False
+
+    def release(self):
+        """The probe was cancelled before it could succeed or fail; let the next request probe."""
+        self._probing = False
+
+    def failure(self, now):
+        self.failures += 1
+        self._probing = False
+        if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+            self.state = 'open'
+            self.opened_at = now
+            self.trips += 1
+        elif self.state == 'open':
+            self.opened_at = now
+
+
+class _ModelStats:
+
+    def __init__(self, window, breaker):
+        self.ttft_ms = deque(maxlen=window)
+        self.breaker = breaker
+        self.attempts = {'primary': 0, 'hedge': 0, 'failover': 0}
+        self.wins = 0
+        self.failures = 0
+        self.lost = 0
+
+    def percentile(self, q):
+        if not self.ttft_ms:
+            return None
+        ordered = sorted(self.ttft_ms)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class _Attempt:
+    """One request to one model, read on its own thread until the first token (or an error)."""
+
+    def __init__(self, model_id, reason, open_model, decode_event, ready):
+        self.model_id = model_id
+        self.reason = reason
+        self.cancel = CancelToken()
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.buffered = []
+        self.events = None
+        self.error = None
+        threading.Thread(target=self._run, args=(open_model, decode_event, ready), name=f'route-{model_id}',
+                         daemon=True).start()
+
+    def _run(self, open_model, decode_event, ready):
+        try:
+            events = iter(open_model(self.model_id, self.cancel))
+            for event in events:
+                self.buffered.append(event)
+                if decode_event(event):
+                    break
+            # 沒有任何文字就結束的串流也算完成
+            self.events = events
+            self.first_token_at = time.perf_counter()
+        except Exception as e:
+            self.error = e
+        ready.put(self)
+
+    def elapsed_ms(self, until=None):
+        return ((until or time.perf_counter()) - self.started) * 1000
+
+
+class _RoutedStream:
+    """
+    What `ModelRouter.stream` returns. Routing happens on the first iteration, so `close()`
+    (barge-in, cache abandoned) also stops a turn that is still waiting for its first token.
+    """
+
+    def __init__(self, router, open_model, decode_event):
+        self.router = router
+        self.open_model = open_model
+        self.decode_event = decode_event
+        self.model_id = None
+        self._closed = threading.Event()
+        self._attempts = []
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        winner = self.router._race(self)
+        if winner is None:
+            return
+        self.model_id = winner.model_id
+        try:
+            yield from winner.buffered
+            for event in winner.events:
+                if self._closed.is_set():
+                    return
+                yield event
+        except Exception:
+            if not self._closed.is_set():
+                self.router._failed(winner)
+            raise
+
+    def _launch(self, model_id, reason, ready):
+        attempt = _Attempt(model_id, reason, self.open_model, self.decode_event, ready)
+        with self._lock:
+            self._attempts.append(attempt)
+            closed = self._closed.is_set()
+        if closed:
+            attempt.cancel.cancel('closed')
+        return attempt
+
+    def close(self):
+        with self._lock:
+            self._closed.set()
+            attempts = list(self._attempts)
+        for attempt in attempts:
+            attempt.cancel.cancel('closed')
+
+
+class ModelRouter:
+    """
+    Picks the Bedrock model for each turn from `models` (in order of preference) and
+    watches its time to first token.
+
+    Healthy models with at least `min_samples` recent TTFTs from turns they answered are
+    ranked by their rolling median; the others keep their configured order behind them. If the chosen model has
+    not produced a token after the hedge delay (`hedge_ms`, or the model's rolling p90
+    once known), the next model is asked as well and whichever answers first is used; the
+    other request is closed. A request that fails before its first token fails over to the
+    next model. Failures feed a `CircuitBreaker` per model. `stats()` and `prometheus()`
+    report the routing decisions.
+    """
+
+    def __init__(self, models, hedge_ms=1500.0, adaptive_hedge=True, max_hedges=1, window=50, min_samples=5,
+                 failure_threshold=3, cooldown=30.0, prometheus_path=None):
+        self.models = list(dict.fromkeys(models))
+        self.hedge_ms = hedge_ms
+        self.adaptive_hedge = adaptive_hedge
+        self.max_hedges = max_hedges
+        self.min_samples = min_samples
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._stats = {model: _ModelStats(window, CircuitBreaker(failure_threshold, cooldown)) for model in self.models}
+        self.turns = 0
+        self.hedged_turns = 0
+        self.hedge_wins = 0
+        self.failed_turns = 0
+
+    def stream(self, open_model, decode_event):
+        """
+        `open_model(model_id, cancel)` sends the request and returns the model's event stream,
+        closing it when `cancel` fires; `decode_event(event)` returns an event's text.
+        """
+        return _RoutedStream(self, open_model, decode_event)
+
+    def rank(self):
+        now = time.monotonic()
+        with self._lock:
+            healthy = [m for m in self.models if self._stats[m].breaker.available(now)]
+            if not healthy:
+                # 全部都斷路時仍然要回答：先試最早斷路的
+                return sorted(self.models, key=lambda m: self._stats[m].breaker.opened_at)
+            known = [m for m in healthy if len(self._stats[m].ttft_ms) >= self.min_samples]
+            known.sort(key=lambda m: self._stats[m].percentile(50))
+            return known + [m for m in healthy if m not in known]
+
+    def _hedge_delay(self, model):
+        if self.hedge_ms is None:
+            return float('inf')
+        with self._lock:
+            stats = self._stats[model]
+            if self.adaptive_hedge and len(stats.ttft_ms) >= self.min_samples:
+                return stats.percentile(90) / 1000
+        return self.hedge_ms / 1000
+
+    def _start(self, routed, model, reason, ready):
+        with self._lock:
+            stats = self._stats[model]
+            stats.attempts[reason] += 1
+            stats.breaker.begin(time.monotonic())
+        return routed._launch(model, reason, ready)
+
+    def _race(self, routed):
+        candidates = self.rank()
+        ready = queue.Queue()
+        running = [self._start(routed, candidates.pop(0), 'primary', ready)]
+        hedges = 0
+        hedge_at = time.perf_counter() + self._hedge_delay(running[0].model_id)
+        error = None
+        with self._lock:
+            self.turns += 1
+
+        while running:
+            if routed._closed.is_set():
+                self._released(running)
+                return None
+            can_hedge = candidates and hedges < self.max_hedges
+            try:
+                # 每 50 ms 醒來一次，檢查 hedge 時間到了沒、串流是不是被關掉了
+                attempt = ready.get(timeout=0.05)
+            except queue.Empty:
+                if can_hedge and time.perf_counter() >= hedge_at:
+                    hedges += 1
+                    if hedges == 1:
+                        with self._lock:
+                            self.hedged_turns += 1
+                    running.append(self._start(routed, candidates.pop(0), 'hedge', ready))
+                    hedge_at = time.perf_counter() + self._hedge_delay(running[-1].model_id)
+                continue
+
+            running.remove(attempt)
+            if attempt.error is not None:
+                error = attempt.error
+                if not attempt.cancel.is_cancelled():
+                    self._failed(attempt)
+                if not running and candidates and not routed._closed.is_set():
+                    running.append(self._start(routed, candidates.pop(0), 'failover', ready))
+                    hedge_at = time.perf_counter() + self._hedge_delay(running[-1].model_id)
+                continue
+
+            for loser in running:
+                loser.cancel.cancel('lost the race')
+            self._won(attempt, running)
+            return attempt
+
+        with self._lock:
+            self.failed_turns += 1
+        self._export()
+        if error is not None:
+            raise error
+        return None
+
+    def _won(self, winner, losers):
+        with self._lock:
+            stats = self._stats[winner.model_id]
+            stats.ttft_ms.append(winner.elapsed_ms(winner.first_token_at))
+            stats.wins += 1
+            stats.breaker.success()
+            if winner.reason == 'hedge':
+                self.hedge_wins += 1
+            for loser in losers:
+                # 輸掉的請求沒有真正的 TTFT（被 hedge 的那個可能才剛送出），不能當排名用的樣本
+                lost = self._stats[loser.model_id]
+                lost.lost += 1
+                lost.breaker.release()
+        self._export()
+
+    def _released(self, attempts):
+        with self._lock:
+            for attempt in attempts:
+                self._stats[attempt.model_id].breaker.release()
+
+    def _failed(self, attempt):
+        with self._lock:
+            stats = self._stats[attempt.model_id]
+            stats.failures += 1
+            stats.breaker.failure(time.monotonic())
+        self._export()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'turns': self.turns,
+                'hedged_turns': self.hedged_turns,
+                'hedge_wins': self.hedge_wins,
+                'failed_turns': self.failed_turns,
+                'models': {model: {
+                    'attempts': dict(stats.attempts),
+                    'wins': stats.wins,
+                    'lost': stats.lost,
+                    'failures': stats.failures,
+                    'p50_ttft_ms': _round(stats.percentile(50)),
+                    'p90_ttft_ms': _round(stats.percentile(90)),
+                    'breaker': stats.breaker.state,
+                    'breaker_trips': stats.breaker.trips,
+                } for model, stats in self._stats.items()},
+            }
+
+    def _prometheus(self):
+        lines = [
+            '# HELP model_router_attempts_total Requests sent to each model, by why it was asked.',
+            '# TYPE model_router_attempts_total counter',
+        ]
+        for model, stats in self._stats.items():
+            for reason, count in stats.attempts.items():
+                lines.append(f'model_router_attempts_total{{model="{model}",reason="{reason}"}} {count}')
+        lines += [
+            '# HELP model_router_wins_total Turns answered by each model.',
+            '# TYPE model_router_wins_total counter',
+        ]
+        lines += [f'model_router_wins_total{{model="{m}"}} {s.wins}' for m, s in self._stats.items()]
+        lines += [
+            '# HELP model_router_failures_total Requests that failed before or during the answer.',
+            '# TYPE model_router_failures_total counter',
+        ]
+        lines += [f'model_router_failures_total{{model="{m}"}} {s.failures}' for m, s in self._stats.items()]
+        lines += [
+            '# HELP model_router_ttft_ms Rolling time to first token.',
+            '# TYPE model_router_ttft_ms gauge',
+        ]
+        for model, stats in self._stats.items():
+            for q in (50, 90):
+                value = stats.percentile(q)
+                if value is not None:
+                    lines.append(f'model_router_ttft_ms{{model="{model}",quantile="0.{q}"}} {value:.1f}')
+        lines += [
+            '# HELP model_router_breaker_open 1 while the model\'s circuit breaker is open or half-open.',
+            '# TYPE model_router_breaker_open gauge',
+        ]
+        lines += [f'model_router_breaker_open{{model="{m}"}} {int(s.breaker.state != "closed")}'
+                  for m, s in self._stats.items()]
+        lines += [
+            '# HELP model_router_hedged_turns_total Turns where a second model was asked.',
+            '# TYPE model_router_hedged_turns_total counter',
+            f'model_router_hedged_turns_total {self.hedged_turns}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def prometheus(self):
+        with self._lock:
+            return self._prometheus()
+
+    def _export(self):
+        if not self.prometheus_path:
+            return
+        with self._lock:
+            text = self._prometheus()
+        tmp = f'{self.prometheus_path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, self.prometheus_path)
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+_default_router = None
+_default_lock = threading.Lock()
+
+
+def get_model_router(primary):
+    """
+    整個 process 共用。MODEL_ROUTER_MODELS（逗號分隔）是 primary 之外可以改用的模型；
+    MODEL_HEDGE_MS 是沒有統計資料時的 hedge 等待時間（off 關閉 hedge），MODEL_ROUTER_PROM 輸出 Prometheus 檔
+    """
+    global _default_router
+    with _default_lock:
+        if _default_router is None:
+            extra = [m.strip() for m in os.getenv('MODEL_ROUTER_MODELS', '').split(',') if m.strip()]
+            unknown = [m for m in extra if m not in get_model_ids()]
+            if unknown:
+                print(f'Warning: ignoring MODEL_ROUTER_MODELS {unknown}, not in {get_model_ids()}.')
+                extra = [m for m in extra if m not in unknown]
+            hedge = os.getenv('MODEL_HEDGE_MS', '1500')
+            _default_router = ModelRouter(
+                [primary, *extra],
+                hedge_ms=None if hedge == 'off' else float(hedge),
+                failure_threshold=int(os.getenv('MODEL_BREAKER_FAILURES', '3')),
+                cooldown=float(os.getenv('MODEL_BREAKER_COOLDOWN', '30')),
+                prometheus_path=os.getenv('MODEL_ROUTER_PROM') or None,
+            )
+        return _default_router
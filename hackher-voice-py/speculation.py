@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+import unicodedata
+
+from concurrent.futures import Future
+
+from cancellation import CancelToken
+from conversation import estimate_tokens
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_transcript(text):
+    """比對用：Transcribe 的 final 常常只差在標點或空白"""
+    text = unicodedata.normalize('NFKC', text)
+    return _WHITESPACE.sub('', ''.join(c for c in text if not unicodedata.category(c).startswith('P'))).lower()
+
+
+class Speculation:
+    """
+    A Bedrock answer started early, for a partial transcript that stopped changing.
+
+    A background thread reads the event stream into a buffer. If the final transcript
+    matches `text`, the turn `adopt`s it and replays the buffer, then follows the live
+    stream; otherwise it is `discard`ed, which closes the stream so Bedrock stops generating.
+    `open_stream(cancel)` must close its stream when `cancel` fires. `decode_event(event)`
+    returns an event's text and is only used for the token counts. Whoever synthesizes the
+    first sentence ahead of time sets `first_sentence` and then resolves `first_audio`.
+    """
+
+    def __init__(self, text, open_stream, decode_event, body=None):
+        self.text = text
+        self.body = body
+        self.key = normalize_transcript(text)
+        self.cancel = CancelToken()
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.adopted_at = None
+        self.generated = []
+        self.first_sentence = None
+        self.first_audio = Future()
+        self._decode_event = decode_event
+        self._events = []
+        self._done = False
+        self.error = None
+        self._cond = threading.Condition()
+        threading.Thread(target=self._pump, args=(open_stream,), name='speculation', daemon=True).start()
+
+    def _pump(self, open_stream):
+        try:
+            for event in open_stream(self.cancel):
+                if self.cancel.is_cancelled():
+                    break
+                text = self._decode_event(event)
+                if text:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.perf_counter()
+                    self.generated.append(text)
+                with self._cond:
+                    self._events.append(event)
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self.error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def matches(self, text):
+        return self.key == normalize_transcript(text)
+
+    def events(self, cancel=None):
+        """Every event so far, then the live ones; stops early when `cancel` (or the speculation) is cancelled."""
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._events) and not self._done:
+                    if self.cancel.is_cancelled() or (cancel is not None and cancel.is_cancelled()):
+                        return
+                    self._cond.wait(0.05)
+                pending = self._events[i:]
+                done = self._done
+                error = self.error
+            for event in pending:
+                if cancel is not None and cancel.is_cancelled():
+                    return
+                yield event
+            i += len(pending)
+            if done and i >= len(self._events):
+                if error is not None:
+                    raise error
+                return
+
+    def adopt(self, cancel):
+        """Hands the answer to the turn: cancelling the turn now cancels the Bedrock stream too."""
+        self.adopted_at = time.perf_counter()
+        cancel.on_cancel(self.cancel.cancel)
+        return self.events(cancel)
+
+    def discard(self):
+        self.cancel.cancel('transcript changed')
+
+    def tokens(self):
+        return estimate_tokens(''.join(self.generated))
+
+    def saved_ms(self):
+        """How much earlier the first token was available than if Bedrock had started at adoption."""
+        if self.adopted_at is None:
+            return 0.0
+        ready = self.first_token_at if self.first_token_at is not None else self.adopted_at
+        return round((min(self.adopted_at, ready) - self.started) * 1000, 1)
+
+
+class SpeculationStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.committed = 0
+        self.discarded = 0
+        self.committed_tokens = 0
+        self.wasted_tokens = 0
+        self.saved_ms = []
+        self._pending = []
+
+    def on_start(self):
+        with self._lock:
+            self.started += 1
+
+    def on_commit(self, speculation):
+        with self._lock:
+            self.committed += 1
+            self._pending.append(speculation)
+
+    def on_discard(self, speculation):
+        with self._lock:
+            self.discarded += 1
+            self._pending.append(speculation)
+
+    def _settle(self):
+        # 被採用的猜測要等回答生成完，token 數與省下的時間才是最終的
+        for speculation in self._pending:
+            if speculation.adopted_at is not None:
+                self.committed_tokens += speculation.tokens()
+                self.saved_ms.append(speculation.saved_ms())
+            else:
+                self.wasted_tokens += speculation.tokens()
+        self._pending = []
+
+    def summary(self):
+        with self._lock:
+            self._settle()
+            total_tokens = self.committed_tokens + self.wasted_tokens
+            saved = sorted(self.saved_ms)
+            return {
+                'started': self.started,
+                'committed': self.committed,
+                'discarded': self.discarded,
+                'committed_tokens': self.committed_tokens,
+                'wasted_tokens': self.wasted_tokens,
+                'wasted_token_rate': round(self.wasted_tokens / total_tokens, 3) if total_tokens else 0.0,
+                'mean_saved_ms': round(sum(saved) / len(saved), 1) if saved else None,
+                'p50_saved_ms': saved[len(saved) // 2] if saved else None,
+            }
@@ -0,0 +1,161 @@
+import base64
+import json
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import NULL_TRACE
+from tts_pipeline import SentenceSegmenter
+
+
+def iter_claude_text(events):
+    """Text deltas from an Anthropic Messages `invoke_model_with_response_stream` body."""
+    for event in events:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        data = json.loads(chunk['bytes'])
+        if data.get('type') == 'content_block_delta':
+            text = data['delta'].get('text')
+            if text:
+                yield text
+
+
+class StreamingReply:
+    """
+    Renders a streamed Bedrock answer and speaks it sentence by sentence.
+
+    Runs in the Streamlit script thread, so `on_text` / `on_audio` may call `st.*`.
+    Completed segments (see `SentenceSegmenter`) are synthesized in a small thread pool
+    while tokens keep arriving; audio is handed to `on_audio` strictly in order.
+    """
+
+    def __init__(self, synthesize, on_text, on_audio, max_in_flight=3, trace=NULL_TRACE):
+        self.synthesize = synthesize
+        self.on_text = on_text
+        self.on_audio = on_audio
+        self.max_in_flight = max_in_flight
+        self.trace = trace
+        self.text = ''
+        self._started = None
+        self._first_token = None
+        self._first_audio = None
+        self._sentences = 0
+
+    def _submit(self, executor, pending, sentence):
+        if sentence.strip():
+            self._sentences += 1
+            self.trace.mark('first_sentence')
+            pending.append(executor.submit(self.synthesize, sentence))
+
+    def _play_ready(self, pending, wait=False):
+        while pending and (wait or pending[0].done()):
+            audio = pending.popleft().result()
+            if audio:
+                if self._first_audio is None:
+                    self._first_audio = time.perf_counter()
+                    self.trace.mark('first_audio_byte', self._first_audio)
+                self.on_audio(audio)
+                # 交給瀏覽器的時間；實際開始播放還要加上下載與解碼
+                self.trace.mark('playback_start')
+
+    def run(self, events):
+        self._started = time.perf_counter()
+        sentences = SentenceSegmenter()
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='polly')
+        try:
+            for token in iter_claude_text(events):
+                if self._first_token is None:
+                    self._first_token = time.perf_counter()
+                    self.trace.mark('first_token', self._first_token)
+                self.text += token
+                self.on_text(self.text)
+                for sentence in sentences.feed(token):
+                    self._submit(executor, pending, sentence)
+                self._play_ready(pending)
+            self._submit(executor, pending, sentences.flush())
+            self._play_ready(pending, wait=True)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.text
+
+    def stats(self):
+        def ms(at):
+            return round((at - self._started) * 1000, 1) if at is not None and self._started else None
+
+        return {
+            'first_token_ms': ms(self._first_token),
+            'first_audio_ms': ms(self._first_audio),
+            'total_ms': ms(time.perf_counter()),
+            'sentences': self._sentences,
+            'chars': len(self.text),
+        }
+
+
+# 每一句的音檔都排進同一個播放佇列（存在主頁面上），上一句播完才播下一句。
+# 音檔一排進佇列就開始下載；每個回合第一次開始播放時，把 time-to-first-audio 回報給 stats 網址，
+# 每一句播完（或播放失敗）也回報一次，伺服器端才知道這個回合什麼時候真的播完
+_QUEUE_PLAYER = """
+<script>
+const page = window.parent;
+page.ttsQueue = page.ttsQueue || [];
+page.ttsTurns = page.ttsTurns || {};
+const item = {audio: new page.Audio(), turn: %(turn)s, stats: %(stats)s};
+item.audio.preload = 'auto';
+item.audio.src = %(src)s;
+if (item.turn && !page.ttsTurns[item.turn]) {
+    // 伺服器端從回合開始到送出這一句已經過了 since_ms
+    page.ttsTurns[item.turn] = {origin: page.performance.now() - %(since_ms)d, reported: false};
+}
+page.ttsQueue.push(item);
+if (!page.ttsPlaying) {
+    page.ttsPlaying = true;
+    const next = () => {
+        const current = page.ttsQueue.shift();
+        if (!current) { page.ttsPlaying = false; return; }
+        const turn = page.ttsTurns[current.turn];
+        current.audio.onplaying = () => {
+            if (turn && !turn.reported && current.stats) {
+                turn.reported = true;
+                const ttfa = page.performance.now() - turn.origin;
+                page.navigator.sendBeacon(current.stats, JSON.stringify({turn: current.turn, ttfa_ms: ttfa}));
+            }
+        };
+        let finished = false;
+        const done = () => {
+            if (finished) { return; }
+            finished = true;
+            if (current.turn && current.stats) {
+                page.navigator.sendBeacon(current.stats, JSON.stringify({turn: current.turn, played: 1}));
+            }
+            next();
+        };
+        current.audio.onended = done;
+        current.audio.onerror = done;
+        current.audio.play().catch(done);
+    };
+    next();
+}
+</script>
+"""
+
+
+def play_in_browser(audio, mime='audio/mp3', turn=None, stats_url=None, since_ms=0):
+    """
+    Queue audio for in-order autoplay in the browser. `audio` is either the bytes (sent
+    inline as base64) or a URL the page streams from, e.g. `AudioStreamServer.publish`.
+    """
+    import streamlit.components.v1 as components
+
+    if isinstance(audio, str):
+        src = audio
+    else:
+        src = f'data:{mime};base64,{base64.b64encode(audio).decode()}'
+    components.html(_QUEUE_PLAYER % {
+        'src': json.dumps(src),
+        'turn': json.dumps(turn or ''),
+        'stats': json.dumps(stats_url or ''),
+        'since_ms': since_ms,
+    }, height=0)
@@ -0,0 +1,95 @@
+import threading
+
+from bedrock_cache import BedrockResponseCache
+from cancellation import CancelToken
+
+
+class _SlowUpstream:
+    """Bedrock 的 event stream 替身：`release` 之前不會有第一個 chunk"""
+
+    def __init__(self, chunks=(b'a', b'b')):
+        self.chunks = chunks
+        self.release = threading.Event()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        while not self.release.wait(0.01):
+            if self.closed.is_set():
+                return
+        for data in self.chunks:
+            if self.closed.is_set():
+                return
+            yield {'chunk': {'bytes': data}}
+
+    def close(self):
+        self.closed.set()
+
+
+def opener(upstreams):
+    opened = []
+
+    def open_stream():
+        upstream = upstreams[len(opened)]
+        opened.append(upstream)
+        return upstream
+
+    return open_stream, opened
+
+
+def test_identical_requests_share_one_call():
+    cache = BedrockResponseCache()
+    upstream = _SlowUpstream()
+    open_stream, opened = opener([upstream])
+    first = cache.stream('k', open_stream)
+    second = cache.stream('k', open_stream)
+    results = []
+    readers = [threading.Thread(target=lambda s=s: results.append(list(s))) for s in (first, second)]
+    for reader in readers:
+        reader.start()
+    upstream.release.set()
+    for reader in readers:
+        reader.join(5)
+
+    assert len(opened) == 1
+    assert results == [[{'chunk': {'bytes': b'a'}}, {'chunk': {'bytes': b'b'}}]] * 2
+    assert list(cache.stream('k', open_stream)) == results[0]
+    assert cache.stats()['hits'] == 1
+
+
+def test_stream_that_is_never_iterated_sends_nothing():
+    cache = BedrockResponseCache()
+    open_stream, opened = opener([_SlowUpstream()])
+    cache.stream('k', open_stream)
+    assert opened == []
+    assert cache.stats()['misses'] == 0
+
+
+def test_last_reader_leaving_closes_upstream_before_the_first_token():
+    cache = BedrockResponseCache()
+    upstream = _SlowUpstream()
+    open_stream, opened = opener([upstream, _SlowUpstream()])
+    cancel = CancelToken()
+    stream = cache.stream('k', open_stream, cancel=cancel)
+    reader = threading.Thread(target=lambda: list(stream))
+    reader.start()
+    cancel.cancel('barge-in')
+    reader.join(5)
+
+    assert upstream.closed.wait(5)
+
+
+def test_request_after_abandoned_flight_starts_a_new_call():
+    # 猜測被丟掉之後 final 又變回同一句：同一個 key 要重新呼叫，而不是加入已經取消的 flight
+    cache = BedrockResponseCache()
+    abandoned, fresh = _SlowUpstream(), _SlowUpstream((b'c',))
+    open_stream, opened = opener([abandoned, fresh])
+    cancel = CancelToken()
+    stream = cache.stream('k', open_stream, cancel=cancel)
+    reader = threading.Thread(target=lambda: list(stream))
+    reader.start()
+    cancel.cancel('transcript changed')
+    reader.join(5)
+
+    fresh.release.set()
+    assert list(cache.stream('k', open_stream)) == [{'chunk': {'bytes': b'c'}}]
+    assert opened == [abandoned, fresh]
@@ -0,0 +1,133 @@
+import pytest
+
+from model_router import CircuitBreaker, ModelRouter
+
+PRIMARY = 'primary'
+SECONDARY = 'secondary'
+
+
+def fake_models(delays, errors=()):
+    """`open_model` 的替身：每個模型等 `delays[model]` 秒後回一個 token，`errors` 裡的模型直接失敗"""
+    calls = []
+
+    def open_model(model_id, cancel):
+        calls.append(model_id)
+        if model_id in errors:
+            raise RuntimeError(f'{model_id} throttled')
+        return _answer(model_id, delays[model_id], cancel)
+
+    return open_model, calls
+
+
+def _answer(model_id, delay, cancel):
+    if cancel.wait(delay):
+        return
+    yield model_id
+    yield '.'
+
+
+def ask(router, open_model):
+    routed = router.stream(open_model, lambda event: event)
+    events = list(routed)
+    return routed.model_id, events
+
+
+def test_hedge_answers_from_the_second_model():
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=50, adaptive_hedge=False)
+    open_model, calls = fake_models({PRIMARY: 2.0, SECONDARY: 0.0})
+
+    model_id, events = ask(router, open_model)
+
+    assert model_id == SECONDARY
+    assert events == [SECONDARY, '.']
+    assert calls == [PRIMARY, SECONDARY]
+    stats = router.stats()
+    assert stats['hedged_turns'] == 1
+    assert stats['hedge_wins'] == 1
+    assert stats['models'][PRIMARY]['lost'] == 1
+    assert stats['models'][SECONDARY]['attempts']['hedge'] == 1
+
+
+def test_failover_when_the_primary_fails():
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=None)
+    open_model, calls = fake_models({PRIMARY: 0.0, SECONDARY: 0.0}, errors={PRIMARY})
+
+    model_id, events = ask(router, open_model)
+
+    assert model_id == SECONDARY
+    assert events == [SECONDARY, '.']
+    stats = router.stats()['models']
+    assert stats[PRIMARY]['failures'] == 1
+    assert stats[SECONDARY]['attempts']['failover'] == 1
+
+
+def test_every_model_failing_raises():
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=None)
+    open_model, _ = fake_models({PRIMARY: 0.0, SECONDARY: 0.0}, errors={PRIMARY, SECONDARY})
+
+    with pytest.raises(RuntimeError):
+        ask(router, open_model)
+    assert router.stats()['failed_turns'] == 1
+
+
+def test_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10)
+    breaker.failure(0)
+    assert breaker.state == 'closed'
+    breaker.failure(1)
+    assert breaker.state == 'open'
+    assert not breaker.available(5)
+
+    # 冷卻結束只放一個探測請求
+    assert breaker.available(11)
+    breaker.begin(11)
+    assert breaker.state == 'half_open'
+    assert not breaker.available(11)
+
+    # 探測失敗：重新斷路，冷卻從頭算
+    breaker.failure(12)
+    assert breaker.state == 'open'
+    assert breaker.trips == 2
+    assert not breaker.available(21)
+
+    breaker.begin(22)
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.available(22)
+
+
+def test_breaker_skips_a_failing_model():
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=None, failure_threshold=2, cooldown=60)
+    open_model, calls = fake_models({PRIMARY: 0.0, SECONDARY: 0.0}, errors={PRIMARY})
+
+    for _ in range(3):
+        assert ask(router, open_model)[0] == SECONDARY
+
+    # 第三回合 primary 已經斷路，不再被呼叫
+    assert calls.count(PRIMARY) == 2
+    assert router.rank() == [SECONDARY]
+
+
+def test_losing_a_hedge_does_not_count_as_a_fast_answer():
+    # primary 在 hedge 之後才回答，secondary 每次都輸：它從沒回答過，不能因為「輸得早」被排到前面
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=50, adaptive_hedge=False, min_samples=2)
+    open_model, _ = fake_models({PRIMARY: 0.2, SECONDARY: 2.0})
+
+    for _ in range(3):
+        assert ask(router, open_model)[0] == PRIMARY
+
+    stats = router.stats()['models']
+    assert stats[SECONDARY]['lost'] == 3
+    assert stats[SECONDARY]['p50_ttft_ms'] is None
+    assert stats[PRIMARY]['p50_ttft_ms'] >= 200
+    assert router.rank() == [PRIMARY, SECONDARY]
+
+
+def test_rank_by_median_ttft():
+    router = ModelRouter([PRIMARY, SECONDARY], hedge_ms=None, min_samples=2)
+    for ttft in (400, 420, 410):
+        router._stats[PRIMARY].ttft_ms.append(ttft)
+    for ttft in (150, 160):
+        router._stats[SECONDARY].ttft_ms.append(ttft)
+
+    assert router.rank() == [SECONDARY, PRIMARY]
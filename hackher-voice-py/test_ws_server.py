@@ -0,0 +1,44 @@
+import asyncio
+
+from fakes import FakeTranscribeStreamingClient
+from ws_server import TranscribeHub
+
+
+class _BlockedTranscribeClient(FakeTranscribeStreamingClient):
+    """Transcribe 卡住：音訊送不出去，直到 `release` 被設定"""
+
+    def __init__(self):
+        super().__init__(latency=0.0)
+        self.release = asyncio.Event()
+
+    async def start_stream_transcription(self, **kwargs):
+        stream = await super().start_stream_transcription(**kwargs)
+        send_audio_event = stream.input_stream.send_audio_event
+
+        async def blocked(audio_chunk):
+            await self.release.wait()
+            await send_audio_event(audio_chunk)
+
+        stream.input_stream.send_audio_event = blocked
+        return stream
+
+
+def test_close_with_full_audio_queue():
+    client = _BlockedTranscribeClient()
+    hub = TranscribeHub(client=client)
+    session = hub.open_session()
+    for _ in range(100):
+        session.feed(b'\x01\x00' * 160)
+    session.close()
+    hub.loop.call_soon_threadsafe(client.release.set)
+
+    assert session.wait_closed(5)
+    assert session.dropped_audio > 0
+    assert session.session_id not in hub.sessions
+
+
+def test_close_empty_session():
+    hub = TranscribeHub(client=FakeTranscribeStreamingClient(latency=0.0))
+    session = hub.open_session()
+    session.close()
+    assert session.wait_closed(5)
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+# 寫到一半的暫存檔；不算進快取大小，也不會被清掉
+_TMP_SUFFIX = '.tmp'
+
+
+def normalize_text(text):
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def make_key(text, VoiceId, OutputFormat, Engine=None, LanguageCode=None, SampleRate=None):
+    parts = [normalize_text(text), VoiceId, Engine or '', LanguageCode or '', OutputFormat]
+    if SampleRate:
+        parts.append(SampleRate)  # 沒指定取樣率時維持原本的 key
+    raw = '\x1f'.join(parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TtsCache:
+    """
+    Content-addressed Polly audio cache.
+
+    A bounded in-memory LRU sits in front of a size-capped directory of audio files.
+    All methods are safe to call from executor threads.
+    """
+
+    def __init__(self, cache_dir=None, memory_bytes=16 * 1024 * 1024, disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.bytes_saved += len(data)
+                return data
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)  # mtime doubles as the disk LRU clock
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self._remember(key, data)
+                    self.disk_hits += 1
+                    self.bytes_saved += len(data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        data = bytes(data)
+        with self._lock:
+            self._remember(key, data)
+        if self.cache_dir and len(data) <= self.disk_bytes:
+            self._write_file(key, data)
+
+    def _write_file(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=_TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except OSError:
+            os.remove(tmp)
+            return
+
+        with self._lock:
+            # 同一個 key 再寫一次（例如兩個回合同時合成同一句）會取代舊檔，不是多佔空間；
+            # 在鎖裡 stat 與取代，同時寫同一個 key 才不會算錯
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                os.remove(tmp)
+                return
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, _, size in self._disk_entries())
+            else:
+                self._disk_size += len(data) - replaced
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(_TMP_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, path, st.st_size
+
+    def _evict_disk(self):
+        # Drop least recently used files until we are back under 90% of the cap.
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        target = self.disk_bytes * 0.9
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_size = total
+
+    def get_or_synthesize(self, text, polly_params, synthesize):
+        """回傳快取的音訊；沒有的話呼叫 synthesize() 取得並存入快取"""
+        key = make_key(text, **polly_params)
+        data = self.get(key)
+        if data is None:
+            data = synthesize()
+            if data:
+                self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'bytes_saved': self.bytes_saved,
+                'memory_bytes': self._memory_size,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """整個 process 共用一個快取（Streamlit rerun 時模組不會重新載入）"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = TtsCache(
+                cache_dir=os.getenv('TTS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.tts_cache')),
+                memory_bytes=int(os.getenv('TTS_CACHE_MEMORY_MB', '16')) * 1024 * 1024,
+                disk_bytes=int(os.getenv('TTS_CACHE_DISK_MB', '256')) * 1024 * 1024,
+            )
+        return _default_cache
@@ -0,0 +1,267 @@
+import queue
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+_END = object()
+
+# Polly synthesize_speech accepts at most 3000 billed characters per request.
+POLLY_MAX_CHARS = 3000
+_SENTENCE = re.compile(r'[^.!?。！？]*[.!?。！？]*\s*')
+
+
+def split_for_polly(text, max_chars=POLLY_MAX_CHARS, first_max_chars=300):
+    """
+    Split long text into Polly-sized segments on sentence boundaries.
+
+    The first segment is kept short so playback can start early; the rest are packed
+    up to `max_chars`. A single sentence longer than the limit is hard-split.
+    """
+    segments = []
+    current = ''
+    limit = first_max_chars
+    for sentence in _SENTENCE.findall(text):
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            if current:
+                segments.append(current)
+                current = ''
+            segments.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+            limit = max_chars
+        if current and len(current) + len(sentence) > limit:
+            segments.append(current)
+            current = ''
+            limit = max_chars
+        current += sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+# 句尾：中文。！？…、英文 ! ? 與換行直接算；英文的 . 要後面接空白才算（避免 3.14 被切開），可以帶著後面的引號或括號。
+# 子句：逗號、頓號、分號、冒號，只用在第一段與超過長度上限時
+_BOUNDARY = re.compile(r'(?P<strong>(?:[。！？!?…\n]|\.(?=\s))+[」』”’"）)\]]*)|(?P<soft>[，、,；;：:])')
+
+
+class SentenceSegmenter:
+    """
+    Streaming counterpart of `split_for_polly`: turns LLM tokens into segments for Polly.
+
+    The first segment ends at the first clause boundary after `first_min_chars`, so
+    playback starts early. Later segments end at a sentence boundary once they reach a
+    target length that starts at `min_chars` and grows by `growth` up to `target_chars`,
+    which cuts the number of Polly requests while the first ones play. Text without
+    such a boundary (lists, code) is cut once it is `run_on_factor` times the target, at
+    the last clause boundary or space, so it does not hold back the audio. Nothing is
+    longer than `max_chars`. Each token is scanned once and text is only joined when a
+    segment is emitted, so buffering is linear in the length of the answer.
+    """
+
+    def __init__(self, first_min_chars=4, min_chars=40, target_chars=400, growth=2.0, run_on_factor=2.0,
+                 max_chars=POLLY_MAX_CHARS):
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.target_chars = min(target_chars, max_chars)
+        self.growth = growth
+        self.run_on_factor = run_on_factor
+        self.max_chars = max_chars
+        self.segments = 0
+        self._target = first_min_chars
+        self._parts = []
+        self._size = 0
+        self._held = ''
+        self._fallback = None
+
+    def feed(self, token):
+        """Returns the segments completed by `token` (usually none)."""
+        if not token:
+            return []
+        self._parts.append(token)
+        self._size += len(token)
+        text = self._held + token
+        base = self._size - len(text)
+        # 結尾的 . 要看下一個 token 是不是空白才知道是不是句尾，留到下次再掃
+        scan = text.rstrip('.')
+        self._held = text[len(scan):]
+
+        segments = []
+        for match in _BOUNDARY.finditer(scan):
+            end = base + match.end()
+            # 第一段在子句結束就送出，之後的要等到句尾
+            if end >= self._target and (match.group('strong') or self.segments == 0):
+                base -= end
+                self._emit(end, segments)
+            elif end <= self.max_chars:
+                self._fallback = end
+        while self._size > self._run_on_limit():
+            self._emit(self._run_on_cut(), segments)
+        return segments
+
+    def _run_on_limit(self):
+        return min(self.max_chars, int(self.run_on_factor * max(self._target, self.min_chars)))
+
+    def _run_on_cut(self):
+        """Where to cut text that ran past the limit: a clause boundary, else the last space, else the limit."""
+        if self._fallback:
+            return self._fallback
+        limit = self._run_on_limit()
+        space = max(''.join(self._parts).rfind(c, 0, limit) for c in ' \t')
+        return space + 1 if space > 0 else limit
+
+    def flush(self):
+        """The rest of the answer, once the stream has ended."""
+        rest = ''.join(self._parts)
+        self.segments = 0
+        self._target = self.first_min_chars
+        self._parts = []
+        self._size = 0
+        self._held = ''
+        self._fallback = None
+        return rest
+
+    def _emit(self, end, segments):
+        text = ''.join(self._parts)
+        segment, rest = text[:end], text[end:]
+        self._parts = [rest] if rest else []
+        self._size = len(rest)
+        self._held = self._held[max(0, len(self._held) - self._size):]
+        self._fallback = None
+        if segment.strip():
+            segments.append(segment)
+            self.segments += 1
+            if self.segments == 1:
+                self._target = self.min_chars
+            else:
+                self._target = min(self.target_chars, int(self._target * self.growth))
+
+
+class SentenceGapStats:
+    """記錄句子之間的靜音時間（上一句播完到下一句開始播放）"""
+
+    def __init__(self):
+        self.gaps = []
+        self.first_audio_wait = None
+
+    def add(self, gap):
+        self.gaps.append(gap)
+
+    def summary(self):
+        if not self.gaps:
+            return {'count': 0, 'mean_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0,
+                    'first_audio_wait_ms': _ms(self.first_audio_wait)}
+        ordered = sorted(self.gaps)
+        p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+        return {
+            'count': len(ordered),
+            'mean_ms': _ms(sum(ordered) / len(ordered)),
+            'p95_ms': _ms(p95),
+            'max_ms': _ms(ordered[-1]),
+            'first_audio_wait_ms': _ms(self.first_audio_wait),
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class TtsPipeline:
+    """
+    Producer/consumer TTS pipeline.
+
+    The producer thread keeps pulling sentences out of the Bedrock token stream and
+    submits them to Polly, but never more than `max_in_flight` sentences ahead of the one
+    playing, so a barge-in wastes few Polly calls and finished clips don't pile up in
+    memory. The calling thread plays the results strictly in sentence order, so after the
+    first sentence the playback normally never has to wait for the network.
+    """
+
+    def __init__(self, synthesize, play, max_in_flight=3, cancel=None):
+        self.synthesize = synthesize
+        self.play = play
+        self.max_in_flight = max_in_flight
+        self.cancel = cancel
+        self.stats = SentenceGapStats()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _stopped(self):
+        return self._stop.is_set() or (self.cancel is not None and self.cancel.is_cancelled())
+
+    def _result(self, future):
+        # Poll so a cancelled turn does not wait for an in-flight Polly request to finish.
+        while True:
+            try:
+                return future.result(timeout=0.02)
+            except TimeoutError:
+                if self._stopped():
+                    return None
+
+    def _put(self, pending, item):
+        """Waits for room in the bounded queue; gives up once the pipeline is stopped."""
+        while not self._stopped():
+            try:
+                pending.put(item, timeout=0.02)
+                return
+            except queue.Full:
+                pass
+
+    def _produce(self, sentences, executor, pending):
+        try:
+            for sentence in sentences:
+                if self._stopped():
+                    break
+                # 佇列滿了就等前面的句子開始播，才送下一個 Polly 請求（只有這個 thread 會放東西進去）
+                while pending.full():
+                    if self._stopped():
+                        return
+                    time.sleep(0.02)
+                pending.put_nowait(executor.submit(self.synthesize, sentence))
+        except Exception as e:
+            self._put(pending, e)
+        finally:
+            self._put(pending, _END)
+
+    def run(self, sentences):
+        pending = queue.Queue(maxsize=self.max_in_flight)
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='polly')
+        producer = threading.Thread(target=self._produce, args=(sentences, executor, pending), daemon=True)
+
+        started = time.perf_counter()
+        last_played = None
+        producer.start()
+        try:
+            while True:
+                try:
+                    # Poll so a cancelled turn stops without the producer having to get a marker in.
+                    item = pending.get(timeout=0.02)
+                except queue.Empty:
+                    if self._stopped():
+                        break
+                    continue
+                if item is _END or self._stopped():
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                audio = self._result(item)
+                if audio is None:
+                    break
+                now = time.perf_counter()
+                if last_played is None:
+                    self.stats.first_audio_wait = now - started
+                else:
+                    self.stats.add(now - last_played)
+
+                self.play(audio)
+                last_played = time.perf_counter()
+        finally:
+            self._stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return self.stats.summary()
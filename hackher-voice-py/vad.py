@@ -0,0 +1,123 @@
+import time
+
+from collections import deque
+
+import numpy as np
+
+
+class VadResult:
+
+    def __init__(self, speech, events, frame_db):
+        self.speech = speech        # the block contains speech (or is inside the hangover)
+        self.events = events        # list of ('start' | 'end', stream time in seconds)
+        self.frame_db = frame_db
+
+
+class EnergyVad:
+    """
+    Frame-level energy VAD for 16 kHz int16 PCM.
+
+    Frame energies are computed for a whole capture block at once with NumPy. Speech starts
+    after `start_ms` of voiced frames and ends after `hangover_ms` of unvoiced frames. The
+    threshold follows an adaptive noise floor, but never drops below `min_threshold_db`.
+    The floor is also kept at or above the quietest frame of the last `noise_window_ms`
+    (minimum statistics): speech always has pauses, so noise that gets louder than the
+    threshold (a fan switched on) is learned instead of being taken for endless speech.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, hangover_ms=600, start_ms=60,
+                 min_threshold_db=-50.0, margin_db=12.0, noise_window_ms=5000):
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.frame_seconds = frame_ms / 1000
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.min_threshold_db = min_threshold_db
+        self.margin_db = margin_db
+
+        self.noise_db = min_threshold_db - margin_db
+        self.in_speech = False
+        self._voiced_run = 0
+        self._unvoiced_run = 0
+        self._frames = 0
+        self._recent_db = deque(maxlen=max(1, noise_window_ms // frame_ms))
+        self._tail = np.zeros(0, dtype=np.int16)
+
+    def frame_energies(self, samples):
+        n = len(samples) // self.frame_len
+        frames = samples[:n * self.frame_len].reshape(n, self.frame_len).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1)) / 32768.0
+        return 20.0 * np.log10(np.maximum(rms, 1e-6))
+
+    def process(self, pcm, extra_db=0.0):
+        """`extra_db` raises the threshold for this block, e.g. while our own speech may echo back."""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if len(self._tail):
+            samples = np.concatenate((self._tail, samples))
+        usable = len(samples) // self.frame_len * self.frame_len
+        self._tail = samples[usable:].copy()
+
+        frame_db = self.frame_energies(samples[:usable])
+        threshold = max(self.min_threshold_db, self.noise_db + self.margin_db) + extra_db
+        voiced = frame_db > threshold
+
+        events = []
+        speech = self.in_speech
+        for i, is_voiced in enumerate(voiced):
+            self._frames += 1
+            if is_voiced:
+                self._voiced_run += 1
+                self._unvoiced_run = 0
+                if not self.in_speech and self._voiced_run >= self.start_frames:
+                    self.in_speech = True
+                    events.append(('start', self._frames * self.frame_seconds))
+            else:
+                self._voiced_run = 0
+                self._unvoiced_run += 1
+                if self.in_speech and self._unvoiced_run >= self.hangover_frames:
+                    self.in_speech = False
+                    events.append(('end', self._frames * self.frame_seconds))
+            speech = speech or self.in_speech
+
+        # Track the noise floor on frames that are clearly not speech.
+        quiet = frame_db[~voiced]
+        if len(quiet) and not self.in_speech and not extra_db:
+            self.noise_db = 0.95 * self.noise_db + 0.05 * float(np.median(quiet))
+        self._recent_db.extend(frame_db.tolist())
+        if len(self._recent_db) == self._recent_db.maxlen and not extra_db:
+            self.noise_db = max(self.noise_db, min(self._recent_db))
+
+        return VadResult(speech, events, frame_db)
+
+
+class SilenceGate:
+    """
+    Decides which capture blocks are sent to Transcribe. Silent blocks are dropped, but the
+    block before speech starts is kept as pre-roll, and a short silent keepalive is sent every
+    `keepalive_s` seconds so Transcribe does not time out the stream.
+    """
+
+    def __init__(self, keepalive_s=5.0, keepalive_bytes=640):
+        self.keepalive_s = keepalive_s
+        self._keepalive = bytes(keepalive_bytes)
+        self._previous = None
+        self._last_sent = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_sent = 0
+
+    def filter(self, chunk, vad_result):
+        self.bytes_in += len(chunk)
+        out = []
+        if vad_result.speech:
+            if self._previous is not None:
+                out.append(self._previous)
+                self._previous = None
+            out.append(chunk)
+        else:
+            self._previous = chunk
+            if time.monotonic() - self._last_sent >= self.keepalive_s:
+                out.append(self._keepalive)
+
+        if out:
+            self._last_sent = time.monotonic()
+            self.bytes_sent += sum(len(c) for c in out)
+        return out
@@ -0,0 +1,317 @@
+import struct
+import time
+
+from collections import deque
+
+# Matroska / WebM element IDs we care about.
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+CLUSTER = 0x1F43B675
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+BIT_DEPTH = 0x6264
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+SIMPLE_BLOCK = 0xA3
+
+# Masters are entered (their children are parsed as they stream in); everything
+# else is a leaf that we either read or skip.
+_MASTERS = {SEGMENT, CLUSTER, TRACKS, TRACK_ENTRY, AUDIO, BLOCK_GROUP}
+_LEAVES = {TRACK_NUMBER, CODEC_ID, CODEC_PRIVATE, SAMPLING_FREQUENCY, CHANNELS, BIT_DEPTH, BLOCK, SIMPLE_BLOCK}
+
+
+class NeedMoreData(Exception):
+    pass
+
+
+def _read_vint(view, pos, keep_marker):
+    if pos >= len(view):
+        raise NeedMoreData
+    first = view[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise ValueError('Invalid EBML variable-length integer')
+    if pos + length > len(view):
+        raise NeedMoreData
+    value = first if keep_marker else first & (mask - 1)
+    for b in view[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _uint(view):
+    value = 0
+    for b in view:
+        value = (value << 8) | b
+    return value
+
+
+def _float(view):
+    return struct.unpack('>f' if len(view) == 4 else '>d', view)[0]
+
+
+class WebmDemuxer:
+    """
+    Incremental WebM demuxer. `feed` accepts chunks split at arbitrary byte boundaries and
+    returns the audio frames completed so far as memoryview slices (no copies of the
+    payload). Only the incomplete tail of a chunk is carried over to the next call.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+        self._track = None
+        self._pending = b''
+        self._skip = 0
+
+    def feed(self, chunk):
+        data = self._pending + bytes(chunk) if self._pending else bytes(chunk)
+        view = memoryview(data)
+        pos = 0
+        frames = []
+
+        if self._skip:
+            skipped = min(self._skip, len(view))
+            self._skip -= skipped
+            pos = skipped
+
+        while pos < len(view):
+            try:
+                element_id, id_len, _ = _read_vint(view, pos, keep_marker=True)
+                size, size_len, unknown = _read_vint(view, pos + id_len, keep_marker=False)
+            except NeedMoreData:
+                break
+            header = id_len + size_len
+
+            if element_id in _MASTERS:
+                if element_id == TRACK_ENTRY:
+                    self._track = {}
+                pos += header
+                continue
+
+            if unknown:
+                raise ValueError(f'Unknown-size leaf element 0x{element_id:X}')
+
+            if element_id not in _LEAVES:
+                # Skip without buffering (Cues, Tags, Void, ...), even across chunks.
+                available = len(view) - pos - header
+                if available < 0:
+                    break
+                if size > available:
+                    self._skip = size - available
+                    pos = len(view)
+                    break
+                pos += header + size
+                continue
+
+            end = pos + header + size
+            if end > len(view):
+                break
+            payload = view[pos + header:end]
+            pos = end
+
+            if element_id in (SIMPLE_BLOCK, BLOCK):
+                self._read_block(payload, frames)
+            else:
+                self._read_track_field(element_id, payload)
+
+        self._pending = bytes(view[pos:]) if pos < len(view) else b''
+        return frames
+
+    def _read_track_field(self, element_id, payload):
+        track = self._track if self._track is not None else {}
+        if element_id == TRACK_NUMBER:
+            self.tracks[_uint(payload)] = track
+        elif element_id == CODEC_ID:
+            track['codec'] = bytes(payload).decode('ascii').rstrip('\x00')
+        elif element_id == CODEC_PRIVATE:
+            track['codec_private'] = bytes(payload)
+        elif element_id == SAMPLING_FREQUENCY:
+            track['rate'] = int(_float(payload))
+        elif element_id == CHANNELS:
+            track['channels'] = _uint(payload)
+        elif element_id == BIT_DEPTH:
+            track['bit_depth'] = _uint(payload)
+
+    def _read_block(self, payload, frames):
+        track_number, n, _ = _read_vint(payload, 0, keep_marker=False)
+        flags = payload[n + 2]
+        body = payload[n + 3:]
+        lacing = (flags >> 1) & 0x03
+        if lacing == 0:
+            frames.append((track_number, body))
+            return
+
+        count = body[0] + 1
+        pos = 1
+        sizes = []
+        if lacing == 1:  # Xiph
+            for _ in range(count - 1):
+                size = 0
+                while True:
+                    b = body[pos]
+                    pos += 1
+                    size += b
+                    if b != 255:
+                        break
+                sizes.append(size)
+        elif lacing == 3:  # EBML
+            size, length, _ = _read_vint(body, pos, keep_marker=False)
+            pos += length
+            sizes.append(size)
+            for _ in range(count - 2):
+                raw, length, _ = _read_vint(body, pos, keep_marker=False)
+                pos += length
+                size += raw - ((1 << (7 * length - 1)) - 1)
+                sizes.append(size)
+        else:  # fixed
+            sizes = [(len(body) - 1) // count] * (count - 1)
+        sizes.append(len(body) - pos - sum(sizes))
+
+        for size in sizes:
+            frames.append((track_number, body[pos:pos + size]))
+            pos += size
+
+
+class FrameChunker:
+    """把任意長度的 PCM 切成固定大小的 frame；對齊的部分直接以 memoryview 傳出"""
+
+    def __init__(self, frame_bytes):
+        self.frame_bytes = frame_bytes
+        self._carry = bytearray(frame_bytes)
+        self._fill = 0
+
+    def feed(self, data):
+        view = memoryview(data)
+        frames = []
+        if self._fill:
+            take = min(self.frame_bytes - self._fill, len(view))
+            self._carry[self._fill:self._fill + take] = view[:take]
+            self._fill += take
+            view = view[take:]
+            if self._fill == self.frame_bytes:
+                frames.append(bytes(self._carry))
+                self._fill = 0
+        while len(view) >= self.frame_bytes:
+            frames.append(view[:self.frame_bytes])
+            view = view[self.frame_bytes:]
+        if len(view):
+            self._carry[:len(view)] = view
+            self._fill = len(view)
+        return frames
+
+    def flush(self):
+        if not self._fill:
+            return []
+        frame = bytes(self._carry[:self._fill])
+        self._fill = 0
+        return [frame]
+
+
+def _samples(frame):
+    # Plane buffers are padded for alignment; only the first `samples` int16 values are audio.
+    return memoryview(frame.planes[0])[:frame.samples * 2]
+
+
+class WebmPcmDecoder:
+    """
+    Streaming `audio/webm` -> 16 kHz mono int16 PCM frames for Transcribe.
+
+    Opus tracks are decoded with PyAV; PCM tracks (Chrome's `audio/webm;codecs=pcm`) are
+    converted directly. A stateful resampler keeps the output continuous across chunks.
+    Decode time is recorded per incoming chunk.
+    """
+
+    def __init__(self, rate=16000, frame_ms=100):
+        self.rate = rate
+        self.demuxer = WebmDemuxer()
+        self.chunker = FrameChunker(rate * 2 * frame_ms // 1000)
+        self.decode_times = deque(maxlen=1000)
+        self._codec = None
+        self._resampler = None
+        self._track = None
+
+    def _open(self, track_number):
+        import av
+
+        track = self.demuxer.tracks.get(track_number, {})
+        self._track = track
+        codec = track.get('codec', 'A_OPUS')
+        if codec == 'A_OPUS':
+            self._codec = av.CodecContext.create('opus', 'r')
+            if track.get('codec_private'):
+                self._codec.extradata = track['codec_private']
+        elif not codec.startswith('A_PCM/'):
+            raise ValueError(f'Unsupported WebM audio codec: {codec}')
+        self._resampler = av.AudioResampler(format='s16', layout='mono', rate=self.rate)
+
+    def _pcm_frame(self, payload):
+        import av
+        import numpy as np
+
+        track = self._track
+        codec = track.get('codec')
+        channels = track.get('channels', 1)
+        if codec == 'A_PCM/FLOAT/IEEE':
+            samples = np.frombuffer(payload, dtype='<f4' if track.get('bit_depth', 32) == 32 else '<f8')
+            fmt = 'flt'
+        else:
+            samples = np.frombuffer(payload, dtype={16: '<i2', 32: '<i4'}[track.get('bit_depth', 16)])
+            fmt = 's16' if samples.dtype.itemsize == 2 else 's32'
+        layout = 'mono' if channels == 1 else 'stereo'
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format=fmt, layout=layout)
+        frame.sample_rate = track.get('rate', 48000)
+        return [frame]
+
+    def _decode(self, track_number, payload):
+        import av
+
+        if self._resampler is None:
+            self._open(track_number)
+        if self._codec is not None:
+            decoded = self._codec.decode(av.Packet(payload))
+        else:
+            decoded = self._pcm_frame(payload)
+
+        out = []
+        for frame in decoded:
+            for resampled in self._resampler.resample(frame):
+                out.extend(self.chunker.feed(_samples(resampled)))
+        return out
+
+    def feed(self, chunk):
+        started = time.perf_counter()
+        frames = []
+        for track_number, payload in self.demuxer.feed(chunk):
+            frames.extend(self._decode(track_number, payload))
+        self.decode_times.append(time.perf_counter() - started)
+        return frames
+
+    def flush(self):
+        frames = []
+        if self._resampler is not None:
+            for resampled in self._resampler.resample(None):
+                frames.extend(self.chunker.feed(_samples(resampled)))
+        frames.extend(self.chunker.flush())
+        return frames
+
+    def stats(self):
+        if not self.decode_times:
+            return {'chunks': 0}
+        ordered = sorted(self.decode_times)
+        return {
+            'chunks': len(ordered),
+            'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+            'p95_ms': round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+        }
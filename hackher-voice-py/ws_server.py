@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+
+
+class PassthroughDecoder:
+    """瀏覽器直接送 16 kHz int16 PCM 時使用"""
+
+    def feed(self, chunk):
+        return [chunk] if chunk else []
+
+    def flush(self):
+        return []
+
+
+def _default_transcribe_client(region):
+    from aws_clients import get_client_factory
+    return get_client_factory(region).transcribe_streaming()
+
+
+class BrowserSession:
+    """
+    One browser connection: its own Transcribe stream, a bounded audio queue into it and a
+    bounded outbound queue of transcript messages. The WebSocket thread calls `feed` and
+    polls `outbound`; everything else runs on the hub's event loop.
+    """
+
+    def __init__(self, hub, session_id, decoder, max_audio_chunks=32, max_outbound=64):
+        self.hub = hub
+        self.session_id = session_id
+        self.decoder = decoder
+        self.outbound = queue.Queue(maxsize=max_outbound)
+        self.dropped_audio = 0
+        self.dropped_messages = 0
+        self._audio = asyncio.Queue(maxsize=max_audio_chunks)
+        self._done = threading.Event()
+
+    def feed(self, chunk):
+        for frame in self.decoder.feed(chunk):
+            self.hub.loop.call_soon_threadsafe(self._put_audio, frame)
+
+    def close(self):
+        for frame in self.decoder.flush():
+            self.hub.loop.call_soon_threadsafe(self._put_audio, frame)
+        self.hub.loop.call_soon_threadsafe(self._put_audio, None)
+
+    def _put_audio(self, frame):
+        if self._audio.full():
+            # Drop the oldest audio rather than let a slow Transcribe stream grow memory;
+            # the end-of-stream marker must always get in, or the session never closes.
+            self._audio.get_nowait()
+            self.dropped_audio += 1
+        self._audio.put_nowait(frame)
+
+    def _send(self, message):
+        data = json.dumps(message, ensure_ascii=False)
+        try:
+            self.outbound.put_nowait(data)
+        except queue.Full:
+            self.outbound.get_nowait()
+            self.dropped_messages += 1
+            self.outbound.put_nowait(data)
+
+    async def run(self):
+        try:
+            stream = await self.hub.client.start_stream_transcription(
+                language_code=self.hub.language_code,
+                media_sample_rate_hz=self.hub.sample_rate,
+                media_encoding='pcm',
+            )
+            await asyncio.gather(self._write_audio(stream), self._read_transcripts(stream))
+        except Exception as e:
+            self._send({'type': 'error', 'message': str(e)})
+        finally:
+            self._done.set()
+            self.hub.sessions.pop(self.session_id, None)
+
+    async def _write_audio(self, stream):
+        while True:
+            frame = await self._audio.get()
+            if frame is None:
+                break
+            # Frames may be memoryview slices of the decoder output; copy once at the network boundary.
+            await stream.input_stream.send_audio_event(audio_chunk=bytes(frame))
+        await stream.input_stream.end_stream()
+
+    async def _read_transcripts(self, stream):
+        async for event in stream.output_stream:
+            results = getattr(getattr(event, 'transcript', None), 'results', None)
+            for result in results or []:
+                if not result.alternatives:
+                    continue
+                self._send({
+                    'type': 'partial' if result.is_partial else 'final',
+                    'text': result.alternatives[0].transcript,
+                })
+
+    def wait_closed(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class TranscribeHub:
+    """
+    Multiplexes every browser session onto a single asyncio loop running in a
+    background thread, so one process serves many concurrent Transcribe streams.
+    """
+
+    def __init__(self, client=None, region='us-west-2', language_code='zh-TW', sample_rate=16000,
+                 decoder_factory=PassthroughDecoder):
+        self.client = client or _default_transcribe_client(region)
+        self.language_code = language_code
+        self.sample_rate = sample_rate
+        self.decoder_factory = decoder_factory
+        self.sessions = {}
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='transcribe-hub', daemon=True).start()
+
+    def open_session(self):
+        with self._id_lock:
+            self._next_id += 1
+            session_id = self._next_id
+        session = BrowserSession(self, session_id, self.decoder_factory())
+        self.sessions[session_id] = session
+        asyncio.run_coroutine_threadsafe(session.run(), self.loop)
+        return session
+
+
+def create_app(hub):
+    from flask import Flask
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+
+    app = Flask(__name__, static_folder='frontend', static_url_path='')
+    sock = Sock(app)
+
+    @app.route('/')
+    def index():
+        return app.send_static_file('index.html')
+
+    @sock.route('/ws')
+    def ws(ws):
+        session = hub.open_session()
+        try:
+            while ws.connected:
+                data = ws.receive(timeout=0.02)
+                if isinstance(data, (bytes, bytearray)):
+                    session.feed(data)
+                while True:
+                    try:
+                        ws.send(session.outbound.get_nowait())
+                    except queue.Empty:
+                        break
+        except ConnectionClosed:
+            pass
+        finally:
+            session.close()
+
+    return app
+
+
+if __name__ == '__main__':
+    from webm_decoder import WebmPcmDecoder
+
+    # recorder.js sends audio/webm chunks; decode them to 16 kHz PCM before Transcribe.
+    hub = TranscribeHub(region=os.getenv('AWS_REGION', 'us-west-2'), decoder_factory=WebmPcmDecoder)
+    create_app(hub).run(host='0.0.0.0', port=int(os.getenv('PORT', '5050')), threaded=True)